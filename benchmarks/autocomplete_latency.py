@@ -0,0 +1,120 @@
+"""
+Build time, memory and lookup latency of the autocomplete index.
+
+    python -m benchmarks.autocomplete_latency --products 100000 --queries 5000
+
+The catalog is synthetic and held in memory (no database): product names
+of two to five words drawn with a Zipf skew from a --vocabulary of made-up
+words, a few hundred categories, and SKUs made of a code per category and
+a number, as catalogs usually number them. Queries are prefixes of 1 to 6
+letters of real name words, the same with one letter swapped, and
+two-word queries. Lookups run with the result memo cleared, so every one
+walks the trie.
+"""
+import argparse
+import os
+import random
+import string
+import sys
+import time
+import tracemalloc
+from pathlib import Path
+
+BASE_DIR = Path(__file__).resolve().parent.parent
+
+
+def setup_django():
+    os.environ['DJANGO_SETTINGS_MODULE'] = 'benchmarks.settings'
+    sys.path.insert(0, str(BASE_DIR))
+    import django
+    django.setup()
+
+
+def make_rows(products, vocabulary, rng):
+    syllables = [a + b for a in 'bcdfghklmnprstvz' for b in 'aeiou']
+    words = list({''.join(rng.choice(syllables) for _ in range(rng.randint(2, 4)))
+                  for _ in range(vocabulary)})
+    weights = [1 / (rank + 1) for rank in range(len(words))]
+    categories = [' '.join(rng.sample(words[:2000], 2)).title() for _ in range(300)]
+    codes = [''.join(rng.choices(string.ascii_uppercase, k=3)) for _ in categories]
+    rows = []
+    for pk in range(1, products + 1):
+        name = ' '.join(rng.choices(words, weights, k=rng.randint(2, 5))).title()
+        category_id = rng.randrange(len(categories))
+        sku = f'{codes[category_id]}-{pk:06d}'
+        rows.append((pk, name, f'product-{pk}', sku, category_id, categories[category_id],
+                     rng.expovariate(1) * 10))
+    return rows
+
+
+def make_queries(rows, count, rng):
+    queries = []
+    for _ in range(count):
+        words = rows[rng.randrange(len(rows))][1].lower().split()
+        word = rng.choice(words)
+        kind = rng.random()
+        if kind < 0.5:
+            queries.append(('prefix', word[:rng.randint(1, 6)]))
+        elif kind < 0.8 and len(word) >= 5:
+            i = rng.randrange(1, len(word) - 1)
+            queries.append(('typo', word[:i] + rng.choice(string.ascii_lowercase) + word[i + 1:]))
+        else:
+            other = rng.choice(words)
+            queries.append(('two words', f'{other} {word[:rng.randint(2, 5)]}'))
+    return queries
+
+
+def percentile(values, fraction):
+    values = sorted(values)
+    return values[min(len(values) - 1, int(len(values) * fraction))]
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--products', type=int, default=100000)
+    parser.add_argument('--vocabulary', type=int, default=20000)
+    parser.add_argument('--queries', type=int, default=5000)
+    parser.add_argument('--seed', type=int, default=1)
+    args = parser.parse_args(argv)
+
+    setup_django()
+    from products.autocomplete import Index
+
+    rng = random.Random(args.seed)
+    rows = make_rows(args.products, args.vocabulary, rng)
+    queries = make_queries(rows, args.queries, rng)
+
+    start = time.perf_counter()
+    index = Index()
+    index.build(rows)
+    build_seconds = time.perf_counter() - start
+    # A second build under tracemalloc, which slows it down several times
+    tracemalloc.start()
+    traced = Index()
+    traced.build(rows)
+    memory = tracemalloc.get_traced_memory()[0]
+    tracemalloc.stop()
+    del traced
+
+    start = time.perf_counter()
+    index.load(rows[:100])
+    update_ms = (time.perf_counter() - start) * 1000 / 100
+
+    timings = {}
+    for kind, query in queries:
+        index.memo.clear()
+        start = time.perf_counter()
+        index.search(query)
+        timings.setdefault(kind, []).append((time.perf_counter() - start) * 1e6)
+
+    print(f"{args.products} products: built in {build_seconds:.1f}s, "
+          f"{memory / 2 ** 20:.0f} MiB, {update_ms:.2f}ms per product update\n")
+    print(f"{'query':<10} {'count':>6} {'p50 us':>8} {'p99 us':>8} {'max us':>8}")
+    for kind, values in timings.items():
+        print(f"{kind:<10} {len(values):>6} {percentile(values, 0.5):>8.0f} "
+              f"{percentile(values, 0.99):>8.0f} {max(values):>8.0f}")
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,174 @@
+"""
+Query plans and timings of the catalog's hot queries before and after an
+index migration, on a large seeded catalog.
+
+    python -m benchmarks.index_plans --products 20000 --baseline 0005_change_log
+
+The catalog is seeded once at the latest schema. The products app is then
+migrated back to --baseline, measured, migrated forward and measured
+again. Both sides are ANALYZEd first (--no-analyze to see the planner
+without statistics). Prints per query the median time of its SQL on each
+side and whether its plan changed; --plans prints the changed plans.
+"""
+import argparse
+import os
+import statistics
+import sys
+import time
+from pathlib import Path
+
+BASE_DIR = Path(__file__).resolve().parent.parent
+WORK_DIR = Path(__file__).resolve().parent
+
+
+def setup_django(db_path):
+    os.environ['DJANGO_SETTINGS_MODULE'] = 'benchmarks.settings'
+    os.environ['BENCH_DB'] = str(db_path)
+    sys.path.insert(0, str(BASE_DIR))
+    import django
+    django.setup()
+
+
+def read_queries():
+    """(name, callable) for the listing, filter and review paths of the API"""
+    from django.db.models import F
+    from products.models import Product, ProductReview
+
+    def page(queryset, start=0, size=20):
+        # The listing's own query; its prefetches look up ids and don't vary
+        return lambda: list(queryset.for_catalog().prefetch_related(None)[start:start + size])
+
+    published = Product.objects.published()
+    category = published.filter(category__slug='subcategory-3')
+    return [
+        ('newest', page(published)),
+        ('newest, page 50', page(published, start=980)),
+        ('count', published.count),
+        ('by price', page(published.order_by('price'))),
+        ('price range', page(published.filter(price__gte=100, price__lte=200).order_by('price'))),
+        ('category', page(category)),
+        ('category count', category.count),
+        ('featured', page(published.filter(featured=True), size=10)),
+        ('in stock', page(published.filter(quantity__gt=0))),
+        ('on sale', page(published.filter(compare_price__gt=F('price')))),
+        ('popular', page(published.order_by('-popularity'))),
+        ('reviews', lambda: list(ProductReview.objects.filter(
+            product__slug='product-100', is_approved=True,
+        ).select_related('user').order_by('-created_at')[:20])),
+    ]
+
+
+def write_queries(products):
+    """(name, callable) for batch writes"""
+    from django.db.models import F
+    from products.models import Category, Product
+
+    category = Category.objects.order_by('id').first()
+    ids = list(Product.objects.order_by('id').values_list('id', flat=True)[:products])
+
+    def insert():
+        Product.objects.bulk_create([
+            Product(name=f'Index bench {i}', slug=f'index-bench-{i}', description='x',
+                    price=i % 500 + 1, sku=f'IDX-{i:08d}', quantity=i % 7,
+                    category=category, status='published')
+            for i in range(products)
+        ])
+
+    def update():
+        Product.objects.filter(id__in=ids).update(quantity=F('quantity') + 1, price=F('price') + 1)
+
+    return [(f'insert {products}', insert), (f'update {products}', update)]
+
+
+def measure(queries, repeat):
+    """
+    {name: (median ms, [plan lines of every statement])}. Each query runs
+    once through the ORM; the SQL it ran is then replayed `repeat` times, in
+    a transaction that is rolled back, so building model instances and
+    changes made by earlier runs stay out of the timings.
+    """
+    from django.db import connection, transaction
+    from django.test.utils import CaptureQueriesContext
+    from ecommerce.testing import EXPLAINED, explain
+
+    results = {}
+    for name, run in queries:
+        with transaction.atomic():
+            with CaptureQueriesContext(connection) as captured:
+                run()
+            transaction.set_rollback(True)
+        statements = [query['sql'] for query in captured
+                      if not query['sql'].startswith(('SAVEPOINT', 'RELEASE SAVEPOINT'))]
+        timings = []
+        for _ in range(repeat):
+            with transaction.atomic(), connection.cursor() as cursor:
+                start = time.perf_counter()
+                for sql in statements:
+                    cursor.execute(sql)
+                    cursor.fetchall()
+                timings.append(time.perf_counter() - start)
+                transaction.set_rollback(True)
+        plans = [line for sql in statements if sql.lstrip().upper().startswith(EXPLAINED)
+                 for line in explain(sql)]
+        results[name] = (statistics.median(timings) * 1000, plans)
+    return results
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--products', type=int, default=20000)
+    parser.add_argument('--baseline', default='0005_change_log',
+                        help='products migration to compare the latest schema against')
+    parser.add_argument('--repeat', type=int, default=30)
+    parser.add_argument('--writes', type=int, default=1000, help='rows per write batch')
+    parser.add_argument('--no-analyze', action='store_true')
+    parser.add_argument('--plans', action='store_true', help='print the plans that changed')
+    args = parser.parse_args(argv)
+
+    db_path = WORK_DIR / 'index-plans.sqlite3'
+    for suffix in ('', '-wal', '-shm'):
+        Path(f'{db_path}{suffix}').unlink(missing_ok=True)
+    setup_django(db_path)
+    from django.core.management import call_command
+    from django.db import connection
+    from benchmarks.seed import seed_catalog
+
+    call_command('migrate', verbosity=0)
+    seed_catalog(products=args.products)
+
+    sides = {}
+    for side, target in (('before', args.baseline), ('after', None)):
+        if target:
+            call_command('migrate', 'products', target, verbosity=0)
+        else:
+            call_command('migrate', 'products', verbosity=0)
+        with connection.cursor() as cursor:
+            # Statistics of the previous side's indexes would mislead the planner
+            cursor.execute('DROP TABLE IF EXISTS sqlite_stat1')
+            if not args.no_analyze:
+                cursor.execute('ANALYZE')
+        sides[side] = {
+            **measure(read_queries(), args.repeat),
+            **measure(write_queries(args.writes), args.repeat),
+        }
+
+    print(f"{args.products} products, products {args.baseline} -> latest, "
+          f"{'no statistics' if args.no_analyze else 'ANALYZEd'}, median of {args.repeat}\n")
+    print(f"{'query':<18} {'before ms':>10} {'after ms':>10} {'speedup':>8}  plan")
+    for name, (before_ms, before_plan) in sides['before'].items():
+        after_ms, after_plan = sides['after'][name]
+        print(f"{name:<18} {before_ms:>10.2f} {after_ms:>10.2f} {before_ms / after_ms:>7.1f}x  "
+              f"{'changed' if before_plan != after_plan else 'same'}")
+    if args.plans:
+        for name, (_, before_plan) in sides['before'].items():
+            after_plan = sides['after'][name][1]
+            if before_plan != after_plan:
+                print(f"\n{name}\n  before:")
+                print('\n'.join(f'    {line}' for line in before_plan))
+                print('  after:')
+                print('\n'.join(f'    {line}' for line in after_plan))
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,27 @@
+from django.db import connections
+
+
+class QueryCountMiddleware:
+    """Adds an X-Query-Count header with the number of SQL statements a request ran"""
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+
+    def __call__(self, request):
+        count = 0
+
+        def counter(execute, sql, params, many, context):
+            nonlocal count
+            count += 1
+            return execute(sql, params, many, context)
+
+        wrappers = [conn.execute_wrapper(counter) for conn in connections.all()]
+        for wrapper in wrappers:
+            wrapper.__enter__()
+        try:
+            response = self.get_response(request)
+        finally:
+            for wrapper in reversed(wrappers):
+                wrapper.__exit__(None, None, None)
+        response['X-Query-Count'] = str(count)
+        return response
@@ -0,0 +1,321 @@
+"""
+Replay the Postman collection's read and login requests against a local
+server with concurrent clients and compare the results to a baseline.
+
+    python -m benchmarks.run --products 2000 --clients 8 --duration 120
+    python -m benchmarks.run --save-baseline      # record a new baseline
+
+Exits with status 1 when any endpoint regresses past the tolerances, or
+when it got fewer than --min-samples requests: a p95 of a handful of
+requests can't tell a regression from noise.
+"""
+import argparse
+import json
+import os
+import socket
+import statistics
+import subprocess
+import sys
+import threading
+import time
+import urllib.error
+import urllib.request
+from collections import defaultdict
+from pathlib import Path
+
+BASE_DIR = Path(__file__).resolve().parent.parent
+COLLECTION = BASE_DIR / 'E-Commerce-Backend.postman_collection.json'
+BASELINE = Path(__file__).resolve().parent / 'baseline.json'
+
+# Collection folders whose GET requests are replayed, plus the login request
+READ_FOLDERS = (
+    '2. Categories (Admin)',
+    '3. Products',
+    '4. Product Filtering & Searching',
+    '5. Product Reviews',
+)
+EXTRA_REQUESTS = ('User Login',)
+
+
+def load_scenarios(variables):
+    """Flatten the collection into (name, method, url, body) tuples"""
+    collection = json.loads(COLLECTION.read_text())
+    scenarios = []
+
+    def substitute(text):
+        for key, value in variables.items():
+            text = text.replace('{{%s}}' % key, value)
+        return text
+
+    def walk(items, folder=None):
+        for item in items:
+            if 'item' in item:
+                walk(item['item'], item['name'])
+                continue
+            request = item['request']
+            wanted = (
+                (folder in READ_FOLDERS and request['method'] == 'GET')
+                or item['name'] in EXTRA_REQUESTS
+            )
+            if not wanted:
+                continue
+            body = (request.get('body') or {}).get('raw')
+            scenarios.append((
+                item['name'],
+                request['method'],
+                substitute(request['url']['raw']),
+                substitute(body).encode() if body else None,
+            ))
+
+    walk(collection['item'])
+    return scenarios
+
+
+def free_port():
+    with socket.socket() as sock:
+        sock.bind(('127.0.0.1', 0))
+        return sock.getsockname()[1]
+
+
+def start_server(port, env):
+    server = subprocess.Popen(
+        [sys.executable, 'manage.py', 'runserver', f'127.0.0.1:{port}',
+         '--noreload'],
+        cwd=BASE_DIR, env=env,
+        stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL,
+    )
+    deadline = time.time() + 30
+    while time.time() < deadline:
+        try:
+            with socket.create_connection(('127.0.0.1', port), timeout=0.5):
+                return server
+        except OSError:
+            time.sleep(0.2)
+    server.kill()
+    raise RuntimeError('Benchmark server did not start')
+
+
+def peak_rss_mb(pid):
+    """Peak resident memory of the server process (Linux only)"""
+    try:
+        for line in Path(f'/proc/{pid}/status').read_text().splitlines():
+            if line.startswith('VmHWM:'):
+                return round(int(line.split()[1]) / 1024, 1)
+    except OSError:
+        pass
+    return None
+
+
+def send(method, url, body):
+    request = urllib.request.Request(url, data=body, method=method)
+    if body:
+        request.add_header('Content-Type', 'application/json')
+    start = time.perf_counter()
+    try:
+        with urllib.request.urlopen(request, timeout=30) as response:
+            response.read()
+            status, headers = response.status, response.headers
+    except urllib.error.HTTPError as error:
+        error.read()
+        status, headers = error.code, error.headers
+    elapsed = time.perf_counter() - start
+    return status, elapsed, int(headers.get('X-Query-Count', 0))
+
+
+def run_load(scenarios, clients, duration):
+    samples = defaultdict(list)
+    errors = defaultdict(int)
+    lock = threading.Lock()
+    stop_at = time.time() + duration
+
+    def client(offset):
+        i = offset
+        while time.time() < stop_at:
+            name, method, url, body = scenarios[i % len(scenarios)]
+            i += 1
+            status, elapsed, queries = send(method, url, body)
+            with lock:
+                if status >= 400:
+                    errors[name] += 1
+                else:
+                    samples[name].append((elapsed, queries))
+
+    threads = [threading.Thread(target=client, args=(n,)) for n in range(clients)]
+    started = time.time()
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    return samples, errors, time.time() - started
+
+
+def percentile(values, pct):
+    ordered = sorted(values)
+    index = min(len(ordered) - 1, max(0, round(pct / 100 * len(ordered)) - 1))
+    return ordered[index]
+
+
+def summarize(samples, errors, wall):
+    endpoints = {}
+    for name, rows in samples.items():
+        latencies = [elapsed * 1000 for elapsed, _ in rows]
+        endpoints[name] = {
+            'requests': len(rows),
+            'errors': errors.get(name, 0),
+            'rps': round(len(rows) / wall, 1),
+            'p50_ms': round(percentile(latencies, 50), 2),
+            'p95_ms': round(percentile(latencies, 95), 2),
+            'p99_ms': round(percentile(latencies, 99), 2),
+            'queries': round(statistics.mean(q for _, q in rows), 1),
+        }
+    for name, count in errors.items():
+        endpoints.setdefault(name, {'requests': 0, 'errors': count})
+    total = sum(len(rows) for rows in samples.values())
+    return {'total_rps': round(total / wall, 1), 'endpoints': endpoints}
+
+
+def too_few_samples(results, min_samples):
+    """Endpoints measured fewer than `min_samples` times, as messages"""
+    return [f"{name}: only {row.get('requests', 0)} samples (need {min_samples})"
+            for name, row in sorted(results['endpoints'].items())
+            if row.get('requests', 0) < min_samples]
+
+
+def compare(results, baseline, latency_tolerance, rps_tolerance, min_samples=0):
+    """Return a list of human-readable regressions"""
+    problems = [f'baseline {problem}; re-record it'
+                for problem in too_few_samples(baseline, min_samples)]
+    base_rps = baseline.get('total_rps')
+    if base_rps and results['total_rps'] < base_rps * (1 - rps_tolerance):
+        problems.append(f"total RPS {results['total_rps']} < baseline {base_rps}")
+    for name, base in baseline.get('endpoints', {}).items():
+        current = results['endpoints'].get(name)
+        if current is None or current.get('requests', 0) < min_samples:
+            count = 0 if current is None else current.get('requests', 0)
+            problems.append(f"{name}: only {count} samples (need {min_samples})")
+            continue
+        if current.get('errors'):
+            problems.append(f"{name}: {current['errors']} error responses")
+        # Query counts are deterministic, so any increase is a regression
+        if 'queries' in base and current.get('queries', 0) > base['queries']:
+            problems.append(f"{name}: {current['queries']} queries/request "
+                            f"(baseline {base['queries']})")
+        if 'p95_ms' in base and current.get('p95_ms', 0) > base['p95_ms'] * (1 + latency_tolerance):
+            problems.append(f"{name}: p95 {current['p95_ms']}ms "
+                            f"(baseline {base['p95_ms']}ms)")
+    return problems
+
+
+def print_report(results):
+    print(f"\n{'endpoint':<42} {'reqs':>6} {'rps':>7} {'p50':>8} {'p95':>8} "
+          f"{'p99':>8} {'queries':>8}")
+    for name, row in sorted(results['endpoints'].items()):
+        print(f"{name:<42} {row['requests']:>6} {row.get('rps', 0):>7} "
+              f"{row.get('p50_ms', '-'):>8} {row.get('p95_ms', '-'):>8} "
+              f"{row.get('p99_ms', '-'):>8} {row.get('queries', '-'):>8}")
+    print(f"\ntotal RPS: {results['total_rps']}   "
+          f"server peak RSS: {results.get('peak_rss_mb')} MB")
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--products', type=int, default=2000)
+    parser.add_argument('--categories', type=int, default=20)
+    parser.add_argument('--reviews', type=int, default=5,
+                        help='Reviews per product')
+    parser.add_argument('--images', type=int, default=2,
+                        help='Images per product')
+    parser.add_argument('--clients', type=int, default=8)
+    parser.add_argument('--duration', type=float, default=120.0,
+                        help='Seconds of load after warm-up')
+    parser.add_argument('--min-samples', type=int, default=100,
+                        help='Requests each endpoint needs for its numbers to count')
+    parser.add_argument('--db', type=str,
+                        default=str(BASE_DIR / 'benchmarks' / 'bench.sqlite3'))
+    parser.add_argument('--reseed', action='store_true',
+                        help='Rebuild the synthetic catalog even if it exists')
+    parser.add_argument('--baseline', type=str, default=str(BASELINE))
+    parser.add_argument('--save-baseline', action='store_true')
+    parser.add_argument('--latency-tolerance', type=float, default=0.25,
+                        help='Allowed p95 slowdown as a fraction (default 0.25)')
+    parser.add_argument('--rps-tolerance', type=float, default=0.25,
+                        help='Allowed total RPS drop as a fraction (default 0.25)')
+    parser.add_argument('--json', type=str, default=None,
+                        help='Also write the results to this file')
+    args = parser.parse_args(argv)
+
+    env = dict(os.environ, DJANGO_SETTINGS_MODULE='benchmarks.settings',
+               BENCH_DB=args.db)
+    os.environ.update(env)
+    sys.path.insert(0, str(BASE_DIR))
+
+    import django
+    django.setup()
+    from django.core.management import call_command
+    from products.models import Product
+    from benchmarks.seed import seed_catalog
+
+    call_command('migrate', verbosity=0)
+    if args.reseed or Product.objects.count() != args.products:
+        print(f"Seeding {args.products} products...")
+        print(seed_catalog(products=args.products, categories=args.categories,
+                           reviews_per_product=args.reviews,
+                           images_per_product=args.images))
+
+    port = free_port()
+    scenarios = load_scenarios({
+        'baseUrl': f'http://127.0.0.1:{port}',
+        'productSlug': 'premium-wireless-headphones',
+        'categorySlug': 'electronics',
+    })
+    server = start_server(port, env)
+    try:
+        for _, method, url, body in scenarios:  # warm-up
+            send(method, url, body)
+        samples, errors, wall = run_load(scenarios, args.clients, args.duration)
+        results = summarize(samples, errors, wall)
+        results['peak_rss_mb'] = peak_rss_mb(server.pid)
+    finally:
+        server.terminate()
+        server.wait()
+
+    results['config'] = {
+        'products': args.products, 'clients': args.clients,
+        'duration': args.duration,
+    }
+    print_report(results)
+    if args.json:
+        Path(args.json).write_text(json.dumps(results, indent=2))
+
+    baseline_path = Path(args.baseline)
+    if args.save_baseline:
+        short = too_few_samples(results, args.min_samples)
+        if short:
+            print("\nNot saving a baseline; run longer (--duration):")
+            for problem in short:
+                print(f"  - {problem}")
+            return 1
+        baseline_path.write_text(json.dumps(results, indent=2) + '\n')
+        print(f"Baseline written to {baseline_path}")
+        return 0
+    if not baseline_path.exists():
+        print("No baseline to compare against (use --save-baseline)")
+        return 0
+
+    baseline = json.loads(baseline_path.read_text())
+    if baseline.get('config', {}).get('products') != args.products:
+        print("Baseline was recorded with a different catalog size; "
+              "latency comparison may not be meaningful")
+    problems = compare(results, baseline, args.latency_tolerance, args.rps_tolerance,
+                       args.min_samples)
+    if problems:
+        print("\nREGRESSIONS:")
+        for problem in problems:
+            print(f"  - {problem}")
+        return 1
+    print("\nNo regressions against baseline")
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,102 @@
+"""
+Synthetic catalog for benchmark runs. Includes the fixtures the Postman
+collection refers to (the `electronics` category, the
+`premium-wireless-headphones` product and the john.doe login) so its
+requests resolve against seeded data.
+"""
+import random
+from decimal import Decimal
+
+from django.db import transaction
+
+from products.models import Category, Product, ProductImage, ProductReview
+from users.models import User
+
+BENCH_USER = {'email': 'john.doe@example.com', 'password': 'securepass123'}
+
+WORDS = ('wireless premium smart portable ultra compact classic pro mini max '
+         'headphones watch speaker camera laptop phone charger cable keyboard '
+         'mouse monitor lamp bag bottle jacket shoe chair desk').split()
+
+
+@transaction.atomic
+def seed_catalog(products=2000, categories=20, users=200, reviews_per_product=5,
+                 images_per_product=2, seed=42, batch_size=1000):
+    """Replace the catalog with a deterministic synthetic one"""
+    rng = random.Random(seed)
+
+    ProductReview.objects.all().delete()
+    ProductImage.objects.all().delete()
+    Product.objects.all().delete()
+    Category.objects.all().delete()
+    User.objects.all().delete()
+
+    user = User.objects.create_user(first_name='John', last_name='Doe', **BENCH_USER)
+    # Hash once and reuse it; create_user per row would dominate seeding time
+    password_hash = user.password
+    User.objects.bulk_create([
+        User(email=f'user{i}@example.com', first_name='Bench', last_name=str(i),
+             password=password_hash)
+        for i in range(users - 1)
+    ], batch_size=batch_size)
+    user_ids = list(User.objects.values_list('id', flat=True))
+
+    roots = Category.objects.bulk_create([
+        Category(name='Electronics', slug='electronics'),
+    ] + [
+        Category(name=f'Category {i}', slug=f'category-{i}')
+        for i in range(1, max(1, categories // 4))
+    ])
+    Category.objects.bulk_create([
+        Category(name=f'Subcategory {i}', slug=f'subcategory-{i}',
+                 parent=roots[i % len(roots)])
+        for i in range(categories - len(roots))
+    ])
+    category_ids = list(Category.objects.values_list('id', flat=True))
+
+    rows = [Product(
+        name='Premium Wireless Headphones', slug='premium-wireless-headphones',
+        description='Noise cancelling over-ear headphones', price=Decimal('299.99'),
+        compare_price=Decimal('399.99'), sku='HW-1000-BLK', quantity=50,
+        category=roots[0], status='published', featured=True, created_by=user,
+    )]
+    for i in range(1, products):
+        name = ' '.join(rng.choice(WORDS) for _ in range(3)).title()
+        price = Decimal(rng.randint(500, 100000)) / 100
+        rows.append(Product(
+            name=name, slug=f'product-{i}',
+            description=' '.join(rng.choice(WORDS) for _ in range(30)),
+            price=price,
+            compare_price=price * Decimal('1.25') if rng.random() < 0.2 else None,
+            sku=f'SKU-{i:08d}', quantity=rng.choice([0, 0, 5, 10, 50, 100]),
+            category_id=rng.choice(category_ids),
+            status='published' if rng.random() < 0.9 else 'draft',
+            featured=rng.random() < 0.05, created_by=user,
+        ))
+    Product.objects.bulk_create(rows, batch_size=batch_size)
+    product_ids = list(Product.objects.values_list('id', flat=True))
+
+    ProductImage.objects.bulk_create([
+        ProductImage(product_id=pid, image=f'products/{pid}-{n}.jpg',
+                     alt_text=f'Image {n}', is_default=n == 0)
+        for pid in product_ids for n in range(images_per_product)
+    ], batch_size=batch_size)
+
+    reviews = []
+    for pid in product_ids:
+        for uid in rng.sample(user_ids, min(reviews_per_product, len(user_ids))):
+            review = ProductReview(
+                product_id=pid, user_id=uid, rating=rng.randint(1, 5),
+                title='Review', content=' '.join(rng.choice(WORDS) for _ in range(20)),
+                is_approved=rng.random() < 0.8,
+            )
+            review.moderation_status = 'approved' if review.is_approved else 'pending'
+            reviews.append(review)
+    ProductReview.objects.bulk_create(reviews, batch_size=batch_size)
+
+    return {
+        'products': len(product_ids),
+        'categories': len(category_ids),
+        'users': len(user_ids),
+        'reviews': len(reviews),
+    }
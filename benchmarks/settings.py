@@ -0,0 +1,22 @@
+"""
+Settings for benchmark runs: the project settings pointed at a separate
+SQLite file, with a middleware that reports queries per request.
+"""
+import os
+
+from ecommerce.settings import *  # noqa: F401,F403
+from ecommerce.settings import BASE_DIR, DATABASES, MIDDLEWARE, REST_FRAMEWORK
+
+DATABASES['default']['NAME'] = os.environ.get(
+    'BENCH_DB', str(BASE_DIR / 'benchmarks' / 'bench.sqlite3')
+)
+
+MIDDLEWARE = ['benchmarks.middleware.QueryCountMiddleware'] + MIDDLEWARE
+
+# The load generator is one client far above the API's rate limits; keep the
+# throttle in the measured path, at rates it never reaches
+REST_FRAMEWORK = {**REST_FRAMEWORK, 'DEFAULT_THROTTLE_RATES': {
+    scope: '1000000/s' for scope in REST_FRAMEWORK['DEFAULT_THROTTLE_RATES']
+}}
+
+DEBUG = False
@@ -0,0 +1,146 @@
+"""
+Concurrent read/write throughput on SQLite, bare settings vs the tuned
+profile from ecommerce/settings.py (WAL, pragmas, BEGIN IMMEDIATE and
+persistent connections).
+
+    python -m benchmarks.sqlite_concurrency --readers 6 --writers 2 --duration 10
+
+Each worker emulates the request cycle: it calls close_old_connections()
+around every operation, as Django does on request_started/finished, so
+the cost of opening a connection per request is part of the numbers.
+"""
+import argparse
+import multiprocessing
+import os
+import random
+import shutil
+import sqlite3
+import sys
+import time
+from pathlib import Path
+
+BASE_DIR = Path(__file__).resolve().parent.parent
+WORK_DIR = Path(__file__).resolve().parent
+
+
+def setup_django(db_path, tuned):
+    os.environ['DJANGO_SETTINGS_MODULE'] = 'benchmarks.settings'
+    os.environ['BENCH_DB'] = str(db_path)
+    os.environ['SQLITE_TUNED'] = str(tuned)
+    sys.path.insert(0, str(BASE_DIR))
+    import django
+    django.setup()
+
+
+def worker(role, db_path, tuned, duration, seed, results):
+    setup_django(db_path, tuned)
+    from django.db import OperationalError, close_old_connections, transaction
+    from products.models import Product, ProductReview
+    from users.models import User
+
+    rng = random.Random(seed)
+    product_ids = list(Product.objects.published().values_list('id', flat=True))
+    user_ids = list(User.objects.values_list('id', flat=True))
+    close_old_connections()
+
+    ops = errors = 0
+    latencies = []
+    deadline = time.time() + duration
+    while time.time() < deadline:
+        start = time.perf_counter()
+        try:
+            if role == 'read':
+                list(Product.objects.published().for_catalog()[:20])
+                Product.objects.for_catalog().get(id=rng.choice(product_ids))
+            else:
+                with transaction.atomic():
+                    product_id = rng.choice(product_ids)
+                    Product.objects.filter(id=product_id).update(
+                        quantity=rng.randint(0, 100)
+                    )
+                    ProductReview.objects.update_or_create(
+                        product_id=product_id, user_id=rng.choice(user_ids),
+                        defaults={'rating': rng.randint(1, 5), 'title': 'Bench',
+                                  'content': 'Concurrent write'},
+                    )
+            ops += 1
+            latencies.append(time.perf_counter() - start)
+        except OperationalError:
+            errors += 1
+        finally:
+            # Request finished: closes the connection unless CONN_MAX_AGE keeps it
+            close_old_connections()
+    results.put((role, ops, errors, latencies))
+
+
+def run_profile(name, template, readers, writers, duration):
+    db_path = WORK_DIR / f'concurrency-{name}.sqlite3'
+    for suffix in ('', '-wal', '-shm'):
+        Path(f'{db_path}{suffix}').unlink(missing_ok=True)
+    shutil.copy(template, db_path)
+
+    ctx = multiprocessing.get_context('spawn')
+    results = ctx.Queue()
+    tuned = name == 'tuned'
+    procs = [
+        ctx.Process(target=worker, args=(role, db_path, tuned, duration, n, results))
+        for n, role in enumerate(['read'] * readers + ['write'] * writers)
+    ]
+    for proc in procs:
+        proc.start()
+    rows = [results.get() for _ in procs]
+    for proc in procs:
+        proc.join()
+
+    summary = {}
+    for role in ('read', 'write'):
+        role_rows = [r for r in rows if r[0] == role]
+        latencies = sorted(l for r in role_rows for l in r[3])
+        ops = sum(r[1] for r in role_rows)
+        summary[role] = {
+            'ops_per_sec': round(ops / duration, 1),
+            'errors': sum(r[2] for r in role_rows),
+            'p95_ms': round(latencies[int(len(latencies) * 0.95) - 1] * 1000, 2)
+            if latencies else None,
+        }
+    return summary
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--products', type=int, default=2000)
+    parser.add_argument('--readers', type=int, default=6)
+    parser.add_argument('--writers', type=int, default=2)
+    parser.add_argument('--duration', type=float, default=10.0)
+    args = parser.parse_args(argv)
+
+    template = WORK_DIR / 'concurrency-template.sqlite3'
+    for suffix in ('', '-wal', '-shm'):
+        Path(f'{template}{suffix}').unlink(missing_ok=True)
+    setup_django(template, tuned=False)
+    from django.core.management import call_command
+    from django.db import connection
+    from benchmarks.seed import seed_catalog
+
+    call_command('migrate', verbosity=0)
+    seed_catalog(products=args.products)
+    connection.close()
+    # Leave the template in rollback-journal mode; each profile sets its own
+    with sqlite3.connect(template) as conn:
+        conn.execute('PRAGMA journal_mode=DELETE')
+
+    print(f"{args.readers} readers, {args.writers} writers, {args.duration}s, "
+          f"{args.products} products\n")
+    print(f"{'profile':<8} {'reads/s':>9} {'read p95':>9} {'writes/s':>9} "
+          f"{'write p95':>10} {'errors':>7}")
+    for name in ('bare', 'tuned'):
+        result = run_profile(name, template, args.readers, args.writers, args.duration)
+        print(f"{name:<8} {result['read']['ops_per_sec']:>9} "
+              f"{result['read']['p95_ms']!s:>9} {result['write']['ops_per_sec']:>9} "
+              f"{result['write']['p95_ms']!s:>10} "
+              f"{result['read']['errors'] + result['write']['errors']:>7}")
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,121 @@
+"""
+Per-request cost of the API throttle: GCRAThrottle with in-process
+buckets and with Django cache backends, against DRF's ScopedRateThrottle.
+
+    python -m benchmarks.throttle_overhead --clients 1000 --requests 200000
+
+Requests cycle through --clients addresses at a rate nothing reaches, so
+every check is admitted and updates its key. Prints microseconds per check
+and the state each backend holds per key after the run.
+"""
+import argparse
+import os
+import pickle
+import sys
+import tempfile
+import time
+from pathlib import Path
+
+BASE_DIR = Path(__file__).resolve().parent.parent
+
+RATE = '1000000/hour'
+
+
+def setup_django():
+    os.environ['DJANGO_SETTINGS_MODULE'] = 'benchmarks.settings'
+    sys.path.insert(0, str(BASE_DIR))
+    from django.conf import settings
+    settings.CACHES = {
+        'locmem': {'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+                   'OPTIONS': {'MAX_ENTRIES': 1000000}},
+        'file': {'BACKEND': 'ecommerce.cache.FileCache',
+                 'LOCATION': tempfile.mkdtemp(prefix='throttle-bench-'),
+                 'OPTIONS': {'MAX_ENTRIES': 1000000}},
+        'default': {'BACKEND': 'django.core.cache.backends.locmem.LocMemCache'},
+    }
+    settings.REST_FRAMEWORK = {**settings.REST_FRAMEWORK,
+                               'DEFAULT_THROTTLE_RATES': {'list': RATE}}
+    import django
+    django.setup()
+
+
+def make_requests(clients):
+    from django.contrib.auth.models import AnonymousUser
+    from rest_framework.request import Request
+    from rest_framework.test import APIRequestFactory
+
+    factory = APIRequestFactory()
+    requests = []
+    for i in range(clients):
+        request = Request(factory.get('/api/products/', REMOTE_ADDR=f'10.0.{i // 256}.{i % 256}'))
+        request.user = AnonymousUser()
+        requests.append(request)
+    return requests
+
+
+def run(throttle_class, requests, total):
+    from rest_framework.views import APIView
+
+    view = APIView()
+    view.throttle_scope = 'list'
+    count = len(requests)
+    start = time.perf_counter()
+    for i in range(total):
+        # A throttle instance per request, as DRF creates them
+        if not throttle_class().allow_request(requests[i % count], view):
+            raise RuntimeError('request refused; raise RATE')
+    return (time.perf_counter() - start) / total * 1e6
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--clients', type=int, default=1000)
+    parser.add_argument('--requests', type=int, default=200000)
+    parser.add_argument('--file-requests', type=int, default=20000,
+                        help='requests for the file-based cache, which is much slower')
+    args = parser.parse_args(argv)
+
+    setup_django()
+    from django.core.cache import caches
+    from django.test import override_settings
+    from rest_framework.throttling import ScopedRateThrottle
+    from ecommerce import throttling
+
+    requests = make_requests(args.clients)
+
+    class DRFScoped(ScopedRateThrottle):
+        cache = caches['locmem']
+
+    class NoThrottle:
+        def allow_request(self, request, view):
+            return True
+
+    address = requests[0]._request.META['REMOTE_ADDR']
+    gcra_key = f'throttle:list:a{address}'
+    cases = [
+        # name, throttle class, THROTTLE_CACHE, checks, state of one key
+        ('no throttle', NoThrottle, None, args.requests, lambda: None),
+        ('gcra, in-process', throttling.GCRAThrottle, None, args.requests,
+         lambda: throttling._buckets.get(gcra_key)),
+        ('gcra, locmem cache', throttling.GCRAThrottle, 'locmem', args.requests,
+         lambda: caches['locmem'].get(gcra_key)),
+        ('gcra, file cache', throttling.GCRAThrottle, 'file', args.file_requests,
+         lambda: caches['file'].get(gcra_key)),
+        ('drf scoped, locmem', DRFScoped, None, args.requests,
+         lambda: caches['locmem'].get(f'throttle_list_{address}')),
+    ]
+    print(f"{args.clients} clients, rate {RATE}\n")
+    print(f"{'throttle':<22} {'us/check':>9} {'bytes/key':>10}")
+    for name, throttle, alias, total, state in cases:
+        with override_settings(THROTTLE_CACHE=alias):
+            run(throttle, requests, args.clients)  # warm up: create every key
+            micros = run(throttle, requests, total)
+            run(throttle, requests[:1], 1)
+            value = state()
+        size = len(pickle.dumps(value)) if value is not None else 0
+        print(f"{name:<22} {micros:>9.2f} {size:>10}")
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -18,11 +18,27 @@ def api_overview(request):
             'list': '/api/products/',
             'detail': '/api/products/{slug}/',
             'search': '/api/products/?search={query}',
+            'autocomplete': '/api/products/autocomplete/?q={typed}',
             'filter': '/api/products/?min_price=10&max_price=100',
+            'batch': '/api/products/batch/?slugs={slug},{slug}',
+            'bulk_write': '/api/products/bulk/',
+            'trending': '/api/products/?ordering=-popularity',
+            'recently_viewed': '/api/products/recently_viewed/',
+            'related': '/api/products/{slug}/related/',
+            'feed': '/api/feed/products.jsonl?since={iso_timestamp}',
         },
         'Categories': {
             'list': '/api/categories/',
             'detail': '/api/categories/{slug}/',
+        },
+        'Changes': {
+            'feed': '/api/changes/?after={cursor}&models=product,category',
+        },
+        'Wishlist': {
+            'list': '/api/wishlist/',
+            'add': 'POST /api/wishlist/ {"product": id}',
+            'ids': '/api/wishlist/ids/',
+            'remove': 'DELETE /api/wishlist/{product_id}/',
         }
     }
     return Response(endpoints)
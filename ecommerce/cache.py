@@ -0,0 +1,281 @@
+"""
+Two-tier cache shared by the apps.
+
+A bounded in-process LRU (short TTL, since other workers cannot
+invalidate it) sits in front of Django's `default` cache, which is
+file-based (FileCache) or Redis so every worker shares it. Values are
+grouped by namespace, and each namespace keeps its own hit/miss counters.
+
+    products = TieredCache('products', timeout=300, stale_ttl=60)
+    data = products.get_or_set(f'detail:{pk}', lambda: build(pk))
+    products.delete(f'detail:{pk}')
+
+`get_or_set` coalesces recomputes: only one caller, across threads and
+worker processes, rebuilds an expired key while the others wait for it.
+With `stale_ttl`, an expired value is served for that long while a
+single background refresh runs (stale-while-revalidate).
+"""
+import random
+import threading
+import time
+from collections import Counter, OrderedDict
+
+from django.conf import settings
+from django.core.cache import cache as shared
+from django.core.cache.backends.filebased import FileBasedCache
+from django.db import connections
+
+_config = getattr(settings, 'TIERED_CACHE', {})
+LOCAL_MAX_ENTRIES = _config.get('LOCAL_MAX_ENTRIES', 5000)
+LOCAL_TTL = _config.get('LOCAL_TTL', 5)
+LOCK_TIMEOUT = _config.get('LOCK_TIMEOUT', 10)
+LOCK_WAIT = _config.get('LOCK_WAIT', 2.0)
+
+
+class LRUCache:
+    """Thread-safe mapping bounded to `maxsize` entries with optional per-entry expiry"""
+
+    def __init__(self, maxsize):
+        self.maxsize = maxsize
+        self.data = OrderedDict()
+        self.lock = threading.Lock()
+
+    def get(self, key, default=None):
+        with self.lock:
+            item = self.data.get(key)
+            if item is None:
+                return default
+            value, expires = item
+            if expires is not None and expires < time.monotonic():
+                del self.data[key]
+                return default
+            self.data.move_to_end(key)
+            return value
+
+    def set(self, key, value, ttl=None):
+        expires = time.monotonic() + ttl if ttl is not None else None
+        with self.lock:
+            self.data[key] = (value, expires)
+            self.data.move_to_end(key)
+            while len(self.data) > self.maxsize:
+                self.data.popitem(last=False)
+
+    def pop(self, key):
+        with self.lock:
+            self.data.pop(key, None)
+
+    def clear(self):
+        with self.lock:
+            self.data.clear()
+
+
+class FileCache(FileBasedCache):
+    """
+    FileBasedCache that doesn't cull when setting. Django's culls by listing
+    the whole cache directory on every set, which gets slower the more
+    entries there are; run `manage.py cull_cache` from cron instead.
+    """
+
+    def _cull(self):
+        pass
+
+    def cull(self):
+        """Delete expired entries, then random ones if still at MAX_ENTRIES; returns how many"""
+        removed = 0
+        for fname in self._list_cache_files():
+            try:
+                with open(fname, 'rb') as f:
+                    removed += self._is_expired(f)
+            except FileNotFoundError:
+                pass
+        filelist = self._list_cache_files()
+        if len(filelist) < self._max_entries:
+            return removed
+        if self._cull_frequency == 0:
+            self.clear()
+            return removed + len(filelist)
+        for fname in random.sample(filelist, len(filelist) // self._cull_frequency):
+            removed += self._delete(fname)
+        return removed
+
+
+_local = LRUCache(LOCAL_MAX_ENTRIES)
+_stats = {}  # namespace -> Counter
+_stats_lock = threading.Lock()
+_inflight = {}  # full key -> threading.Event for recomputes running in this process
+_inflight_lock = threading.Lock()
+
+
+def _count(namespace, event, n=1):
+    with _stats_lock:
+        _stats.setdefault(namespace, Counter())[event] += n
+
+
+def stats():
+    """Per-namespace counters for this process"""
+    with _stats_lock:
+        return {ns: dict(counter) for ns, counter in _stats.items()}
+
+
+class TieredCache:
+    def __init__(self, namespace, timeout=300, stale_ttl=0, local_ttl=LOCAL_TTL):
+        self.namespace = namespace
+        self.timeout = timeout
+        self.stale_ttl = stale_ttl
+        self.local_ttl = local_ttl
+
+    def key(self, key):
+        return f'{self.namespace}:{key}'
+
+    # Envelopes carry the freshness deadline so stale values can still be served
+    def _wrap(self, value, timeout):
+        return {'value': value, 'fresh_until': time.time() + timeout}
+
+    def _lookup(self, key):
+        """Envelope for `key` from the local tier, then the shared tier"""
+        full = self.key(key)
+        envelope = _local.get(full)
+        if envelope is not None:
+            return envelope
+        envelope = shared.get(full)
+        if envelope is not None:
+            _local.set(full, envelope, self._local_ttl(envelope))
+        return envelope
+
+    def _local_ttl(self, envelope):
+        return max(0.0, min(self.local_ttl, envelope['fresh_until'] - time.time()))
+
+    def get(self, key, default=None):
+        envelope = self._lookup(key)
+        if envelope is None or envelope['fresh_until'] < time.time():
+            _count(self.namespace, 'misses')
+            return default
+        _count(self.namespace, 'hits')
+        return envelope['value']
+
+    def get_many(self, keys):
+        """{key: value} for the fresh keys found"""
+        found, remote = {}, []
+        now = time.time()
+        for key in keys:
+            envelope = _local.get(self.key(key))
+            if envelope is None:
+                remote.append(key)
+            elif envelope['fresh_until'] >= now:
+                found[key] = envelope['value']
+        if remote:
+            fetched = shared.get_many([self.key(k) for k in remote])
+            for key in remote:
+                envelope = fetched.get(self.key(key))
+                if envelope is not None and envelope['fresh_until'] >= now:
+                    found[key] = envelope['value']
+                    _local.set(self.key(key), envelope, self._local_ttl(envelope))
+        _count(self.namespace, 'hits', len(found))
+        _count(self.namespace, 'misses', len(keys) - len(found))
+        return found
+
+    def set(self, key, value, timeout=None):
+        timeout = self.timeout if timeout is None else timeout
+        envelope = self._wrap(value, timeout)
+        shared.set(self.key(key), envelope, timeout + self.stale_ttl)
+        _local.set(self.key(key), envelope, self._local_ttl(envelope))
+
+    def set_many(self, mapping, timeout=None):
+        timeout = self.timeout if timeout is None else timeout
+        envelopes = {self.key(k): self._wrap(v, timeout) for k, v in mapping.items()}
+        shared.set_many(envelopes, timeout + self.stale_ttl)
+        for full, envelope in envelopes.items():
+            _local.set(full, envelope, self._local_ttl(envelope))
+
+    def delete(self, key):
+        shared.delete(self.key(key))
+        _local.pop(self.key(key))
+
+    def delete_many(self, keys):
+        shared.delete_many([self.key(k) for k in keys])
+        for key in keys:
+            _local.pop(self.key(key))
+
+    # -- coalescing ------------------------------------------------------
+
+    def acquire(self, key):
+        """Try to become the one caller recomputing `key`; True on success"""
+        full = self.key(key)
+        with _inflight_lock:
+            if full in _inflight:
+                return False
+            _inflight[full] = threading.Event()
+        if shared.add(f'lock:{full}', 1, LOCK_TIMEOUT):
+            return True
+        self.release(key, remote=False)
+        return False
+
+    def release(self, key, remote=True):
+        full = self.key(key)
+        if remote:
+            shared.delete(f'lock:{full}')
+        with _inflight_lock:
+            event = _inflight.pop(full, None)
+        if event is not None:
+            event.set()
+
+    def wait(self, key, check, timeout=LOCK_WAIT):
+        """Wait for another caller's recompute; returns check() once truthy or None"""
+        deadline = time.monotonic() + timeout
+        while time.monotonic() < deadline:
+            event = _inflight.get(self.key(key))
+            if event is not None:
+                event.wait(max(0.0, deadline - time.monotonic()))
+            result = check()
+            if result is not None:
+                return result
+            time.sleep(0.02)
+        return None
+
+    def get_or_set(self, key, compute, timeout=None):
+        """Cached value for `key`, computing it once across workers when missing"""
+        envelope = self._lookup(key)
+        now = time.time()
+        if envelope is not None and envelope['fresh_until'] >= now:
+            _count(self.namespace, 'hits')
+            return envelope['value']
+
+        if envelope is not None:
+            # Stale but inside stale_ttl: serve it and refresh once in the background
+            _count(self.namespace, 'stale')
+            if self.acquire(key):
+                threading.Thread(target=self._refresh, args=(key, compute, timeout),
+                                 daemon=True).start()
+            return envelope['value']
+
+        _count(self.namespace, 'misses')
+        if not self.acquire(key):
+            def check():
+                found = self._lookup(key)
+                return found if found is not None and found['fresh_until'] >= time.time() else None
+            found = self.wait(key, check)
+            if found is not None:
+                _count(self.namespace, 'coalesced')
+                return found['value']
+            # The other recompute is taking too long; do our own
+            value = compute()
+            self.set(key, value, timeout)
+            _count(self.namespace, 'computes')
+            return value
+        try:
+            value = compute()
+            self.set(key, value, timeout)
+            _count(self.namespace, 'computes')
+            return value
+        finally:
+            self.release(key)
+
+    def _refresh(self, key, compute, timeout):
+        try:
+            self.set(key, compute(), timeout)
+            _count(self.namespace, 'refreshes')
+        finally:
+            self.release(key)
+            # This thread's DB connections would otherwise never be closed
+            connections.close_all()
+
@@ -0,0 +1,130 @@
+"""
+Read-replica routing.
+
+Reads of models in DATABASE_REPLICA_APPS go to a replica only inside a
+`replica_reads()` block (opened by ReplicaReadMixin for safe requests on
+the catalog viewsets). Everything else, including any read after a write
+in the same request and reads inside a transaction, uses `default`.
+Replicas are picked by smooth weighted round-robin and skipped while
+their health check fails.
+"""
+import threading
+import time
+from contextlib import contextmanager
+from contextvars import ContextVar
+
+from django.conf import settings
+from django.db import DEFAULT_DB_ALIAS, DatabaseError, connections
+
+_routing = ContextVar('db_routing', default=None)
+
+SAFE_METHODS = ('GET', 'HEAD', 'OPTIONS')
+
+
+class _RoutingState:
+    __slots__ = ('replicas', 'pinned', 'alias')
+
+    def __init__(self, replicas):
+        self.replicas = replicas
+        self.pinned = False
+        self.alias = None
+
+
+@contextmanager
+def replica_reads(enabled=True):
+    """Allow replica reads for the duration of the block (one request)"""
+    token = _routing.set(_RoutingState(enabled))
+    try:
+        yield
+    finally:
+        _routing.reset(token)
+
+
+class ReplicaReadMixin:
+    """
+    ViewSet mixin: safe requests for `replica_actions` (all actions when
+    None) may read from replicas.
+    """
+    replica_actions = None
+
+    def dispatch(self, request, *args, **kwargs):
+        action = getattr(self, 'action_map', {}).get(request.method.lower())
+        enabled = request.method in SAFE_METHODS and (
+            self.replica_actions is None or action in self.replica_actions
+        )
+        with replica_reads(enabled):
+            return super().dispatch(request, *args, **kwargs)
+
+
+class ReplicaRouter:
+    health_ttl = 5.0     # seconds a health check result is trusted
+    retry_after = 30.0   # seconds an unhealthy replica is skipped
+
+    def __init__(self):
+        self.weights = dict(getattr(settings, 'DATABASE_REPLICAS', {}))
+        self.apps = set(getattr(settings, 'DATABASE_REPLICA_APPS', ()))
+        self.current = {alias: 0 for alias in self.weights}
+        self.health = {}  # alias -> (healthy, checked_at)
+        self.lock = threading.Lock()
+
+    def db_for_read(self, model, **hints):
+        state = _routing.get()
+        if (state is None or not state.replicas or state.pinned
+                or model._meta.app_label not in self.apps
+                or connections[DEFAULT_DB_ALIAS].in_atomic_block):
+            return DEFAULT_DB_ALIAS
+        # One replica per request, so a page and its COUNT see the same snapshot
+        if state.alias is None:
+            state.alias = self.pick() or DEFAULT_DB_ALIAS
+        return state.alias
+
+    def db_for_write(self, model, **hints):
+        state = _routing.get()
+        if state is not None:
+            # Read-after-write in this request must see the write
+            state.pinned = True
+        return DEFAULT_DB_ALIAS
+
+    def allow_relation(self, obj1, obj2, **hints):
+        aliases = {DEFAULT_DB_ALIAS, *self.weights}
+        if obj1._state.db in aliases and obj2._state.db in aliases:
+            return True
+        return None
+
+    def allow_migrate(self, db, app_label, model_name=None, **hints):
+        # Replicas get their schema from sync_replicas, never from migrate
+        if db in self.weights:
+            return False
+        return None
+
+    def pick(self):
+        """Smooth weighted round-robin over healthy replicas"""
+        healthy = [alias for alias in self.weights if self.is_healthy(alias)]
+        if not healthy:
+            return None
+        with self.lock:
+            total = 0
+            best = None
+            for alias in healthy:
+                self.current[alias] += self.weights[alias]
+                total += self.weights[alias]
+                if best is None or self.current[alias] > self.current[best]:
+                    best = alias
+            self.current[best] -= total
+        return best
+
+    def is_healthy(self, alias):
+        healthy, checked_at = self.health.get(alias, (True, 0.0))
+        ttl = self.health_ttl if healthy else self.retry_after
+        if time.monotonic() - checked_at < ttl:
+            return healthy
+        try:
+            with connections[alias].cursor() as cursor:
+                # A missing SQLite file opens as an empty database, so check for schema
+                cursor.execute('SELECT 1 FROM django_migrations LIMIT 1')
+            healthy = True
+        except DatabaseError:
+            connections[alias].close()
+            healthy = False
+        self.health[alias] = (healthy, time.monotonic())
+        return healthy
@@ -0,0 +1,160 @@
+"""
+OpenAPI schema and the Swagger / ReDoc views.
+
+drf_yasg and the jsonschema / swagger_spec_validator stack under it take
+longer to import than the rest of the URLconf put together, and most
+processes never serve the docs. Nothing here imports them until a docs
+route is requested.
+
+Introspecting every viewset and serializer is the expensive part of the
+docs, so /swagger.json and /swagger.yaml never do it per request.
+`manage.py build_openapi_schema` writes the schema at deploy time to
+versioned files under OPENAPI_SCHEMA_ROOT, with a manifest recording the
+code it was generated from. The routes serve those files, with an ETag,
+for as long as the code matches. Otherwise the schema is generated once
+per process and kept in memory. The Swagger/ReDoc pages load the spec
+from /swagger.json.
+"""
+import functools
+import hashlib
+import json
+import logging
+import threading
+from pathlib import Path
+
+from django.apps import apps
+from django.conf import settings
+from django.http import HttpResponse
+from django.utils.cache import patch_cache_control
+from django.views.decorators.csrf import csrf_exempt
+from django.views.decorators.http import condition, require_safe
+
+logger = logging.getLogger('ecommerce')
+
+MANIFEST_NAME = 'manifest.json'
+CONTENT_TYPES = {
+    '.json': 'application/json; charset=utf-8',
+    '.yaml': 'application/yaml; charset=utf-8',
+}
+
+_lock = threading.Lock()
+
+
+def schema_info():
+    from drf_yasg import openapi
+
+    return openapi.Info(
+        title="E-Commerce API",
+        default_version='v1',
+        description="E-Commerce Backend API Documentation",
+        terms_of_service="https://www.example.com/terms/",
+        contact=openapi.Contact(email="api@example.com"),
+        license=openapi.License(name="BSD License"),
+    )
+
+
+@functools.cache
+def schema_view():
+    from drf_yasg.views import get_schema_view
+    from rest_framework import permissions
+
+    return get_schema_view(
+        schema_info(),
+        public=True,
+        permission_classes=(permissions.AllowAny,),
+    )
+
+
+def lazy_schema_view(renderer, cache_timeout=0):
+    """
+    URLconf view for one of the schema UIs ('swagger', 'redoc'); the
+    drf_yasg view is created on the first request.
+    """
+    @functools.cache
+    def build():
+        return schema_view().with_ui(renderer, cache_timeout=cache_timeout)
+
+    @csrf_exempt
+    def view(request, *args, **kwargs):
+        return build()(request, *args, **kwargs)
+    return view
+
+
+def code_fingerprint():
+    """Hash of the project's source files and the schema tooling versions"""
+    import drf_yasg
+    import rest_framework
+
+    digest = hashlib.sha256(f'{drf_yasg.__version__}:{rest_framework.VERSION}'.encode())
+    base = Path(settings.BASE_DIR).resolve()
+    roots = {Path(config.path).resolve() for config in apps.get_app_configs()}
+    roots.add(base / settings.ROOT_URLCONF.split('.')[0])
+    for root in sorted(root for root in roots if root.is_relative_to(base)):
+        for path in sorted(root.rglob('*.py')):
+            if 'migrations' in path.parts:
+                continue
+            digest.update(str(path.relative_to(base)).encode())
+            digest.update(path.read_bytes())
+    return digest.hexdigest()[:16]
+
+
+def generate_schema():
+    """{'.json': bytes, '.yaml': bytes} introspected from the current URLconf"""
+    from drf_yasg.codecs import OpenAPICodecJson, OpenAPICodecYaml
+
+    generator = schema_view().generator_class(schema_info())
+    schema = generator.get_schema(request=None, public=True)
+    return {
+        '.json': OpenAPICodecJson(validators=[]).encode(schema),
+        '.yaml': OpenAPICodecYaml(validators=[]).encode(schema),
+    }
+
+
+def schema_version(documents):
+    return hashlib.sha256(documents['.json']).hexdigest()[:16]
+
+
+def _read_static(fingerprint):
+    root = Path(settings.OPENAPI_SCHEMA_ROOT)
+    try:
+        manifest = json.loads((root / MANIFEST_NAME).read_text())
+    except (OSError, ValueError):
+        return None
+    if manifest.get('fingerprint') != fingerprint:
+        logger.warning("OpenAPI schema in %s is out of date; generating it in process "
+                       "(run manage.py build_openapi_schema)", root)
+        return None
+    try:
+        documents = {fmt: (root / name).read_bytes() for fmt, name in manifest['files'].items()}
+    except (OSError, KeyError):
+        return None
+    return manifest['version'], documents
+
+
+@functools.cache
+def _load_schema():
+    fingerprint = code_fingerprint()
+    static = _read_static(fingerprint)
+    if static is not None:
+        return static
+    documents = generate_schema()
+    return schema_version(documents), documents
+
+
+def load_schema():
+    """(version, documents) for this process's code, read or generated once"""
+    with _lock:
+        # One generation per process even when the first hits arrive together
+        return _load_schema()
+
+
+@csrf_exempt
+@require_safe
+@condition(etag_func=lambda request, format: load_schema()[0])
+def schema_document(request, format):
+    """/swagger.json and /swagger.yaml"""
+    version, documents = load_schema()
+    response = HttpResponse(documents[format], content_type=CONTENT_TYPES[format])
+    # Clients and the docs pages revalidate; a match is a 304 without a body
+    patch_cache_control(response, public=True, no_cache=True)
+    return response
@@ -70,6 +70,25 @@ CORS_ALLOW_METHODS = [
 
 # ==================== DATABASE CONFIGURATION ====================
 # SQLite database for PythonAnywhere (free tier)
+#
+# Production tuning, applied to every new connection:
+# - WAL lets readers keep going while a review or admin edit is being written
+# - synchronous=NORMAL is durable in WAL mode and avoids an fsync per commit
+# - mmap/cache keep the hot catalog pages in memory (cache_size is in KiB when negative)
+# - busy_timeout waits for the write lock instead of failing with "database is locked"
+# - BEGIN IMMEDIATE takes the write lock up front, so two transactions that
+#   both read then write can't deadlock upgrading their locks
+SQLITE_PRAGMAS = {
+    'journal_mode': 'WAL',
+    'synchronous': 'NORMAL',
+    'mmap_size': 256 * 1024 * 1024,
+    'cache_size': -64 * 1024,
+    'busy_timeout': 5000,
+    'temp_store': 'MEMORY',
+    'foreign_keys': 'ON',
+}
+SQLITE_TUNED = os.environ.get('SQLITE_TUNED', 'True').lower() == 'true'
+
 DATABASES = {
     'default': {
         'ENGINE': 'django.db.backends.sqlite3',
@@ -77,6 +96,76 @@ DATABASES = {
     }
 }
 
+if SQLITE_TUNED:
+    DATABASES['default'].update({
+        # Reuse connections across requests; health checks replace broken ones
+        'CONN_MAX_AGE': int(os.environ.get('DB_CONN_MAX_AGE', 600)),
+        'CONN_HEALTH_CHECKS': True,
+        'OPTIONS': {
+            'transaction_mode': 'IMMEDIATE',
+            'timeout': SQLITE_PRAGMAS['busy_timeout'] / 1000,
+            'init_command': ';'.join(
+                f'PRAGMA {name}={value}' for name, value in SQLITE_PRAGMAS.items()
+            ),
+        },
+    })
+
+# Read replicas as "path[:weight]" entries, e.g.
+#   SQLITE_REPLICAS=/home/me/replica1.sqlite3:2,/home/me/replica2.sqlite3
+# Refresh them with `manage.py sync_replicas`. Only catalog reads from the
+# viewsets using ReplicaReadMixin are sent to replicas.
+DATABASE_REPLICAS = {}
+DATABASE_REPLICA_APPS = ['products']
+for number, spec in enumerate(filter(None, os.environ.get('SQLITE_REPLICAS', '').split(',')), 1):
+    path, sep, weight = spec.strip().rpartition(':')
+    if not sep or not weight.isdigit():
+        path, weight = spec.strip(), '1'
+    alias = f'replica{number}'
+    DATABASES[alias] = {
+        **DATABASES['default'],
+        'NAME': path,
+        'OPTIONS': dict(DATABASES['default'].get('OPTIONS', {})),
+        'TEST': {'MIRROR': 'default'},
+    }
+    DATABASE_REPLICAS[alias] = int(weight)
+
+DATABASE_ROUTERS = ['ecommerce.db_router.ReplicaRouter']
+
+# ==================== CACHE ====================
+# The shared tier must be seen by every worker; ecommerce.cache.TieredCache
+# adds an in-process LRU in front of it. Redis when REDIS_URL is set (needs
+# the redis package), otherwise files on the box. Django's file cache lists
+# the whole directory on every set to decide whether to cull, so FileCache
+# skips that and `manage.py cull_cache` does it from cron.
+REDIS_URL = os.environ.get('REDIS_URL')
+if REDIS_URL:
+    CACHES = {
+        'default': {
+            'BACKEND': 'django.core.cache.backends.redis.RedisCache',
+            'LOCATION': REDIS_URL,
+            'TIMEOUT': 300,
+        }
+    }
+else:
+    CACHES = {
+        'default': {
+            'BACKEND': 'ecommerce.cache.FileCache',
+            'LOCATION': os.environ.get('CACHE_DIR', str(BASE_DIR / '.cache')),
+            'TIMEOUT': 300,
+            'OPTIONS': {
+                'MAX_ENTRIES': 50000,
+                'CULL_FREQUENCY': 4,
+            },
+        }
+    }
+
+TIERED_CACHE = {
+    'LOCAL_MAX_ENTRIES': 5000,  # per process
+    'LOCAL_TTL': 5,             # seconds; other workers can't invalidate this tier
+    'LOCK_TIMEOUT': 10,         # seconds a recompute lock is held at most
+    'LOCK_WAIT': 2.0,           # seconds a caller waits for someone else's recompute
+}
+
 # ==================== APPLICATION CONFIGURATION ====================
 INSTALLED_APPS = [
     'django.contrib.admin',
@@ -91,10 +180,12 @@ INSTALLED_APPS = [
     'rest_framework_simplejwt',
     'corsheaders',
     'django_filters',
+    'drf_yasg',
     
     # Local apps
     'users',
     'products',
+    'wishlist',
 ]
 
 MIDDLEWARE = [
@@ -157,6 +248,25 @@ STATIC_URL = '/static/'
 STATIC_ROOT = BASE_DIR / 'staticfiles'
 STATICFILES_STORAGE = 'whitenoise.storage.CompressedManifestStaticFilesStorage'
 
+# Output of `manage.py export_catalog_snapshot`. Living under STATIC_ROOT lets
+# WhiteNoise serve it (with the precompressed .gz/.br siblings) at
+# /static/catalog/; on PythonAnywhere map /static/catalog/ straight to this
+# directory so new snapshots are picked up without a reload.
+CATALOG_SNAPSHOT_ROOT = STATIC_ROOT / 'catalog'
+
+# Output of `manage.py build_openapi_schema`, served by /swagger.json and
+# /swagger.yaml (and by WhiteNoise at /static/schema/ under versioned names)
+OPENAPI_SCHEMA_ROOT = STATIC_ROOT / 'schema'
+
+# The docs pages load the spec from the cached schema route instead of
+# asking the UI view to introspect every endpoint again
+SWAGGER_SETTINGS = {
+    'SPEC_URL': ('schema-json', {'format': '.json'}),
+}
+REDOC_SETTINGS = {
+    'SPEC_URL': ('schema-json', {'format': '.json'}),
+}
+
 # Media files (Uploaded files)
 MEDIA_URL = '/media/'
 MEDIA_ROOT = BASE_DIR / 'media'
@@ -168,7 +278,7 @@ AUTH_USER_MODEL = 'users.User'
 # ==================== REST FRAMEWORK ====================
 REST_FRAMEWORK = {
     'DEFAULT_AUTHENTICATION_CLASSES': (
-        'rest_framework_simplejwt.authentication.JWTAuthentication',
+        'users.authentication.CachedJWTAuthentication',
     ),
     'DEFAULT_PERMISSION_CLASSES': (
         'rest_framework.permissions.IsAuthenticatedOrReadOnly',
@@ -180,8 +290,30 @@ REST_FRAMEWORK = {
         'rest_framework.filters.SearchFilter',
         'rest_framework.filters.OrderingFilter',
     ],
+    # Proxies in front of the app, each appending to X-Forwarded-For; anonymous
+    # clients are throttled by the address the outermost one saw (PythonAnywhere
+    # runs one). 0 when serving directly, so the header is ignored
+    'NUM_PROXIES': int(os.environ.get('NUM_PROXIES', 1)),
+    # Token buckets per user (or address) and scope; see ecommerce/throttling.py
+    'DEFAULT_THROTTLE_CLASSES': ['ecommerce.throttling.GCRAThrottle'],
+    'DEFAULT_THROTTLE_RATES': {
+        'search': os.environ.get('THROTTLE_SEARCH', '30/min'),
+        # A request per keystroke, answered from memory
+        'autocomplete': os.environ.get('THROTTLE_AUTOCOMPLETE', '600/min'),
+        'list': os.environ.get('THROTTLE_LIST', '120/min'),
+        'detail': os.environ.get('THROTTLE_DETAIL', '300/min'),
+        # Whole-catalog downloads: a full feed and deltas every few minutes
+        'feed': os.environ.get('THROTTLE_FEED', '60/hour'),
+        'review_create': os.environ.get('THROTTLE_REVIEW_CREATE', '10/hour'),
+        'auth': os.environ.get('THROTTLE_AUTH', '10/min'),
+    },
 }
 
+# Cache alias holding the buckets, shared by the workers; None keeps them in
+# each process, which is cheapest but lets every worker admit the full rate
+THROTTLE_CACHE = os.environ.get('THROTTLE_CACHE') or None
+THROTTLE_EXEMPT_STAFF = True
+
 # ==================== JWT CONFIGURATION ====================
 SIMPLE_JWT = {
     'ACCESS_TOKEN_LIFETIME': timedelta(minutes=60),
@@ -264,8 +396,57 @@ LOGOUT_REDIRECT_URL = '/'
 # ==================== MESSAGES FRAMEWORK ====================
 MESSAGE_STORAGE = 'django.contrib.messages.storage.session.SessionStorage'
 
-print("\n" + "=" * 60)
-print("PYTHONANYWHERE SETTINGS LOADED SUCCESSFULLY")
-print(f"DOMAIN: {PYTHONANYWHERE_DOMAIN}")
-print(f"DEBUG MODE: {DEBUG}")
-print("=" * 60)
\ No newline at end of file
+# ==================== CURRENCIES ====================
+# Product prices are stored in this currency. ?currency=<code> on the product
+# endpoints converts them with the CurrencyRate table (admin or
+# `manage.py set_currency_rates`)
+BASE_CURRENCY = os.environ.get('BASE_CURRENCY', 'USD').upper()
+
+# ==================== STOCK ALERTS ====================
+# Quantities that raise a stock event when a product's quantity crosses
+# them (products/stock.py); 0 is sold out. Events stream from
+# /api/stock/events/ and are mailed by `manage.py send_stock_alerts`
+STOCK_ALERT_LEVELS = sorted({int(level) for level in
+                             os.environ.get('STOCK_ALERT_LEVELS', '0,5').split(',') if level.strip()})
+# Digest recipients; active staff users when empty
+STOCK_ALERT_RECIPIENTS = [email.strip() for email in
+                          os.environ.get('STOCK_ALERT_RECIPIENTS', '').split(',') if email.strip()]
+# Seconds a /api/stock/events/ connection stays open before the client reconnects
+STOCK_STREAM_SECONDS = int(os.environ.get('STOCK_STREAM_SECONDS', 300))
+
+# ==================== REVIEW MODERATION ====================
+# `manage.py moderate_reviews` approves pending reviews, and holds those
+# scoring at least REVIEW_SPAM_THRESHOLD (0 to 1) or at least this
+# similar to another review of the product or by the user (products/moderation.py)
+REVIEW_DUPLICATE_THRESHOLD = float(os.environ.get('REVIEW_DUPLICATE_THRESHOLD', 0.8))
+REVIEW_SPAM_THRESHOLD = float(os.environ.get('REVIEW_SPAM_THRESHOLD', 0.5))
+# Phrases that count towards the spam score; the defaults when unset
+if os.environ.get('REVIEW_SPAM_TERMS'):
+    REVIEW_SPAM_TERMS = [term.strip() for term in
+                         os.environ['REVIEW_SPAM_TERMS'].split(',') if term.strip()]
+
+# ==================== WISHLISTS ====================
+# Wishlists live in the cache; changes reach the database (and
+# Product.wishlist_count) in batches at most this many seconds apart
+WISHLIST_FLUSH_INTERVAL = int(os.environ.get('WISHLIST_FLUSH_INTERVAL', 10))
+WISHLIST_MAX_ITEMS = int(os.environ.get('WISHLIST_MAX_ITEMS', 500))
+
+# ==================== AUTOCOMPLETE ====================
+# /api/products/autocomplete/ answers from an in-process index
+# (products/autocomplete.py). Seconds between reads of other workers'
+# changes, and between background rebuilds that re-rank by popularity
+AUTOCOMPLETE_SYNC_INTERVAL = int(os.environ.get('AUTOCOMPLETE_SYNC_INTERVAL', 2))
+AUTOCOMPLETE_REBUILD_INTERVAL = int(os.environ.get('AUTOCOMPLETE_REBUILD_INTERVAL', 600))
+
+# ==================== STARTUP ====================
+# Cold-start budget checked by `manage.py profile_startup` (milliseconds)
+STARTUP_BUDGET_MS = int(os.environ.get('STARTUP_BUDGET_MS', 1500))
+
+# Settings are imported by every worker and manage.py run; only print the
+# banner when asked to (e.g. to check which settings a deploy picked up)
+if os.environ.get('SETTINGS_BANNER', 'False').lower() == 'true':
+    print("\n" + "=" * 60)
+    print("PYTHONANYWHERE SETTINGS LOADED SUCCESSFULLY")
+    print(f"DOMAIN: {PYTHONANYWHERE_DOMAIN}")
+    print(f"DEBUG MODE: {DEBUG}")
+    print("=" * 60)
\ No newline at end of file
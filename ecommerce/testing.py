@@ -0,0 +1,164 @@
+"""
+Query budget and query plan assertions for the API test suites.
+
+QueryPlanTestCase.assertQueries() makes one request and checks
+- the exact number of SQL statements it ran,
+- that no statement does a full scan of a table listed in `scan_guarded`
+  (EXPLAIN QUERY PLAN `SCAN <table>` without an index), unless the call
+  allows it,
+- that the statements and their plans match the suite's snapshot file.
+
+Snapshots keep each statement with its literals and select list elided,
+followed by its plan, so a change that adds a query or loses an index
+shows up as a diff in review. After an intended change, rewrite them with
+
+    UPDATE_QUERY_PLANS=1 python manage.py test
+
+Plans depend on the SQLite version. Under a version other than the one
+that wrote the snapshot, only the snapshot comparison is skipped.
+"""
+import difflib
+import os
+import re
+import sqlite3
+import warnings
+from pathlib import Path
+
+from django.db import connection
+from django.test.utils import CaptureQueriesContext
+from rest_framework.test import APITestCase
+
+UPDATE_SNAPSHOTS = os.environ.get('UPDATE_QUERY_PLANS', '').lower() in ('1', 'true')
+
+EXPLAINED = ('SELECT', 'WITH', 'UPDATE', 'DELETE')
+FULL_SCAN_RE = re.compile(r'^SCAN (?:TABLE )?"?(\w+)"?(?: AS \w+)?$')
+LITERAL_RE = re.compile(r"'(?:[^']|'')*'|\b\d+(?:\.\d+)?\b")
+IN_LIST_RE = re.compile(r'IN \((?:\?, )*\?\)')
+VALUES_RE = re.compile(r'VALUES (\([^()]*\))(?:, \1)+')
+SAVEPOINT_RE = re.compile(r'SAVEPOINT "\w+"')
+
+
+def explain(sql):
+    """EXPLAIN QUERY PLAN rows as indented lines"""
+    with connection.cursor() as cursor:
+        cursor.execute(f'EXPLAIN QUERY PLAN {sql}')
+        rows = cursor.fetchall()
+    depth = {0: -1}
+    lines = []
+    for node, parent, _, detail in rows:
+        depth[node] = depth.get(parent, -1) + 1
+        lines.append('  ' * depth[node] + detail)
+    return lines
+
+
+def normalize(sql):
+    """The statement without literals, IN lists, repeated rows or select list"""
+    sql = IN_LIST_RE.sub('IN (...)', LITERAL_RE.sub('?', sql))
+    sql = VALUES_RE.sub(lambda m: f'VALUES {m.group(1)}, ...', sql)
+    sql = SAVEPOINT_RE.sub('SAVEPOINT ?', sql)
+    if not sql.startswith('SELECT '):
+        return sql
+    # The select list ends at the first FROM outside parentheses (subqueries)
+    depth = 0
+    for position, char in enumerate(sql):
+        depth += {'(': 1, ')': -1}.get(char, 0)
+        if depth == 0 and sql.startswith(' FROM ', position):
+            distinct = 'DISTINCT ' if sql.startswith('SELECT DISTINCT ') else ''
+            return f'SELECT {distinct}...{sql[position:]}'
+    return sql
+
+
+class Snapshot:
+    """Plan snapshot file: one `## label` section per assertQueries call"""
+
+    def __init__(self, path):
+        self.path = Path(path)
+        self.sections = {}
+        self.version = None
+        self.seen = {}
+        if self.path.exists():
+            label = None
+            for line in self.path.read_text().splitlines():
+                if line.startswith('# sqlite '):
+                    self.version = line[len('# sqlite '):]
+                elif line.startswith('## '):
+                    label = line[3:]
+                    self.sections[label] = []
+                elif label is not None:
+                    self.sections[label].append(line)
+            for lines in self.sections.values():
+                while lines and not lines[-1]:
+                    lines.pop()
+
+    @property
+    def comparable(self):
+        return self.version == sqlite3.sqlite_version
+
+    def write(self):
+        sections = {**(self.sections if self.comparable else {}), **self.seen}
+        out = [f'# sqlite {sqlite3.sqlite_version}',
+               '# Written by UPDATE_QUERY_PLANS=1 python manage.py test; see ecommerce/testing.py', '']
+        for label in sorted(sections):
+            out += [f'## {label}', *sections[label], '']
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        self.path.write_text('\n'.join(out))
+
+
+class QueryPlanTestCase(APITestCase):
+    snapshot_path = None
+    scan_guarded = ('products_product', 'products_productreview')
+
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        cls.snapshot = Snapshot(cls.snapshot_path)
+        if not cls.snapshot.comparable and not UPDATE_SNAPSHOTS and cls.snapshot.sections:
+            warnings.warn(f'{cls.snapshot_path} was written by SQLite {cls.snapshot.version}; '
+                          f'not comparing query plans under {sqlite3.sqlite_version}')
+
+    @classmethod
+    def tearDownClass(cls):
+        if UPDATE_SNAPSHOTS:
+            cls.snapshot.write()
+        super().tearDownClass()
+
+    def assertQueries(self, label, count, method, url, data=None, allow_scans=(),
+                      status=200, **extra):
+        """Request `url` and check its queries; returns the response"""
+        with CaptureQueriesContext(connection) as captured:
+            response = getattr(self.client, method)(url, data, **extra)
+            if response.streaming:
+                # Streaming bodies run their queries while being consumed
+                b''.join(response.streaming_content)
+        self.assertEqual(response.status_code, status,
+                         f'{label}: unexpected status {response.status_code}')
+
+        statements = [query['sql'] for query in captured]
+        self.assertEqual(
+            len(statements), count,
+            f'{label}: expected {count} queries, ran {len(statements)}:\n'
+            + '\n'.join(f'  {normalize(sql)}' for sql in statements),
+        )
+
+        section = [f'queries: {count}']
+        for sql in statements:
+            section.append(f'- {normalize(sql)}')
+            if not sql.lstrip().upper().startswith(EXPLAINED):
+                continue
+            plan = explain(sql)
+            section += [f'    {line}' for line in plan]
+            for line in plan:
+                match = FULL_SCAN_RE.match(line.strip())
+                if match and match.group(1) in self.scan_guarded and match.group(1) not in allow_scans:
+                    self.fail(f'{label}: full scan of {match.group(1)}\n  {sql}\n'
+                              + '\n'.join(f'    {line}' for line in plan))
+
+        self.snapshot.seen[label] = section
+        if not UPDATE_SNAPSHOTS and self.snapshot.comparable:
+            expected = self.snapshot.sections.get(label)
+            self.assertIsNotNone(expected, f'{label}: no plan snapshot; run with UPDATE_QUERY_PLANS=1')
+            if expected != section:
+                diff = '\n'.join(difflib.unified_diff(expected, section, 'snapshot', 'current',
+                                                      lineterm=''))
+                self.fail(f'{label}: queries or plans changed (UPDATE_QUERY_PLANS=1 to accept)\n{diff}')
+        return response
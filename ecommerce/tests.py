@@ -0,0 +1,339 @@
+import json
+import sqlite3
+import tempfile
+import threading
+import time
+from contextlib import contextmanager
+from io import StringIO
+from pathlib import Path
+from types import SimpleNamespace
+from unittest import mock
+
+from django.core.cache import cache
+from django.core.management import CommandError, call_command
+from django.db import DatabaseError
+from django.test import SimpleTestCase, override_settings
+
+from products.models import Product
+from users.models import User
+
+from . import cache as tiered_cache
+from . import db_router, schema
+from .cache import FileCache, LRUCache, TieredCache
+
+
+@override_settings(CACHES={'default': {'BACKEND': 'django.core.cache.backends.locmem.LocMemCache'}})
+class TieredCacheTests(SimpleTestCase):
+    """Coalesced recomputes, stale-while-revalidate and the in-process tier"""
+
+    def setUp(self):
+        cache.clear()
+        tiered_cache._local.clear()
+        self.computes = []
+
+    def compute(self, value, delay=0.0):
+        def compute():
+            self.computes.append(value)
+            time.sleep(delay)
+            return value
+        return compute
+
+    def test_concurrent_misses_compute_once(self):
+        things = TieredCache('things')
+        results = []
+        threads = [threading.Thread(target=lambda: results.append(
+            things.get_or_set('key', self.compute('built', delay=0.1)))) for _ in range(8)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        self.assertEqual((results, self.computes), (['built'] * 8, ['built']))
+        self.assertEqual(tiered_cache.stats()['things']['coalesced'], 7)
+
+    def test_miss_waits_for_another_workers_recompute(self):
+        things = TieredCache('other-worker')
+        # Another process holds the shared lock and stores the value shortly
+        cache.add('lock:other-worker:key', 1)
+        timer = threading.Timer(0.1, lambda: cache.set('other-worker:key', things._wrap('theirs', 60)))
+        timer.start()
+        self.addCleanup(timer.cancel)
+        self.assertEqual(things.get_or_set('key', self.compute('mine')), 'theirs')
+        self.assertEqual(self.computes, [])
+
+    def test_stale_value_is_served_while_one_refresh_runs(self):
+        things = TieredCache('stale', stale_ttl=60)
+        things.set('key', 'old', timeout=0)
+        time.sleep(0.01)
+        served = [things.get_or_set('key', self.compute('new', delay=0.1)) for _ in range(3)]
+        self.assertEqual(served, ['old'] * 3)
+        deadline = time.monotonic() + 2
+        while things.get('key') != 'new' and time.monotonic() < deadline:
+            time.sleep(0.01)
+        self.assertEqual((things.get('key'), self.computes), ('new', ['new']))
+        self.assertEqual(tiered_cache.stats()['stale']['refreshes'], 1)
+
+    def test_without_stale_ttl_an_expired_value_is_recomputed(self):
+        things = TieredCache('expired')
+        things.set('key', 'old', timeout=0)
+        time.sleep(0.01)
+        self.assertEqual(things.get_or_set('key', self.compute('new')), 'new')
+
+    def test_local_tier_expires(self):
+        things = TieredCache('local', local_ttl=0.05)
+        things.set('key', 'value')
+        # Another worker deletes it; this process keeps its copy for local_ttl
+        cache.delete('local:key')
+        self.assertEqual(things.get('key'), 'value')
+        time.sleep(0.06)
+        self.assertIsNone(things.get('key'))
+
+    def test_local_tier_evicts_least_recently_used(self):
+        local = LRUCache(maxsize=2)
+        local.set('a', 1)
+        local.set('b', 2)
+        local.get('a')
+        local.set('c', 3)
+        self.assertEqual([local.get(key) for key in 'abc'], [1, None, 3])
+        local.set('d', 4, ttl=0.01)
+        time.sleep(0.02)
+        self.assertIsNone(local.get('d'))
+        self.assertEqual(list(local.data), ['c'])
+
+
+class FileCacheTests(SimpleTestCase):
+    """Culling happens in cull_cache, not when setting"""
+
+    def setUp(self):
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        self.location = directory.name
+        self.cache = FileCache(self.location, {'OPTIONS': {'MAX_ENTRIES': 10, 'CULL_FREQUENCY': 2}})
+
+    def test_set_does_not_cull(self):
+        self.cache.set_many({f'key:{i}': i for i in range(30)}, 60)
+        self.assertEqual(len(self.cache._list_cache_files()), 30)
+        self.assertEqual(self.cache.get('key:0'), 0)
+
+    def test_cull_removes_expired_then_random_entries(self):
+        self.cache.set_many({f'old:{i}': i for i in range(6)}, -1)
+        self.cache.set_many({f'key:{i}': i for i in range(8)}, 60)
+        self.assertEqual(self.cache.cull(), 6)
+        self.assertEqual(len(self.cache._list_cache_files()), 8)
+        self.cache.set_many({f'more:{i}': i for i in range(4)}, 60)
+        self.assertEqual(self.cache.cull(), 6)
+        self.assertEqual(len(self.cache._list_cache_files()), 6)
+
+    def test_command(self):
+        self.cache.set('old', 1, -1)
+        caches = {'default': {'BACKEND': 'ecommerce.cache.FileCache', 'LOCATION': self.location},
+                  'local': {'BACKEND': 'django.core.cache.backends.locmem.LocMemCache'}}
+        out = StringIO()
+        with override_settings(CACHES=caches):
+            call_command('cull_cache', stdout=out)
+        self.assertEqual(out.getvalue().splitlines(), ['default: removed 1 entries', 'local: nothing to cull'])
+
+
+class FakeConnection:
+    def __init__(self, healthy=True):
+        self.healthy = healthy
+        self.in_atomic_block = False
+        self.checks = 0
+
+    @contextmanager
+    def cursor(self):
+        self.checks += 1
+        if not self.healthy:
+            raise DatabaseError('no such table: django_migrations')
+        yield mock.Mock()
+
+    def close(self):
+        pass
+
+
+@override_settings(DATABASE_REPLICAS={'replica1': 3, 'replica2': 1}, DATABASE_REPLICA_APPS=['products'])
+class ReplicaRouterTests(SimpleTestCase):
+    """Replica choice, health checks and when reads stay on the primary"""
+
+    def setUp(self):
+        self.now = 1000.0
+        self.connections = {'default': FakeConnection(), 'replica1': FakeConnection(),
+                            'replica2': FakeConnection()}
+        for target, value in (('connections', self.connections),
+                              ('time', SimpleNamespace(monotonic=lambda: self.now))):
+            patcher = mock.patch.object(db_router, target, value)
+            patcher.start()
+            self.addCleanup(patcher.stop)
+        self.router = db_router.ReplicaRouter()
+
+    def read(self, model=Product):
+        with db_router.replica_reads():
+            return self.router.db_for_read(model)
+
+    def test_weighted_round_robin(self):
+        picks = [self.read() for _ in range(8)]
+        self.assertEqual(picks, ['replica1', 'replica1', 'replica2', 'replica1'] * 2)
+
+    def test_one_replica_per_request(self):
+        with db_router.replica_reads():
+            aliases = {self.router.db_for_read(Product) for _ in range(4)}
+        self.assertEqual(aliases, {'replica1'})
+        self.assertEqual(self.read(), 'replica1')
+        self.assertEqual(self.read(), 'replica2')
+
+    def test_primary_without_replica_reads(self):
+        self.assertEqual(self.router.db_for_read(Product), 'default')
+        with db_router.replica_reads(enabled=False):
+            self.assertEqual(self.router.db_for_read(Product), 'default')
+        # Only DATABASE_REPLICA_APPS are copied to replicas
+        self.assertEqual(self.read(User), 'default')
+        self.connections['default'].in_atomic_block = True
+        self.assertEqual(self.read(), 'default')
+
+    def test_reads_after_a_write_use_primary(self):
+        with db_router.replica_reads():
+            self.assertEqual(self.router.db_for_write(Product), 'default')
+            self.assertEqual(self.router.db_for_read(Product), 'default')
+            self.assertEqual(self.router.db_for_read(Product), 'default')
+        self.assertEqual(self.read(), 'replica1')
+
+    def test_unhealthy_replica_is_skipped_until_retry(self):
+        self.connections['replica1'].healthy = False
+        self.assertEqual({self.read() for _ in range(5)}, {'replica2'})
+        self.assertEqual(self.connections['replica1'].checks, 1)
+        # Healthy results are only trusted for health_ttl
+        self.now += self.router.health_ttl
+        self.read()
+        self.assertEqual(self.connections['replica2'].checks, 2)
+        self.assertEqual(self.connections['replica1'].checks, 1)
+
+        self.connections['replica1'].healthy = True
+        self.now += self.router.retry_after
+        self.assertIn('replica1', {self.read() for _ in range(4)})
+        self.assertEqual(self.connections['replica1'].checks, 2)
+
+    def test_all_replicas_unhealthy(self):
+        self.connections['replica1'].healthy = self.connections['replica2'].healthy = False
+        self.assertEqual([self.read() for _ in range(3)], ['default'] * 3)
+        self.assertEqual([c.checks for c in self.connections.values()], [0, 1, 1])
+
+    def test_mixin_enables_replicas_for_safe_listed_actions(self):
+        class Recorder:
+            def dispatch(self, request, *args, **kwargs):
+                return db_router._routing.get().replicas
+
+        class View(db_router.ReplicaReadMixin, Recorder):
+            replica_actions = ('list',)
+            action_map = {'get': 'list', 'post': 'create', 'head': 'retrieve'}
+
+        view = View()
+        self.assertEqual([view.dispatch(SimpleNamespace(method=method)) for method in ('GET', 'POST', 'HEAD')],
+                         [True, False, False])
+        view.replica_actions = None
+        self.assertEqual([view.dispatch(SimpleNamespace(method=method)) for method in ('GET', 'POST', 'HEAD')],
+                         [True, False, True])
+
+
+class SyncReplicasTests(SimpleTestCase):
+    def setUp(self):
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        self.root = Path(directory.name)
+
+    def test_copies_primary_to_every_replica(self):
+        primary = sqlite3.connect(self.root / 'primary.sqlite3')
+        primary.executescript("CREATE TABLE django_migrations (id INTEGER);"
+                              "INSERT INTO django_migrations VALUES (1), (2);")
+        primary.close()
+        # A stale replica is overwritten
+        stale = sqlite3.connect(self.root / 'replica2.sqlite3')
+        stale.execute("CREATE TABLE old (id INTEGER)")
+        stale.close()
+        databases = {alias: {'ENGINE': 'django.db.backends.sqlite3', 'NAME': self.root / f'{alias}.sqlite3'}
+                     for alias in ('primary', 'replica1', 'replica2')}
+        databases['default'] = databases.pop('primary')
+        fake_settings = SimpleNamespace(DATABASES=databases, DATABASE_REPLICAS={'replica1': 2, 'replica2': 1})
+        out = StringIO()
+        with mock.patch('products.management.commands.sync_replicas.settings', fake_settings):
+            call_command('sync_replicas', pages=1, stdout=out)
+        self.assertIn('replica1: synced', out.getvalue())
+        for alias in ('replica1', 'replica2'):
+            replica = sqlite3.connect(self.root / f'{alias}.sqlite3')
+            self.assertEqual(replica.execute("SELECT name FROM sqlite_master").fetchall(),
+                             [('django_migrations',)])
+            self.assertEqual(replica.execute("SELECT count(*) FROM django_migrations").fetchone(), (2,))
+            replica.close()
+
+    def test_rejects_other_engines(self):
+        fake_settings = SimpleNamespace(DATABASES={'default': {'ENGINE': 'django.db.backends.postgresql'}},
+                                        DATABASE_REPLICAS={'replica1': 1})
+        with mock.patch('products.management.commands.sync_replicas.settings', fake_settings), \
+                self.assertRaisesMessage(CommandError, 'only supports SQLite'):
+            call_command('sync_replicas', stdout=StringIO())
+
+
+class OpenAPISchemaTests(SimpleTestCase):
+    """The schema routes serve the deploy-time build while the code matches it"""
+
+    documents = {'.json': b'{"paths": {}}', '.yaml': b'paths: {}\n'}
+
+    def setUp(self):
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        self.root = Path(directory.name)
+        settings_override = override_settings(OPENAPI_SCHEMA_ROOT=self.root)
+        settings_override.enable()
+        self.addCleanup(settings_override.disable)
+        # The build command imports code_fingerprint by name
+        for target in ('ecommerce.schema', 'products.management.commands.build_openapi_schema'):
+            fingerprint = mock.patch(f'{target}.code_fingerprint', return_value='code-v1')
+            fingerprint.start()
+            self.addCleanup(fingerprint.stop)
+        schema._load_schema.cache_clear()
+        self.addCleanup(schema._load_schema.cache_clear)
+
+    def build(self, documents=None):
+        with mock.patch('products.management.commands.build_openapi_schema.generate_schema',
+                        return_value=documents or self.documents):
+            call_command('build_openapi_schema', stdout=StringIO())
+
+    def test_build_and_serve(self):
+        # The real generator, once
+        call_command('build_openapi_schema', stdout=StringIO())
+        manifest = json.loads((self.root / 'manifest.json').read_text())
+        self.assertEqual(manifest['fingerprint'], 'code-v1')
+        with mock.patch.object(schema, 'generate_schema') as generate:
+            response = self.client.get('/swagger.json')
+        generate.assert_not_called()
+        self.assertEqual(response['Content-Type'], 'application/json; charset=utf-8')
+        self.assertIn('/products/', json.loads(response.content)['paths'])
+        self.assertEqual(response.content, (self.root / manifest['files']['.json']).read_bytes())
+
+    def test_rebuild_removes_old_files(self):
+        self.build()
+        self.build({'.json': b'{"paths": {"/new/": {}}}', '.yaml': b'paths: {/new/: {}}\n'})
+        manifest = json.loads((self.root / 'manifest.json').read_text())
+        self.assertEqual(sorted(path.name for path in self.root.iterdir()),
+                         sorted(['manifest.json', *manifest['files'].values()]))
+
+    def test_changed_code_generates_in_process(self):
+        self.build()
+        fresh = {'.json': b'{"paths": {"/changed/": {}}}', '.yaml': b'paths: {/changed/: {}}\n'}
+        with mock.patch.object(schema, 'code_fingerprint', return_value='code-v2'), \
+                mock.patch.object(schema, 'generate_schema', return_value=fresh) as generate, \
+                self.assertLogs('ecommerce', 'WARNING'):
+            first = self.client.get('/swagger.json')
+            second = self.client.get('/swagger.yaml')
+        # Once per process
+        generate.assert_called_once()
+        self.assertEqual((first.content, second.content), (fresh['.json'], fresh['.yaml']))
+        self.assertEqual(first['ETag'], f'"{schema.schema_version(fresh)}"')
+
+    def test_etag_revalidation(self):
+        self.build()
+        response = self.client.get('/swagger.json')
+        self.assertEqual(response.content, self.documents['.json'])
+        self.assertEqual(response['ETag'], f'"{schema.schema_version(self.documents)}"')
+        self.assertIn('no-cache', response['Cache-Control'])
+        revalidated = self.client.get('/swagger.json', HTTP_IF_NONE_MATCH=response['ETag'])
+        self.assertEqual((revalidated.status_code, revalidated.content), (304, b''))
+        self.assertEqual(self.client.get('/swagger.json', HTTP_IF_NONE_MATCH='"stale"').status_code, 200)
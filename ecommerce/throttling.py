@@ -0,0 +1,149 @@
+"""
+Per-client, per-scope rate limiting for the API.
+
+GCRAThrottle is a token bucket kept as a single number per key: the
+"theoretical arrival time" (TAT) of the generic cell rate algorithm. A
+rate of N requests per period admits a burst of N, then one request every
+period / N. Each request reads the key's TAT, moves it one interval
+forward and writes it back, so there is no request history to keep and
+no window to clean up, unlike DRF's SimpleRateThrottle.
+
+Views pick a scope with `throttle_scope`, `throttle_scopes` (by viewset
+action) or `get_throttle_scope(request)`. Scopes are rated in
+REST_FRAMEWORK['DEFAULT_THROTTLE_RATES']. Views without a scope, and
+staff with THROTTLE_EXEMPT_STAFF, are not limited. Authenticated clients
+are keyed by user, anonymous ones by address: REMOTE_ADDR, or with
+NUM_PROXIES set, the address the outermost of those proxies appended to
+X-Forwarded-For. Entries further left are whatever the client sent.
+
+Buckets live in this process by default (THROTTLE_CACHE = None), which
+costs a dict update per request but divides nothing between workers: each
+worker admits the full rate. Name a cache alias to share buckets between
+workers at the cost of a get and a set per request; concurrent requests
+for one key may then both be let through.
+"""
+import threading
+import time
+from itertools import islice
+
+from django.conf import settings
+from django.core.cache import caches
+from django.core.signals import setting_changed
+from django.dispatch import receiver
+from rest_framework.settings import api_settings
+from rest_framework.throttling import BaseThrottle
+
+DURATIONS = {'s': 1, 'm': 60, 'h': 3600, 'd': 86400}
+LOCAL_MAX_KEYS = 100000
+
+# key -> TAT. A TAT in the past means a full bucket, the same as no entry,
+# so entries need no expiry: they are swept when the dict fills up
+_buckets = {}
+_lock = threading.Lock()
+_rates = {}  # rate string -> (interval, tolerance)
+_config = {}  # settings read per request, refreshed by setting_changed
+
+
+@receiver(setting_changed)
+def _reload(setting, **kwargs):
+    if setting in ('THROTTLE_CACHE', 'THROTTLE_EXEMPT_STAFF', 'REST_FRAMEWORK'):
+        _config.clear()
+
+
+def _settings():
+    if not _config:
+        _config.update(
+            alias=getattr(settings, 'THROTTLE_CACHE', None),
+            exempt_staff=getattr(settings, 'THROTTLE_EXEMPT_STAFF', True),
+            rates=api_settings.DEFAULT_THROTTLE_RATES,
+            num_proxies=api_settings.NUM_PROXIES or 0,
+        )
+    return _config
+
+
+def parse_rate(rate):
+    """'30/min' -> (seconds between requests, seconds of burst allowance)"""
+    parsed = _rates.get(rate)
+    if parsed is None:
+        count, _, period = rate.partition('/')
+        count = int(count)
+        interval = DURATIONS[period.strip()[0]] / count
+        # A full bucket admits `count` requests at once
+        parsed = _rates[rate] = (interval, interval * (count - 1))
+    return parsed
+
+
+def _sweep(now):
+    """Drop full buckets; if every bucket is in use, the oldest quarter"""
+    for key in [key for key, tat in _buckets.items() if tat <= now]:
+        del _buckets[key]
+    if len(_buckets) >= LOCAL_MAX_KEYS:
+        for key in list(islice(_buckets, LOCAL_MAX_KEYS // 4)):
+            del _buckets[key]
+
+
+def gcra(tat, now, interval, tolerance):
+    """(new TAT, or None when the request is refused; seconds until allowed)"""
+    tat = max(tat or now, now)
+    allowed_at = tat - tolerance
+    if now < allowed_at:
+        return None, allowed_at - now
+    return tat + interval, 0.0
+
+
+class GCRAThrottle(BaseThrottle):
+    def __init__(self):
+        self.wait_seconds = None
+
+    def get_scope(self, request, view):
+        get_scope = getattr(view, 'get_throttle_scope', None)
+        if get_scope is not None:
+            return get_scope(request)
+        scopes = getattr(view, 'throttle_scopes', None)
+        if scopes is not None:
+            return scopes.get(getattr(view, 'action', None))
+        return getattr(view, 'throttle_scope', None)
+
+    def get_ident(self, request):
+        # Unlike DRF's get_ident, an unset NUM_PROXIES does not trust the
+        # whole header, which would give every spoofed value its own bucket
+        meta = request._request.META
+        num_proxies = _settings()['num_proxies']
+        forwarded = meta.get('HTTP_X_FORWARDED_FOR') if num_proxies else None
+        if not forwarded:
+            return meta.get('REMOTE_ADDR')
+        addrs = forwarded.split(',')
+        return addrs[-min(num_proxies, len(addrs))].strip()
+
+    def allow_request(self, request, view):
+        config = _settings()
+        scope = self.get_scope(request, view)
+        rate = config['rates'].get(scope) if scope else None
+        if rate is None:
+            return True
+        user = request.user
+        if user.is_authenticated:
+            if user.is_staff and config['exempt_staff']:
+                return True
+            key = f'throttle:{scope}:u{user.pk}'
+        else:
+            key = f'throttle:{scope}:a{self.get_ident(request)}'
+        interval, tolerance = parse_rate(rate)
+        now = time.time()
+        if config['alias'] is None:
+            with _lock:
+                tat, self.wait_seconds = gcra(_buckets.get(key), now, interval, tolerance)
+                if tat is not None:
+                    if key not in _buckets and len(_buckets) >= LOCAL_MAX_KEYS:
+                        _sweep(now)
+                    _buckets[key] = tat
+        else:
+            cache = caches[config['alias']]
+            tat, self.wait_seconds = gcra(cache.get(key), now, interval, tolerance)
+            if tat is not None:
+                # Expires once the bucket is full again; it then reads as new
+                cache.set(key, tat, timeout=int(tat - now) + 1)
+        return tat is not None
+
+    def wait(self):
+        return self.wait_seconds
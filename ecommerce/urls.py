@@ -17,33 +17,21 @@ Including another URLconf
 from django.contrib import admin
 from django.urls import path
 from django.urls import path, include, re_path
-from rest_framework import permissions
-from drf_yasg.views import get_schema_view
-from drf_yasg import openapi
-
-schema_view = get_schema_view(
-    openapi.Info(
-        title="E-Commerce API",
-        default_version='v1',
-        description="E-Commerce Backend API Documentation",
-        terms_of_service="https://www.example.com/terms/",
-        contact=openapi.Contact(email="api@example.com"),
-        license=openapi.License(name="BSD License"),
-    ),
-    public=True,
-    permission_classes=(permissions.AllowAny,),
-)
+from .schema import lazy_schema_view, schema_document
+from .views import CacheStatsView
 
 urlpatterns = [
     path('admin/', admin.site.urls),
     path('api/auth/', include('users.urls')),  
     path('api/', include('products.urls')),    
+    path('api/wishlist/', include('wishlist.urls')),
     re_path(r'^swagger(?P<format>\.json|\.yaml)$', 
-            schema_view.without_ui(cache_timeout=0), 
+            schema_document, 
             name='schema-json'),
-    path('swagger/', schema_view.with_ui('swagger', cache_timeout=0), 
+    path('swagger/', lazy_schema_view('swagger', cache_timeout=0), 
          name='schema-swagger-ui'),
-    path('redoc/', schema_view.with_ui('redoc', cache_timeout=0), 
+    path('redoc/', lazy_schema_view('redoc', cache_timeout=0), 
          name='schema-redoc'),
     path('api/docs/', include('docs.urls')),
+    path('api/cache/stats/', CacheStatsView.as_view(), name='cache-stats'),
 ]
\ No newline at end of file
@@ -0,0 +1,18 @@
+import os
+
+from rest_framework import permissions
+from rest_framework.response import Response
+from rest_framework.views import APIView
+
+from .cache import stats
+
+
+class CacheStatsView(APIView):
+    """
+    Hit/miss counters per cache namespace. Counters are per process, so
+    this reports the worker that served the request.
+    """
+    permission_classes = [permissions.IsAdminUser]
+
+    def get(self, request):
+        return Response({'pid': os.getpid(), 'namespaces': stats()})
@@ -1,6 +1,9 @@
 from django.contrib import admin
 from django.utils.html import format_html
-from .models import Category, Product, ProductImage, ProductReview
+from django.utils import timezone
+from .models import (Category, Product, ProductImage, ProductReview,
+                     PriceSchedule, PriceHistory, CurrencyRate, LowStockProduct,
+                     StockEvent)
 
 class ProductImageInline(admin.TabularInline):
     model = ProductImage
@@ -74,18 +77,81 @@ class ProductAdmin(admin.ModelAdmin):
 
 @admin.register(ProductReview)
 class ProductReviewAdmin(admin.ModelAdmin):
-    list_display = ['product', 'user', 'rating', 'title', 'is_approved', 'created_at']
-    list_filter = ['is_approved', 'rating', 'created_at']
+    list_display = ['product', 'user', 'rating', 'title', 'is_approved', 'moderation_status', 'created_at']
+    list_filter = ['moderation_status', 'is_approved', 'rating', 'created_at']
     search_fields = ['product__name', 'user__email', 'title', 'content']
-    readonly_fields = ['created_at', 'updated_at']
+    readonly_fields = ['moderation_note', 'moderated_at', 'created_at', 'updated_at']
     actions = ['approve_reviews', 'reject_reviews']
     
     def approve_reviews(self, request, queryset):
-        queryset.update(is_approved=True)
-        self.message_user(request, f"{queryset.count()} reviews approved.")
+        count = queryset.update(is_approved=True, moderation_status='approved',
+                                moderated_at=timezone.now())
+        self.message_user(request, f"{count} reviews approved.")
     approve_reviews.short_description = "Approve selected reviews"
     
     def reject_reviews(self, request, queryset):
-        queryset.update(is_approved=False)
-        self.message_user(request, f"{queryset.count()} reviews rejected.")
+        count = queryset.update(is_approved=False, moderation_status='rejected',
+                                moderated_at=timezone.now())
+        self.message_user(request, f"{count} reviews rejected.")
     reject_reviews.short_description = "Reject selected reviews"
+
+@admin.register(PriceSchedule)
+class PriceScheduleAdmin(admin.ModelAdmin):
+    list_display = ['product', 'price', 'compare_price', 'starts_at', 'ends_at', 'applied_at', 'reverted_at']
+    list_filter = ['starts_at', 'ends_at']
+    search_fields = ['product__name', 'product__sku']
+    raw_id_fields = ['product']
+    readonly_fields = ['applied_at', 'reverted_at', 'previous_price', 'previous_compare_price', 'created_by', 'created_at']
+    
+    def save_model(self, request, obj, form, change):
+        if not change:
+            obj.created_by = request.user
+        super().save_model(request, obj, form, change)
+
+@admin.register(PriceHistory)
+class PriceHistoryAdmin(admin.ModelAdmin):
+    list_display = ['product', 'price', 'compare_price', 'source', 'recorded_at']
+    list_filter = ['source', 'recorded_at']
+    search_fields = ['product__name', 'product__sku']
+    
+    # History is append-only
+    def has_add_permission(self, request):
+        return False
+    
+    def has_change_permission(self, request, obj=None):
+        return False
+    
+    def has_delete_permission(self, request, obj=None):
+        return False
+
+@admin.register(CurrencyRate)
+class CurrencyRateAdmin(admin.ModelAdmin):
+    list_display = ['code', 'rate', 'decimals', 'increment', 'rounding', 'updated_at']
+    search_fields = ['code']
+    readonly_fields = ['updated_at']
+
+@admin.register(LowStockProduct)
+class LowStockProductAdmin(admin.ModelAdmin):
+    list_display = ['product', 'quantity', 'level', 'since']
+    list_filter = ['level']
+    search_fields = ['product__name', 'product__sku']
+    list_select_related = ['product']
+    
+    # Maintained by products.stock; edit the product's quantity instead
+    def has_add_permission(self, request):
+        return False
+    
+    def has_change_permission(self, request, obj=None):
+        return False
+
+@admin.register(StockEvent)
+class StockEventAdmin(admin.ModelAdmin):
+    list_display = ['sku', 'name', 'quantity', 'level', 'previous_level', 'created_at', 'notified_at']
+    list_filter = ['level', 'created_at']
+    search_fields = ['sku', 'name']
+    
+    def has_add_permission(self, request):
+        return False
+    
+    def has_change_permission(self, request, obj=None):
+        return False
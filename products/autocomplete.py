@@ -0,0 +1,408 @@
+"""
+Search-as-you-type suggestions from an in-process prefix trie.
+
+Every word of a published product's name, SKU and category name is a
+token in a character trie. Each trie node keeps the TOP_K most popular
+products among all tokens below it, so a one-word prefix is answered by
+walking len(prefix) nodes and slicing a list. Several words must all
+match the same product: the word with the fewest products below its node
+is expanded and the others are checked against each candidate's tokens.
+Words of four or more letters that match nothing, or too little, also
+match tokens whose prefix is within one edit (two from eight letters),
+found with a Levenshtein walk over the trie that stops at branches
+already too far away.
+
+The index is built on the first request of each process. Product and
+category signals mark changed rows once they commit, and the next request
+reloads just those. Other workers' writes are picked up from the change
+log, read at most every AUTOCOMPLETE_SYNC_INTERVAL seconds. Popularity
+changes are not logged (view tracking writes them in bulk), so the index
+is rebuilt in the background every AUTOCOMPLETE_REBUILD_INTERVAL seconds
+to re-rank.
+"""
+import heapq
+import logging
+import re
+import sys
+import threading
+import time
+import unicodedata
+from array import array
+from itertools import chain
+
+from django.conf import settings
+from django.db import DatabaseError, connections
+
+logger = logging.getLogger('ecommerce')
+
+TOP_K = 20
+DEFAULT_LIMIT = 8
+# Products below a word's node that a multi-word query may check one by one
+SCAN_LIMIT = 500
+SYNC_INTERVAL = getattr(settings, 'AUTOCOMPLETE_SYNC_INTERVAL', 2)
+REBUILD_INTERVAL = getattr(settings, 'AUTOCOMPLETE_REBUILD_INTERVAL', 600)
+MEMO_MAX_ENTRIES = 10000
+LOAD_CHUNK = 500
+
+WORD_RE = re.compile(r'[^\W_]+')
+
+_lock = threading.RLock()
+_state = {'index': None, 'rebuilding': False}
+_dirty = {'products': set(), 'categories': set()}
+
+
+def words(text):
+    """Lowercased words of `text` with accents dropped: 'Café-Noir' -> ['cafe', 'noir']"""
+    text = unicodedata.normalize('NFKD', text or '')
+    return WORD_RE.findall(''.join(char for char in text if not unicodedata.combining(char)).lower())
+
+
+def max_distance(word):
+    if len(word) >= 8:
+        return 2
+    return 1 if len(word) >= 4 else 0
+
+
+# Shared by every leaf until it gets a child; only Index._path adds children
+_NO_CHILDREN = {}
+
+
+class _Node:
+    __slots__ = ('children', 'ids', 'top', 'count')
+
+    def __init__(self):
+        self.children = _NO_CHILDREN
+        self.ids = None   # array of the products with a token ending here
+        self.top = []     # best TOP_K products at or below this node
+        self.count = 0    # (token, product) pairs at or below this node
+
+
+class Index:
+    def __init__(self):
+        self.root = _Node()
+        self.root.children = {}
+        self.products = {}    # id -> (name, slug, sku, category name, category id, tokens)
+        self.scores = {}      # id -> popularity
+        self.by_category = {}  # category id -> set of product ids
+        self.cursor = 0
+        self.synced_at = time.monotonic()
+        self.built_at = time.monotonic()
+        self.memo = {}
+        self.pending = {}  # id(node) -> (depth, node, products added, products added or removed)
+
+    # -- building and updating -------------------------------------------------
+
+    def _rank(self, pk):
+        return (self.scores[pk], -pk)
+
+    def _path(self, token):
+        node, path = self.root, [self.root]
+        for char in token:
+            child = node.children.get(char)
+            if child is None:
+                if node.children is _NO_CHILDREN:
+                    node.children = {}
+                child = node.children[char] = _Node()
+            node = child
+            path.append(node)
+        return path
+
+    def _touch(self, path, pk, added):
+        """Note that `pk` left or joined every node on `path`, for _finish()"""
+        for depth, node in enumerate(path):
+            entry = self.pending.get(id(node))
+            if entry is None:
+                entry = self.pending[id(node)] = (depth, node, set(), set())
+            entry[3].add(pk)
+            if added:
+                entry[2].add(pk)
+
+    def _add(self, pk, name, slug, sku, category_id, category, popularity, track=True):
+        # Interned: a common word is one string however many products use it
+        tokens = tuple(sorted(map(sys.intern, set(words(name)) | set(words(sku)) | set(words(category)))))
+        self.products[pk] = (name, slug, sku, category, category_id, tokens)
+        self.scores[pk] = popularity
+        self.by_category.setdefault(category_id, set()).add(pk)
+        for token in tokens:
+            path = self._path(token)
+            leaf = path[-1]
+            if leaf.ids is None:
+                leaf.ids = array('q')
+            leaf.ids.append(pk)
+            for node in path:
+                node.count += 1
+            if track:
+                self._touch(path, pk, added=True)
+
+    def _remove(self, pk):
+        if pk not in self.products:
+            return
+        category_id, tokens = self.products.pop(pk)[4:]
+        del self.scores[pk]
+        self.by_category[category_id].discard(pk)
+        for token in tokens:
+            path = self._path(token)
+            path[-1].ids.remove(pk)
+            for node in path:
+                node.count -= 1
+            self._touch(path, pk, added=False)
+
+    def _finish(self):
+        """Refresh the tops of the nodes products left or joined, deepest first"""
+        for depth, node, added, touched in sorted(self.pending.values(), key=lambda entry: -entry[0]):
+            if touched.isdisjoint(node.top):
+                # The top's products are all still here with the same scores
+                node.top = heapq.nlargest(TOP_K, added.union(node.top), key=self._rank)
+            else:
+                candidates = set(chain(node.ids or (), *(child.top for child in node.children.values())))
+                node.top = heapq.nlargest(TOP_K, candidates, key=self._rank)
+        self.pending.clear()
+        self.memo.clear()
+
+    def load(self, rows):
+        """Replace the products in `rows` (id, name, slug, sku, category id, category name, popularity)"""
+        for row in rows:
+            self._remove(row[0])
+            self._add(*row)
+        self._finish()
+
+    def discard(self, pks):
+        for pk in pks:
+            self._remove(pk)
+        self._finish()
+
+    def build(self, rows):
+        """Fill an empty index, computing every node's top once"""
+        for row in rows:
+            self._add(*row, track=False)
+        # Post-order over the whole trie, without recursion
+        stack = [(self.root, False)]
+        while stack:
+            node, expanded = stack.pop()
+            if expanded:
+                candidates = set(chain(node.ids or (), *(child.top for child in node.children.values())))
+                node.top = heapq.nlargest(TOP_K, candidates, key=self._rank)
+            else:
+                stack.append((node, True))
+                stack.extend((child, False) for child in node.children.values())
+
+    # -- lookups ----------------------------------------------------------------
+
+    def payload(self, pk):
+        name, slug, sku, category = self.products[pk][:4]
+        return {'id': pk, 'name': name, 'slug': slug, 'sku': sku, 'category': category}
+
+    def _exact(self, word):
+        node = self.root
+        for char in word:
+            node = node.children.get(char)
+            if node is None:
+                return None
+        return node
+
+    def _fuzzy(self, word, distance):
+        """[(node, prefix)] of trie prefixes within `distance` edits of `word`, same first letter"""
+        found = []
+        # Typos in the first letter are rare, and allowing them would walk most of the trie
+        start = self.root.children.get(word[0])
+        if start is None:
+            return found
+        size, far = len(word), distance + 1
+        # Levenshtein rows of the prefix against word[:i], capped at `far`. Only
+        # the cells within `distance` of the diagonal can ever be close enough
+        empty = [min(i, far) for i in range(size + 1)]
+        stack = [(start, word[0], empty, word[0])]
+        while stack:
+            node, char, previous, prefix = stack.pop()
+            depth = len(prefix)
+            row = [far] * (size + 1)
+            if depth <= distance:
+                row[0] = depth
+            best = row[0]
+            for i in range(max(1, depth - distance), min(size, depth + distance) + 1):
+                cost = previous[i - 1] if word[i - 1] == char else previous[i - 1] + 1
+                if row[i - 1] + 1 < cost:
+                    cost = row[i - 1] + 1
+                if previous[i] + 1 < cost:
+                    cost = previous[i] + 1
+                if cost < far:
+                    row[i] = cost
+                    if cost < best:
+                        best = cost
+            if row[size] <= distance:
+                # The whole subtree starts with a close enough prefix
+                found.append((node, prefix))
+            elif best <= distance:
+                stack.extend((child, next_char, row, prefix + next_char)
+                             for next_char, child in node.children.items())
+        return found
+
+    def _matches(self, word, wanted):
+        """[(node, prefix)] for `word`: its own node first, plus typo matches if that has too few"""
+        node = self._exact(word)
+        matches = [(node, word)] if node is not None else []
+        if node is None or node.count < wanted:
+            # Closest first: two edits only when one finds nothing
+            for distance in range(1, max_distance(word) + 1):
+                fuzzy = [match for match in self._fuzzy(word, distance) if match[0] is not node]
+                if fuzzy:
+                    matches += fuzzy
+                    break
+        return matches
+
+    def _subtree(self, node):
+        ids, stack = set(), [node]
+        while stack:
+            node = stack.pop()
+            if node.ids:
+                ids.update(node.ids)
+            stack.extend(node.children.values())
+        return ids
+
+    def search(self, query, limit=DEFAULT_LIMIT):
+        """Up to `limit` suggestion payloads for `query`, most popular first"""
+        query_words = words(query)
+        if not query_words:
+            return []
+        key = (tuple(query_words), limit)
+        found = self.memo.get(key)
+        if found is not None:
+            return found
+
+        # With several words, typos are only looked for in words that match nothing
+        wanted = limit if len(query_words) == 1 else 1
+        matches = [self._matches(word, wanted) for word in query_words]
+        if not all(matches):
+            ranked = []
+        elif len(matches) == 1:
+            ranked = self._best(query_words[0], matches[0], limit)
+        else:
+            ranked = self._intersect(matches, limit)
+        found = [self.payload(pk) for pk in ranked]
+        if len(self.memo) >= MEMO_MAX_ENTRIES:
+            self.memo.clear()
+        self.memo[key] = found
+        return found
+
+    def _best(self, word, matches, limit):
+        """One word: products under its own node first, then under typo matches"""
+        ranked = []
+        if matches[0][1] == word:
+            ranked = matches[0][0].top[:limit]
+            matches = matches[1:]
+        if len(ranked) < limit and matches:
+            fuzzy = set(chain(*(node.top for node, _ in matches))).difference(ranked)
+            ranked = ranked + heapq.nlargest(limit - len(ranked), fuzzy, key=self._rank)
+        return ranked
+
+    def _intersect(self, matches, limit):
+        """Several words: expand the most selective one, check the others per candidate"""
+        matches = sorted(matches, key=lambda word_matches: sum(node.count for node, _ in word_matches))
+        driver = matches[0]
+        others = [tuple(prefix for _, prefix in word_matches) for word_matches in matches[1:]]
+        if sum(node.count for node, _ in driver) <= SCAN_LIMIT:
+            candidates = set().union(*(self._subtree(node) for node, _ in driver))
+        else:
+            # Too many to check: the most popular ones will do for a suggestion
+            candidates = set(chain(*(node.top for node, _ in driver)))
+        candidates = [
+            pk for pk in candidates
+            if all(any(token.startswith(prefixes) for token in self.products[pk][5]) for prefixes in others)
+        ]
+        return heapq.nlargest(limit, candidates, key=self._rank)
+
+
+def _rows(queryset):
+    # Unordered: the default ordering would sort the whole catalog for the build
+    return queryset.order_by().values_list('id', 'name', 'slug', 'sku', 'category_id', 'category__name', 'popularity')
+
+
+def build():
+    """A new index of every published product, synced up to the latest change log entry"""
+    from .models import ChangeLogEntry, Product
+
+    index = Index()
+    # Read before loading, so changes made meanwhile are synced again rather than missed
+    index.cursor = ChangeLogEntry.objects.order_by('-seq').values_list('seq', flat=True).first() or 0
+    index.build(_rows(Product.objects.published()).iterator(chunk_size=5000))
+    return index
+
+
+def _reload(index, product_ids=(), category_ids=()):
+    """Reload products and categories by id; unpublished or deleted products are dropped"""
+    from .models import Product
+
+    product_ids, category_ids = set(product_ids), set(category_ids)
+    for category_id in category_ids:
+        product_ids |= index.by_category.get(category_id, set())
+    rows = []
+    ids = list(product_ids)
+    for start in range(0, len(ids), LOAD_CHUNK):
+        rows += _rows(Product.objects.published().filter(id__in=ids[start:start + LOAD_CHUNK]))
+    if category_ids:
+        # Products moved into a changed category, e.g. by a rename, are reloaded too
+        rows += _rows(Product.objects.published().filter(category_id__in=category_ids)
+                      .exclude(id__in=product_ids))
+    index.discard(product_ids - {row[0] for row in rows})
+    index.load(rows)
+
+
+def _sync(index):
+    """Apply changes logged by every process since the index's cursor"""
+    from .changelog import changes_after
+
+    while True:
+        entries, cursor = changes_after(index.cursor, model_names=['product', 'category'])
+        if not entries:
+            break
+        _reload(index,
+                [entry['object_id'] for entry in entries if entry['model'] == 'product'],
+                [entry['object_id'] for entry in entries if entry['model'] == 'category'])
+        index.cursor = cursor
+    index.synced_at = time.monotonic()
+
+
+def _rebuild_in_background():
+    try:
+        index = build()
+        with _lock:
+            _state['index'] = index
+    except DatabaseError:
+        logger.exception('Rebuilding the autocomplete index failed')
+    finally:
+        _state['rebuilding'] = False
+        # This thread's DB connections would otherwise never be closed
+        connections.close_all()
+
+
+def suggest(query, limit=DEFAULT_LIMIT):
+    """Suggestion payloads for `query`; builds or refreshes this process's index as needed"""
+    with _lock:
+        index = _state['index']
+        if index is None:
+            index = _state['index'] = build()
+        if _dirty['products'] or _dirty['categories']:
+            products, categories = set(_dirty['products']), set(_dirty['categories'])
+            _dirty['products'].clear()
+            _dirty['categories'].clear()
+            _reload(index, products, categories)
+        now = time.monotonic()
+        if now - index.synced_at >= SYNC_INTERVAL:
+            _sync(index)
+        if now - index.built_at >= REBUILD_INTERVAL and not _state['rebuilding']:
+            _state['rebuilding'] = True
+            threading.Thread(target=_rebuild_in_background, daemon=True).start()
+        return index.search(query, limit)
+
+
+def products_changed(pks):
+    """Signals: reload these products on the next lookup (if this process has an index)"""
+    if _state['index'] is not None:
+        with _lock:
+            _dirty['products'].update(pks)
+
+
+def categories_changed(pks):
+    if _state['index'] is not None:
+        with _lock:
+            _dirty['categories'].update(pks)
@@ -0,0 +1,241 @@
+"""
+Bulk product writes for staff (POST /api/products/bulk/).
+
+    {"create": [{...product fields...}],
+     "update": [{"sku": "HW-1", "price": "9.99"}, {"slug": "x", "quantity": 0}],
+     "delete": [{"sku": "HW-2"}],
+     "atomic": true}
+
+Items are validated in one pass: per-item field validation never touches
+the database, and products, categories, skus and slugs are each looked
+up once for the whole batch. Writes happen in one transaction: deletes
+first (freeing their skus and slugs), then one bulk_update over only the
+fields that changed, then one bulk_create. Change log entries and cache
+invalidations are written once for the batch.
+
+With "atomic": true (the default) any invalid item fails the whole batch
+and nothing is written; with false the valid items are applied.
+"""
+from django.db import transaction
+from django.db.models import Q
+from django.utils import timezone
+from django.utils.text import slugify
+from rest_framework import status
+
+from . import cache as product_cache
+from . import changelog
+from .models import Category, PriceHistory, Product
+from .serializers import ProductBulkItemSerializer
+
+MAX_ITEMS = 1000
+KEYS = ('sku', 'slug')
+
+
+class BulkProductWrite:
+    def __init__(self, data, user):
+        self.data = data
+        self.user = user
+        self.results = {'create': [], 'update': [], 'delete': []}
+
+    def error(self, kind, index, errors):
+        result = self.results[kind][index]
+        if result is None:
+            result = self.results[kind][index] = {'index': index, 'status': 'error', 'errors': {}}
+        result['errors'].update(errors)
+
+    def run(self):
+        """(http status, response body)"""
+        if not isinstance(self.data, dict):
+            return status.HTTP_400_BAD_REQUEST, {'detail': 'Expected an object with create, update and/or delete lists.'}
+        items = {kind: self.data.get(kind, []) for kind in self.results}
+        if not all(isinstance(value, list) for value in items.values()):
+            return status.HTTP_400_BAD_REQUEST, {'detail': 'create, update and delete must be lists.'}
+        if sum(len(value) for value in items.values()) > MAX_ITEMS:
+            return status.HTTP_400_BAD_REQUEST, {'detail': f'At most {MAX_ITEMS} items per request.'}
+        for kind, value in items.items():
+            self.results[kind] = [None] * len(value)
+
+        creates = self.validate_creates(items['create'])
+        updates = self.validate_updates(items['update'])
+        deletes = self.validate_keys('delete', items['delete'])
+        self.resolve(updates, deletes)
+        self.check_skus(creates, updates, deletes)
+        self.check_categories(creates, updates)
+
+        failed = any(r is not None and r['status'] == 'error'
+                     for results in self.results.values() for r in results)
+        if failed and self.data.get('atomic', True):
+            for kind, results in self.results.items():
+                for index, result in enumerate(results):
+                    if result is None:
+                        results[index] = {'index': index, 'status': 'valid'}
+            return status.HTTP_400_BAD_REQUEST, self.body(written=False)
+
+        valid = lambda kind, pending: [p for p in pending if self.results[kind][p[0]] is None]
+        self.write(valid('create', creates), valid('update', updates), valid('delete', deletes))
+        return status.HTTP_200_OK, self.body(written=True)
+
+    def body(self, written):
+        counts = {}
+        for kind, results in self.results.items():
+            for result in results:
+                if result is not None:
+                    counts[result['status']] = counts.get(result['status'], 0) + 1
+        return {'written': written, 'counts': counts, 'results': self.results}
+
+    # -- validation ----------------------------------------------------------
+
+    def validate_creates(self, items):
+        pending = []
+        for index, item in enumerate(items):
+            serializer = ProductBulkItemSerializer(data=item)
+            if serializer.is_valid():
+                pending.append((index, serializer.validated_data))
+            else:
+                self.error('create', index, serializer.errors)
+        return pending
+
+    def validate_keys(self, kind, items):
+        """[(index, key field, key value, rest of the item)] for items naming a sku or slug"""
+        pending = []
+        for index, item in enumerate(items):
+            if not isinstance(item, dict) or not any(item.get(key) for key in KEYS):
+                self.error(kind, index, {'non_field_errors': ['Identify the product by sku or slug.']})
+                continue
+            field = next(key for key in KEYS if item.get(key))
+            rest = {k: v for k, v in item.items() if k != field}
+            pending.append((index, field, str(item[field]), rest))
+        return pending
+
+    def validate_updates(self, items):
+        pending = []
+        for index, field, key, rest in self.validate_keys('update', items):
+            # slug is never written; sku is written only when the item is keyed by slug
+            rest.pop('slug', None)
+            serializer = ProductBulkItemSerializer(data=rest, partial=True)
+            if serializer.is_valid():
+                pending.append((index, field, key, serializer.validated_data))
+            else:
+                self.error('update', index, serializer.errors)
+        return pending
+
+    def resolve(self, updates, deletes):
+        """Look every keyed product up in one query; each may appear once"""
+        skus = {key for _, field, key, _ in updates + deletes if field == 'sku'}
+        slugs = {key for _, field, key, _ in updates + deletes if field == 'slug'}
+        products = {}
+        if skus or slugs:
+            for product in Product.objects.filter(Q(sku__in=skus) | Q(slug__in=slugs)):
+                products[('sku', product.sku)] = product
+                products[('slug', product.slug)] = product
+        seen = set()
+        for kind, pending in (('update', updates), ('delete', deletes)):
+            for position, (index, field, key, data) in enumerate(pending):
+                product = products.get((field, key))
+                if product is None:
+                    self.error(kind, index, {field: ['No product with this value.']})
+                elif product.pk in seen:
+                    self.error(kind, index, {field: ['Product appears more than once in the batch.']})
+                else:
+                    seen.add(product.pk)
+                    pending[position] = (index, product, data)
+        # Drop the unresolved ones so later checks only see products
+        updates[:] = [p for p in updates if isinstance(p[1], Product)]
+        deletes[:] = [p for p in deletes if isinstance(p[1], Product)]
+
+    def check_skus(self, creates, updates, deletes):
+        """New skus must be unique in the batch and among the remaining products"""
+        deleted = {product.pk for _, product, _ in deletes}
+        claims = [('create', index, data['sku'], None) for index, data in creates]
+        claims += [('update', index, data['sku'], product.pk)
+                   for index, product, data in updates
+                   if 'sku' in data and data['sku'] != product.sku]
+        if not claims:
+            return
+        taken = dict(Product.objects.filter(
+            sku__in={sku for _, _, sku, _ in claims}
+        ).exclude(pk__in=deleted).values_list('sku', 'pk'))
+        for kind, index, sku, pk in claims:
+            if sku in taken and taken[sku] != pk:
+                self.error(kind, index, {'sku': ['product with this sku already exists.']})
+            else:
+                taken[sku] = pk or ('new', index)
+
+    def check_categories(self, creates, updates):
+        wanted = [('create', index, data) for index, data in creates]
+        wanted += [('update', index, data) for index, _, data in updates]
+        ids = {data['category_id'] for _, _, data in wanted if 'category_id' in data}
+        existing = set(Category.objects.filter(id__in=ids).values_list('id', flat=True)) if ids else set()
+        for kind, index, data in wanted:
+            if 'category_id' in data and data['category_id'] not in existing:
+                self.error(kind, index, {'category_id': [
+                    f'Invalid pk "{data["category_id"]}" - object does not exist.'
+                ]})
+
+    # -- writing -------------------------------------------------------------
+
+    def write(self, creates, updates, deletes):
+        now = timezone.now()
+        history = []
+        with transaction.atomic(), changelog.batch(), product_cache.batch_invalidations():
+            if deletes:
+                Product.objects.filter(pk__in=[product.pk for _, product, _ in deletes]).delete()
+                for index, product, _ in deletes:
+                    self.results['delete'][index] = {'index': index, 'status': 'deleted',
+                                                     'id': product.pk, 'sku': product.sku,
+                                                     'slug': product.slug}
+
+            changed_products, changed_fields = [], set()
+            for index, product, data in updates:
+                fields = [name for name, value in data.items() if getattr(product, name) != value]
+                for name in fields:
+                    setattr(product, name, data[name])
+                if fields:
+                    product.updated_at = now
+                    changed_products.append(product)
+                    changed_fields.update(fields)
+                    if {'price', 'compare_price'} & set(fields):
+                        history.append(PriceHistory(product=product, price=product.price,
+                                                    compare_price=product.compare_price,
+                                                    source=PriceHistory.SOURCE_MANUAL,
+                                                    recorded_at=now))
+                self.results['update'][index] = {
+                    'index': index, 'status': 'updated' if fields else 'unchanged',
+                    'id': product.pk, 'sku': product.sku, 'slug': product.slug, 'fields': fields,
+                }
+            if changed_products:
+                # Only the columns some item actually changed
+                Product.objects.bulk_update(changed_products, sorted(changed_fields) + ['updated_at'])
+
+            new_products = [Product(created_by=self.user, **data) for _, data in creates]
+            self.assign_slugs(new_products)
+            Product.objects.bulk_create(new_products)
+            for (index, _), product in zip(creates, new_products):
+                history.append(PriceHistory(product=product, price=product.price,
+                                            compare_price=product.compare_price,
+                                            source=PriceHistory.SOURCE_MANUAL, recorded_at=now))
+                self.results['create'][index] = {'index': index, 'status': 'created',
+                                                 'id': product.pk, 'sku': product.sku,
+                                                 'slug': product.slug}
+            PriceHistory.objects.bulk_create(history)
+
+    def assign_slugs(self, products):
+        """Same slugs Product.save() would pick, with one query for the batch"""
+        bases = [slugify(product.name) or slugify(product.sku) for product in products]
+        taken = set(Product.objects.filter(slug__in=bases).values_list('slug', flat=True))
+        probed = set()
+        for product, base in zip(products, bases):
+            slug = base
+            if slug in taken:
+                # Find the next free suffix like Product.save() does, one query per name
+                if base not in probed:
+                    probed.add(base)
+                    taken |= set(Product.objects.filter(
+                        slug__startswith=f'{base}-'
+                    ).values_list('slug', flat=True))
+                counter = 1
+                while f'{base}-{counter}' in taken:
+                    counter += 1
+                slug = f'{base}-{counter}'
+            taken.add(slug)
+            product.slug = slug
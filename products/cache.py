@@ -0,0 +1,229 @@
+"""
+Cache of serialized product detail payloads, keyed by product id, on top
+of the project's two-tier cache (ecommerce.cache).
+
+Each entry is tagged with the versions of what it was built from: the
+product itself (bumped when the product, its images or its reviews
+change) and its category. Invalidation bumps a version instead of
+deleting keys, so renaming a category is one cache write however many
+products it holds, and bulk changes bump a single catalog-wide version
+(invalidate_all). Reads compare the tags with the current versions and
+never serve a stale entry, which is also why entries may stay in the
+in-process tier for their whole lifetime.
+
+Rebuilds are coalesced: concurrent misses for the same product, in this
+process or another, wait for the one rebuild in progress.
+
+Bulk writes wrap themselves in batch_invalidations() so each product or
+category is invalidated once, after the transaction commits. Single
+saves go through it as well: a version bumped before the commit would
+let a concurrent reader cache the old row under the new version.
+Deletes open one batch for every row they remove, cascades included.
+"""
+import itertools
+import time
+from contextlib import contextmanager
+from contextvars import ContextVar
+
+from django.conf import settings
+from django.core.cache import cache
+from django.db import transaction
+
+from ecommerce.cache import TieredCache
+
+PRODUCT_CACHE_TIMEOUT = 60 * 60
+# A version that expires is recreated with a new token, which only costs
+# rebuilding the entries tagged with it; without a TTL the version keys of
+# every product ever cached would pile up in the shared tier
+VERSION_TIMEOUT = 24 * 60 * 60
+# Invalidating more products than this at once bumps the catalog version instead
+BULK_INVALIDATION_THRESHOLD = 200
+
+entries = TieredCache('products', timeout=PRODUCT_CACHE_TIMEOUT,
+                      local_ttl=getattr(settings, 'PRODUCT_CACHE_LOCAL_TTL', PRODUCT_CACHE_TIMEOUT))
+slugs = TieredCache('product-slugs', timeout=PRODUCT_CACHE_TIMEOUT)
+
+_tokens = itertools.count()
+_batch = ContextVar('product_cache_batch', default=None)
+
+
+def detail_key(product_id):
+    return f'detail:{product_id}'
+
+
+def version_key(kind, pk):
+    return f'version:{kind}:{pk}'
+
+
+def _new_token():
+    # Unique across processes and restarts, so an evicted-and-recreated
+    # version can never match an entry tagged before the eviction
+    return f'{time.time_ns():x}.{next(_tokens)}'
+
+
+def _versions(kind, pks):
+    """Current version tokens for `pks`, creating any that are missing"""
+    # Versions are the invalidation signal, so they always come from the shared tier
+    keys = {pk: version_key(kind, pk) for pk in pks if pk is not None}
+    found = cache.get_many(keys.values())
+    versions = {}
+    for pk, key in keys.items():
+        if key not in found:
+            cache.add(key, _new_token(), timeout=VERSION_TIMEOUT)
+            found[key] = cache.get(key)
+        versions[pk] = found[key]
+    return versions
+
+
+def _catalog_version():
+    return _versions('catalog', ['all'])['all']
+
+
+def _category_id(payload):
+    category = payload.get('category')
+    return category.get('id') if isinstance(category, dict) else category
+
+
+def _read(ids, product_versions, catalog_version):
+    found = entries.get_many([detail_key(pk) for pk in ids])
+    found = {pk: found[detail_key(pk)] for pk in ids if detail_key(pk) in found}
+    category_versions = _versions('category', {e['category'] for e in found.values()})
+    return {
+        pk: entry['data'] for pk, entry in found.items()
+        if entry['product_version'] == product_versions.get(pk)
+        and entry['category_version'] == category_versions.get(entry['category'])
+        and entry.get('catalog_version') == catalog_version
+    }
+
+
+def _store(payloads, product_versions, catalog_version):
+    categories = {pk: _category_id(data) for pk, data in payloads.items()}
+    category_versions = _versions('category', set(categories.values()))
+    entries.set_many({
+        detail_key(pk): {
+            'data': data,
+            'category': categories[pk],
+            'product_version': product_versions.get(pk),
+            'category_version': category_versions.get(categories[pk]),
+            'catalog_version': catalog_version,
+        } for pk, data in payloads.items()
+    })
+
+
+def get_or_build(ids, build):
+    """
+    Payloads for `ids` as {id: payload}. Misses are rebuilt with
+    `build(ids) -> {id: payload}`; ids it does not return are left out.
+    """
+    ids = list(dict.fromkeys(ids))
+    # Versions are read before building so a change that lands during the
+    # rebuild leaves the new entry already out of date rather than stale
+    product_versions = _versions('product', ids)
+    catalog_version = _catalog_version()
+    found = _read(ids, product_versions, catalog_version)
+    missing = [pk for pk in ids if pk not in found]
+    if not missing:
+        return found
+
+    mine = [pk for pk in missing if entries.acquire(detail_key(pk))]
+    theirs = [pk for pk in missing if pk not in set(mine)]
+    try:
+        if mine:
+            fresh = build(mine)
+            _store(fresh, product_versions, catalog_version)
+            found.update(fresh)
+    finally:
+        for pk in mine:
+            entries.release(detail_key(pk))
+
+    leftover = []
+    for pk in theirs:
+        payload = entries.wait(detail_key(pk),
+                               lambda pk=pk: _read([pk], product_versions, catalog_version).get(pk))
+        if payload is None:
+            leftover.append(pk)
+        else:
+            found[pk] = payload
+    if leftover:
+        fresh = build(leftover)
+        _store(fresh, product_versions, catalog_version)
+        found.update(fresh)
+    return found
+
+
+def id_for_slug(slug):
+    return slugs.get(slug)
+
+
+def remember_slug(slug, product_id):
+    slugs.set(slug, product_id)
+
+
+def forget_slug(*slug_list):
+    slug_list = [slug for slug in slug_list if slug]
+    pending = _batch.get()
+    if pending is not None:
+        pending['slugs'].update(slug_list)
+        return
+    slugs.delete_many(slug_list)
+
+
+def invalidate_products(product_ids):
+    """Bump the version of each product so its cached payload is rebuilt"""
+    product_ids = list(product_ids)
+    pending = _batch.get()
+    if pending is not None:
+        pending['products'].update(product_ids)
+        return
+    if len(product_ids) > BULK_INVALIDATION_THRESHOLD:
+        # One write instead of thousands (bulk imports, mass updates)
+        invalidate_all()
+        return
+    cache.set_many({version_key('product', pk): _new_token() for pk in product_ids},
+                   timeout=VERSION_TIMEOUT)
+
+
+def invalidate_category(category_id):
+    """Every product payload nesting this category becomes stale"""
+    pending = _batch.get()
+    if pending is not None:
+        pending['categories'].add(category_id)
+        return
+    cache.set(version_key('category', category_id), _new_token(), timeout=VERSION_TIMEOUT)
+
+
+@contextmanager
+def batch_invalidations(using=None):
+    """Collect the invalidations of the block and apply each once, on commit"""
+    if _batch.get() is not None:
+        yield
+        return
+    pending = {'products': set(), 'categories': set(), 'slugs': set(), 'all': False}
+    token = _batch.set(pending)
+    try:
+        yield
+    finally:
+        _batch.reset(token)
+    transaction.on_commit(lambda: _apply(pending), using=using)
+
+
+def _apply(pending):
+    if pending['slugs']:
+        slugs.delete_many(list(pending['slugs']))
+    if pending['all'] or len(pending['products']) > BULK_INVALIDATION_THRESHOLD:
+        cache.set(version_key('catalog', 'all'), _new_token(), timeout=VERSION_TIMEOUT)
+    elif pending['products']:
+        cache.set_many({version_key('product', pk): _new_token() for pk in pending['products']},
+                       timeout=VERSION_TIMEOUT)
+    if pending['categories']:
+        cache.set_many({version_key('category', pk): _new_token()
+                        for pk in pending['categories']}, timeout=VERSION_TIMEOUT)
+
+
+def invalidate_all():
+    """Every cached product payload becomes stale"""
+    pending = _batch.get()
+    if pending is not None:
+        pending['all'] = True
+        return
+    cache.set(version_key('catalog', 'all'), _new_token(), timeout=VERSION_TIMEOUT)
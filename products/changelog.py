@@ -0,0 +1,196 @@
+"""
+Append-only change log (CDC) for the catalog models.
+
+Every insert, update and delete of a Product, Category, ProductImage or
+ProductReview appends a ChangeLogEntry in the same transaction as the
+change. That covers:
+
+* save() and delete(), through ChangeLoggedModel and the delete signals
+  (which also fire for cascades; a delete writes its entries in one go),
+* queryset update(), bulk_update() and bulk_create(), through
+  ChangeLoggedQuerySet, which is what the admin actions and the
+  management commands use.
+
+Entries carry a sequence number that only grows. Consumers keep the last
+sequence they processed and ask for what came after it (changes_after or
+GET /api/changes/?after=). compact() drops entries superseded by a newer
+one for the same object, which keeps the log short without ever hiding
+the latest change from a consumer.
+
+Inside `with changelog.batch():` entries and rows_changed signals are
+collected and written once when the block ends, which is what bulk
+writes use.
+"""
+from collections import defaultdict
+from contextlib import contextmanager
+from contextvars import ContextVar
+
+from django.apps import apps
+from django.db import models, router, transaction
+from django.db.models import Exists, OuterRef
+from django.dispatch import Signal
+from django.utils import timezone
+
+from . import cache as product_cache
+
+ACTION_UPSERT = 'upsert'
+ACTION_DELETE = 'delete'
+
+# Sent once the transaction of a queryset update()/bulk_create() commits,
+# with the primary keys it touched; save() and delete() keep using
+# post_save/post_delete
+rows_changed = Signal()
+
+LOG_BATCH_SIZE = 1000
+
+_batch = ContextVar('changelog_batch', default=None)
+
+
+def _entry_model():
+    return apps.get_model('products', 'ChangeLogEntry')
+
+
+def record(model, pks, action=ACTION_UPSERT, using=None, sku=''):
+    """Append one entry per primary key; call inside the changing transaction"""
+    pending = _batch.get()
+    if pending is not None:
+        pending['entries'].append((model, action, using, list(pks), sku))
+        return
+    _write([(model, action, pks, sku)], using)
+
+
+def _write(groups, using):
+    entry = _entry_model()
+    entry.objects.using(using).bulk_create(
+        [entry(model=model._meta.model_name, object_id=pk, action=action, sku=sku)
+         for model, action, pks, sku in groups for pk in pks],
+        batch_size=LOG_BATCH_SIZE,
+    )
+
+
+def _changed(model, pks, using=None):
+    pending = _batch.get()
+    if pending is not None:
+        pending['changed'][model].extend(pks)
+        return
+    transaction.on_commit(lambda: rows_changed.send(sender=model, pks=pks), using=using)
+
+
+@contextmanager
+def batch(using=None):
+    """
+    Collect the change log entries and rows_changed signals of the block
+    and write them in one go at the end (call inside the transaction).
+    Nested blocks join the outer one.
+    """
+    if _batch.get() is not None:
+        yield
+        return
+    pending = {'entries': [], 'changed': defaultdict(list)}
+    token = _batch.set(pending)
+    try:
+        yield
+    finally:
+        _batch.reset(token)
+    # Entries keep the order the changes happened in
+    by_db = defaultdict(list)
+    for model, action, db, pks, sku in pending['entries']:
+        by_db[db].append((model, action, pks, sku))
+    for db, groups in by_db.items():
+        _write(groups, db)
+    for model, pks in pending['changed'].items():
+        _changed(model, pks, using=using)
+
+
+class ChangeLoggedQuerySet(models.QuerySet):
+    def update(self, **kwargs):
+        ignored = getattr(self.model, 'CHANGELOG_IGNORED_FIELDS', ())
+        if set(kwargs) <= set(ignored):
+            # Bookkeeping columns (e.g. view counts) are not changes
+            return super().update(**kwargs)
+        now = timezone.now()
+        for field in self.model._meta.concrete_fields:
+            # update() skips auto_now fields; "changed since" readers such as
+            # the product feed deltas would miss these rows
+            if getattr(field, 'auto_now', False) and field.name not in kwargs:
+                kwargs[field.name] = now
+        with transaction.atomic(using=self.db, savepoint=False):
+            # Read the keys first: the update may change the filtered columns
+            pks = list(self.values_list('pk', flat=True))
+            rows = super().update(**kwargs)
+            record(self.model, pks, using=self.db)
+            _changed(self.model, pks, using=self.db)
+        return rows
+    update.alters_data = True
+
+    def bulk_create(self, objs, *args, **kwargs):
+        with transaction.atomic(using=self.db, savepoint=False):
+            objs = super().bulk_create(objs, *args, **kwargs)
+            pks = [obj.pk for obj in objs if obj.pk is not None]
+            record(self.model, pks, using=self.db)
+            _changed(self.model, pks, using=self.db)
+        return objs
+    bulk_create.alters_data = True
+
+    def delete(self):
+        # Every deleted row, cascades included, sends post_delete: write its
+        # change log entries and cache invalidations once, not per row
+        with transaction.atomic(using=self.db, savepoint=False), batch(using=self.db), \
+                product_cache.batch_invalidations(self.db):
+            return super().delete()
+    delete.alters_data = True
+    delete.queryset_only = True
+
+
+class ChangeLoggedModel(models.Model):
+    """Makes save() and its change log entry one transaction"""
+
+    class Meta:
+        abstract = True
+
+    def save(self, *args, **kwargs):
+        using = kwargs.get('using') or router.db_for_write(type(self), instance=self)
+        with transaction.atomic(using=using, savepoint=False):
+            super().save(*args, **kwargs)
+            record(type(self), [self.pk], using=using)
+
+    def delete(self, using=None, keep_parents=False):
+        using = using or router.db_for_write(type(self), instance=self)
+        with transaction.atomic(using=using, savepoint=False), batch(using=using), \
+                product_cache.batch_invalidations(using):
+            return super().delete(using=using, keep_parents=keep_parents)
+
+
+def record_delete(instance, using):
+    """post_delete runs inside the deletion's transaction, cascades included"""
+    record(type(instance), [instance.pk], ACTION_DELETE, using=using, sku=getattr(instance, 'sku', ''))
+
+
+def changes_after(cursor=0, limit=500, model_names=None):
+    """Entries with seq > cursor, oldest first, plus the cursor to resume from"""
+    entries = _entry_model().objects.filter(seq__gt=cursor).order_by('seq')
+    if model_names:
+        entries = entries.filter(model__in=model_names)
+    entries = list(entries.values('seq', 'model', 'object_id', 'action', 'changed_at')[:limit])
+    next_cursor = entries[-1]['seq'] if entries else cursor
+    return entries, next_cursor
+
+
+def compact(batch_size=5000):
+    """
+    Delete entries superseded by a newer entry for the same object, one
+    seq window per transaction. Returns the number of entries removed.
+    """
+    entry = _entry_model()
+    bounds = entry.objects.aggregate(low=models.Min('seq'), high=models.Max('seq'))
+    if bounds['low'] is None:
+        return 0
+    newer = entry.objects.filter(model=OuterRef('model'), object_id=OuterRef('object_id'),
+                                 seq__gt=OuterRef('seq'))
+    removed = 0
+    for start in range(bounds['low'], bounds['high'] + 1, batch_size):
+        with transaction.atomic():
+            removed += entry.objects.filter(
+                seq__gte=start, seq__lt=start + batch_size
+            ).filter(Exists(newer)).delete()[0]
+    return removed
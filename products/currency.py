@@ -0,0 +1,181 @@
+"""
+Product prices in other currencies, for ?currency= on the product
+endpoints.
+
+Prices are stored in settings.BASE_CURRENCY with two decimals. The
+CurrencyRate table holds the rate to each other currency and that
+currency's minor unit and rounding rule. convert_payloads() converts a
+whole page at once. Every price on the page is parsed to base-currency
+cents. One numpy integer operation then multiplies them all by the rate,
+held as an exact fraction, and rounds them by the currency's rule. There
+is no Decimal arithmetic per field, and halves are rounded by the rule,
+never by float error.
+
+The table is loaded once per process for each rate version. Saving a
+rate bumps the version in the shared cache, and every worker reloads on
+its next request. Converted amounts are memoized per currency and rate
+version, so a page converted before costs only dictionary lookups.
+"""
+import math
+import time
+
+from django.conf import settings
+from django.core.cache import cache
+from rest_framework.exceptions import ValidationError
+
+PRICE_FIELDS = ('price', 'compare_price', 'cost_price')
+# Product price fields have decimal_places=2
+BASE_DECIMALS = 2
+VERSION_KEY = 'currency:rates:version'
+# Memoized conversions per currency, cleared when full
+MEMO_MAX_ENTRIES = 50000
+# int64 headroom for cents * numerator (and twice the remainder)
+INT64_LIMIT = 2 ** 62
+
+# ISO 4217 minor units other than 2, for rates created without one
+MINOR_UNITS = {
+    'BHD': 3, 'CLP': 0, 'IQD': 3, 'ISK': 0, 'JOD': 3, 'JPY': 0, 'KRW': 0,
+    'KWD': 3, 'LYD': 3, 'OMR': 3, 'PYG': 0, 'TND': 3, 'UGX': 0, 'VND': 0,
+}
+
+_table = (None, {})  # (rate version, {code: Rate})
+
+
+class Rate:
+    """Conversion from base-currency cents to one currency's rounded minor units"""
+
+    def __init__(self, code, rate, decimals=2, increment=1, rounding='half_even'):
+        self.code = code
+        self.decimals = decimals
+        self.increment = increment
+        self.rounding = rounding
+        # units = cents * rate * 10**decimals / 10**BASE_DECIMALS, counted in increments
+        numerator, denominator = rate.as_integer_ratio()
+        numerator *= 10 ** decimals
+        denominator *= 10 ** BASE_DECIMALS * increment
+        divisor = math.gcd(numerator, denominator)
+        self.numerator = numerator // divisor
+        self.denominator = denominator // divisor
+        # Zero-padded minor units, '00' to '99' for two decimals
+        self.fractions = [f'{n:0{decimals}d}' for n in range(10 ** decimals)]
+        self.memo = {}
+
+    def convert(self, cents):
+        """Formatted prices for a sequence of non-negative base-currency cents"""
+        import numpy as np
+
+        values = np.asarray(cents, dtype=np.int64)
+        largest = int(values.max()) if values.size else 0
+        if max(largest, 1) * self.numerator >= INT64_LIMIT or self.denominator >= INT64_LIMIT:
+            # Huge amounts or rate precision: exact Python integers, same operations
+            values = values.astype(object)
+        scaled = values * self.numerator
+        # Not np.divmod, which has no loop for object arrays
+        quotient, remainder = scaled // self.denominator, scaled % self.denominator
+        if self.rounding == 'half_even':
+            twice = remainder * 2
+            quotient += (twice > self.denominator) | (
+                (twice == self.denominator) & (quotient % 2 == 1))
+        elif self.rounding == 'half_up':
+            quotient += remainder * 2 >= self.denominator
+        elif self.rounding == 'up':
+            quotient += remainder > 0
+        units = quotient * self.increment
+        if not self.decimals:
+            return [str(whole) for whole in units.tolist()]
+        scale = 10 ** self.decimals
+        fractions = self.fractions
+        return [f'{whole}.{fractions[fraction]}'
+                for whole, fraction in zip((units // scale).tolist(), (units % scale).tolist())]
+
+    def convert_amounts(self, amounts):
+        """Formatted prices in this currency for base-currency price strings"""
+        memo = self.memo
+        found = {}
+        missing = []
+        for amount in set(amounts):
+            value = memo.get(amount)
+            if value is None:
+                missing.append(amount)
+            else:
+                found[amount] = value
+        if missing:
+            fresh = dict(zip(missing, self.convert(_parse_cents(missing))))
+            if len(memo) + len(fresh) > MEMO_MAX_ENTRIES:
+                memo.clear()
+            memo.update(fresh)
+            found.update(fresh)
+        return [found[amount] for amount in amounts]
+
+
+def _parse_cents(amounts):
+    if all(amount[-3:-2] == '.' for amount in amounts):
+        # As rendered by DRF, with exactly two decimals: one split, no per-item parsing
+        return list(map(int, ' '.join(amounts).replace('.', '').split()))
+    return [_cents(amount) for amount in amounts]
+
+
+def _cents(amount):
+    whole, _, fraction = str(amount).partition('.')
+    return int(whole) * 100 + int((fraction + '00')[:BASE_DECIMALS])
+
+
+def _new_token():
+    return f'{time.time_ns():x}'
+
+
+def rates_version():
+    # Read from the shared tier so every worker sees a rate change at once
+    version = cache.get(VERSION_KEY)
+    if version is None:
+        cache.add(VERSION_KEY, _new_token(), timeout=None)
+        version = cache.get(VERSION_KEY)
+    return version
+
+
+def invalidate_rates():
+    """Every process reloads the rate table on its next conversion"""
+    cache.set(VERSION_KEY, _new_token(), timeout=None)
+
+
+def rates():
+    """{code: Rate} for the current rate version, the base currency included"""
+    global _table
+    version = rates_version()
+    if _table[0] != version:
+        from .models import CurrencyRate
+
+        # The version is read first, so a change during the load triggers another
+        table = {settings.BASE_CURRENCY: Rate(settings.BASE_CURRENCY, 1)}
+        for row in CurrencyRate.objects.using('default'):
+            table[row.code] = Rate(row.code, row.rate, row.decimals, row.increment, row.rounding)
+        _table = (version, table)
+    return _table[1]
+
+
+def requested(request):
+    """Rate for the request's ?currency=, or None; unsupported codes are a 400"""
+    code = request.query_params.get('currency', '').strip().upper()
+    if not code:
+        return None
+    table = rates()
+    if code not in table:
+        raise ValidationError({'currency': [
+            f"Unsupported currency '{code}'. Available: {', '.join(sorted(table))}."
+        ]})
+    return table[code]
+
+
+def convert_payloads(payloads, rate):
+    """
+    Copies of serialized products with their prices in `rate`'s currency
+    and a `currency` field. The originals may be shared cache entries and
+    are left alone.
+    """
+    converted = [{**payload, 'currency': rate.code} for payload in payloads]
+    slots = [(payload, field) for payload in converted for field in PRICE_FIELDS
+             if payload.get(field) is not None]
+    amounts = rate.convert_amounts([payload[field] for payload, field in slots])
+    for (payload, field), amount in zip(slots, amounts):
+        payload[field] = amount
+    return converted
@@ -0,0 +1,149 @@
+"""
+Whole-catalog product feeds (JSON lines, CSV, Google Shopping RSS) for
+partners. Rows are read with a narrow values() query and a server-side
+iterator and written as they arrive, so memory does not grow with the
+catalog.
+
+Without `since` the feed holds every published product. With `since`
+it is a delta: every product updated after that moment, whatever its
+status, so partners can drop products that were unpublished. Those are
+sent as tombstones carrying only TOMBSTONE_COLUMNS, since drafts and
+archived products are not public. Products deleted after `since` are
+tombstones with status "deleted", read from the change log.
+"""
+import csv
+import heapq
+import json
+from operator import itemgetter
+from xml.sax.saxutils import escape
+
+from django.conf import settings
+from django.db.models import F, OuterRef, Subquery
+from django.urls import reverse
+
+from .changelog import ACTION_DELETE
+from .models import ChangeLogEntry, Product, ProductImage
+
+CHUNK_SIZE = 2000
+FLUSH_ROWS = 200  # rows joined per chunk written to the response
+
+COLUMNS = ['id', 'sku', 'slug', 'name', 'description', 'price', 'compare_price',
+           'quantity', 'status', 'category', 'image', 'link', 'updated_at']
+TOMBSTONE_COLUMNS = ['id', 'sku', 'status']
+
+CONTENT_TYPES = {
+    'jsonl': 'application/x-ndjson',
+    'csv': 'text/csv; charset=utf-8',
+    'xml': 'application/rss+xml; charset=utf-8',
+}
+
+
+def feed_rows(since=None, base_url='', chunk_size=CHUNK_SIZE):
+    """Feed rows as dicts, oldest update first; unpublished ones as tombstones"""
+    default_image = ProductImage.objects.filter(product=OuterRef('pk')).order_by(
+        '-is_default', 'created_at'
+    ).values('image')[:1]
+    queryset = Product.objects.all() if since else Product.objects.published()
+    if since:
+        queryset = queryset.filter(updated_at__gt=since)
+    rows = queryset.order_by('updated_at', 'id').values(
+        'id', 'sku', 'slug', 'name', 'description', 'price', 'compare_price',
+        'quantity', 'status', 'updated_at',
+        category_name=F('category__name'), image=Subquery(default_image),
+    ).iterator(chunk_size=chunk_size)
+    if since:
+        # In time order, so a SKU deleted and then re-created ends up live
+        rows = heapq.merge(rows, _deleted_rows(since, chunk_size), key=itemgetter('updated_at'))
+
+    detail_url = reverse('product-detail', kwargs={'slug': '__slug__'})
+    for row in rows:
+        if row['status'] != 'published':
+            yield {name: row[name] for name in TOMBSTONE_COLUMNS}
+            continue
+        row['category'] = row.pop('category_name')
+        row['link'] = base_url + detail_url.replace('__slug__', row['slug'])
+        if row['image']:
+            row['image'] = base_url + settings.MEDIA_URL + row['image']
+        yield row
+
+
+def _deleted_rows(since, chunk_size):
+    entries = ChangeLogEntry.objects.filter(
+        model='product', action=ACTION_DELETE, changed_at__gt=since,
+    ).order_by('changed_at', 'seq').values_list('object_id', 'sku', 'changed_at').iterator(
+        chunk_size=chunk_size)
+    for pk, sku, changed_at in entries:
+        yield {'id': pk, 'sku': sku, 'status': 'deleted', 'updated_at': changed_at}
+
+
+def _chunked(lines):
+    buffer = []
+    for line in lines:
+        buffer.append(line)
+        if len(buffer) >= FLUSH_ROWS:
+            yield ''.join(buffer)
+            buffer = []
+    if buffer:
+        yield ''.join(buffer)
+
+
+def _jsonl(rows):
+    for row in rows:
+        yield json.dumps({name: row[name] for name in COLUMNS if name in row},
+                         default=str, separators=(',', ':')) + '\n'
+
+
+class _Line:
+    """File-like object csv.writer writes a single line into"""
+
+    def write(self, value):
+        return value
+
+
+def _csv(rows):
+    writer = csv.writer(_Line())
+    yield writer.writerow(COLUMNS)
+    for row in rows:
+        yield writer.writerow([row.get(name, '') for name in COLUMNS])
+
+
+def _xml(rows):
+    currency = getattr(settings, 'FEED_CURRENCY', 'USD')
+    yield ('<?xml version="1.0" encoding="UTF-8"?>\n'
+           '<rss version="2.0" xmlns:g="http://base.google.com/ns/1.0">\n'
+           '<channel><title>E-Commerce catalog</title>'
+           '<description>Published products</description>\n')
+    for row in rows:
+        if row['status'] != 'published':
+            if not row['sku']:
+                # Deleted before the change log kept SKUs; the id means nothing here
+                continue
+            yield (f'<item><g:id>{escape(row["sku"])}</g:id>'
+                   '<g:availability>out_of_stock</g:availability></item>\n')
+            continue
+        available = row['quantity'] > 0
+        on_sale = row['compare_price'] is not None and row['compare_price'] > row['price']
+        fields = [
+            ('g:id', row['sku']),
+            ('title', row['name']),
+            ('description', row['description']),
+            ('link', row['link']),
+            ('g:image_link', row['image']),
+            ('g:price', f"{row['compare_price'] if on_sale else row['price']} {currency}"),
+            ('g:sale_price', f"{row['price']} {currency}" if on_sale else None),
+            ('g:availability', 'in_stock' if available else 'out_of_stock'),
+            ('g:product_type', row['category']),
+            ('g:condition', 'new'),
+        ]
+        yield '<item>' + ''.join(
+            f'<{tag}>{escape(str(value))}</{tag}>' for tag, value in fields if value
+        ) + '</item>\n'
+    yield '</channel></rss>\n'
+
+
+WRITERS = {'jsonl': _jsonl, 'csv': _csv, 'xml': _xml}
+
+
+def render_feed(fmt, since=None, base_url='', chunk_size=CHUNK_SIZE):
+    """The feed as an iterator of text chunks"""
+    return _chunked(WRITERS[fmt](feed_rows(since, base_url, chunk_size)))
@@ -0,0 +1,124 @@
+from django.core.management.base import BaseCommand
+from django.db import transaction
+from django.utils import timezone
+from django.utils.dateparse import parse_datetime
+from products.models import Product, PriceSchedule, PriceHistory
+
+
+class Command(BaseCommand):
+    help = "Apply due price schedules and revert expired ones in batched updates"
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=500,
+                            help='Products written per transaction')
+        parser.add_argument('--at', type=str, default=None,
+                            help='ISO timestamp to evaluate schedules at (default: now)')
+        parser.add_argument('--dry-run', action='store_true',
+                            help='Report what would change without writing')
+
+    def handle(self, *args, **options):
+        now = timezone.now()
+        if options['at']:
+            now = parse_datetime(options['at'])
+            if now is None:
+                self.stderr.write(self.style.ERROR(f"Invalid --at value: {options['at']}"))
+                return
+            if timezone.is_naive(now):
+                now = timezone.make_aware(now)
+        batch_size = options['batch_size']
+
+        # Products with a schedule starting or ending are the only ones we touch
+        product_ids = set(
+            PriceSchedule.objects.due(now).values_list('product_id', flat=True)
+        ) | set(
+            PriceSchedule.objects.expired(now).values_list('product_id', flat=True)
+        )
+        product_ids = sorted(product_ids)
+
+        if options['dry_run']:
+            self.stdout.write(f"{len(product_ids)} products have price changes due")
+            return
+
+        started = reverted = kept = 0
+        for i in range(0, len(product_ids), batch_size):
+            s, r, k = self.apply_batch(product_ids[i:i + batch_size], now)
+            started += s
+            reverted += r
+            kept += k
+
+        self.stdout.write(self.style.SUCCESS(
+            f"{started} schedules started, {reverted} products reverted to base price, "
+            f"{kept} manual price edits kept"
+        ))
+
+    @transaction.atomic
+    def apply_batch(self, product_ids, now):
+        products = Product.objects.only('id', 'price', 'compare_price').in_bulk(product_ids)
+
+        # The schedule currently written to each product (at most one)
+        current = {
+            s.product_id: s for s in PriceSchedule.objects.filter(
+                product_id__in=product_ids,
+                applied_at__isnull=False, reverted_at__isnull=True,
+            )
+        }
+        # The schedule that should be effective now: latest start wins
+        target = {}
+        for s in PriceSchedule.objects.active(now).filter(
+            product_id__in=product_ids
+        ).order_by('product_id', 'starts_at'):
+            target[s.product_id] = s
+
+        changed_products, changed_schedules, history = [], [], []
+        started = reverted = kept = 0
+        for product_id, product in products.items():
+            cur = current.get(product_id)
+            new = target.get(product_id)
+            if cur is not None and new is not None and cur.pk == new.pk:
+                continue
+
+            # Base price is whatever the product had before any schedule
+            prices = (product.price, product.compare_price)
+            if cur is not None:
+                cur.reverted_at = now
+                changed_schedules.append(cur)
+                if prices == (cur.price, cur.compare_price):
+                    base = (cur.previous_price, cur.previous_compare_price)
+                else:
+                    # Edited by hand during the sale: that price is the base now
+                    base = prices
+            else:
+                base = prices
+
+            if new is not None:
+                new.applied_at = now
+                new.reverted_at = None
+                new.previous_price, new.previous_compare_price = base
+                changed_schedules.append(new)
+                product.price, product.compare_price = new.price, new.compare_price
+                source = PriceHistory.SOURCE_SCHEDULE
+                started += 1
+            elif base == prices:
+                kept += 1
+                continue
+            else:
+                product.price, product.compare_price = base
+                source = PriceHistory.SOURCE_REVERT
+                reverted += 1
+
+            product.updated_at = now
+            changed_products.append(product)
+            history.append(PriceHistory(
+                product_id=product_id, price=product.price,
+                compare_price=product.compare_price, source=source,
+                schedule=new, recorded_at=now,
+            ))
+
+        Product.objects.bulk_update(changed_products,
+                                    ['price', 'compare_price', 'updated_at'])
+        PriceSchedule.objects.bulk_update(
+            changed_schedules,
+            ['applied_at', 'reverted_at', 'previous_price', 'previous_compare_price'],
+        )
+        PriceHistory.objects.bulk_create(history)
+        return started, reverted, kept
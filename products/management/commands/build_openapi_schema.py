@@ -0,0 +1,43 @@
+import json
+from pathlib import Path
+
+from django.conf import settings
+from django.core.management.base import BaseCommand
+from ecommerce.schema import (MANIFEST_NAME, code_fingerprint, generate_schema,
+                              schema_version)
+
+
+class Command(BaseCommand):
+    help = ("Generate the OpenAPI schema once (run at deploy time) and write it "
+            "as versioned JSON and YAML files served by /swagger.json and /swagger.yaml")
+
+    def add_arguments(self, parser):
+        parser.add_argument('--output', type=str, default=None,
+                            help='Target directory (default: OPENAPI_SCHEMA_ROOT)')
+
+    def handle(self, *args, **options):
+        root = Path(options['output'] or settings.OPENAPI_SCHEMA_ROOT)
+        root.mkdir(parents=True, exist_ok=True)
+
+        documents = generate_schema()
+        version = schema_version(documents)
+        files = {fmt: f'openapi.{version}{fmt}' for fmt in documents}
+        for fmt, name in files.items():
+            (root / name).write_bytes(documents[fmt])
+
+        # The manifest goes last so readers never see it point at missing files
+        manifest = {'version': version, 'fingerprint': code_fingerprint(), 'files': files}
+        tmp = root / f'{MANIFEST_NAME}.tmp'
+        tmp.write_text(json.dumps(manifest, indent=2))
+        tmp.replace(root / MANIFEST_NAME)
+
+        removed = 0
+        for path in root.glob('openapi.*'):
+            if path.name not in files.values():
+                path.unlink()
+                removed += 1
+
+        self.stdout.write(self.style.SUCCESS(
+            f"Wrote OpenAPI schema {version} ({len(documents['.json']) // 1024} KB JSON) "
+            f"to {root}; removed {removed} old files"
+        ))
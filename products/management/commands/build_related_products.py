@@ -0,0 +1,234 @@
+import math
+import re
+import time
+import zlib
+
+from django.core.management.base import BaseCommand, CommandError
+from django.db import transaction
+from django.utils import timezone
+from products.models import Product, ProductReview, RelatedProducts
+
+TOKEN_RE = re.compile(r'[a-z0-9]+')
+
+# Share of the final score each signal can contribute; every signal is
+# scaled to [0, 1] first
+WEIGHTS = {
+    'category': 0.30,
+    'price': 0.15,
+    'text': 0.25,
+    'reviews': 0.30,
+}
+
+
+class Command(BaseCommand):
+    help = ("Precompute the top-K related products of every published product "
+            "from category, price band, name tokens and co-reviews")
+
+    def add_arguments(self, parser):
+        parser.add_argument('--top-k', type=int, default=12)
+        parser.add_argument('--block-size', type=int, default=2000,
+                            help='Products scored per sparse matrix product')
+        parser.add_argument('--price-bands', type=int, default=20,
+                            help='Log-price quantile bands per category')
+        parser.add_argument('--hash-bits', type=int, default=20,
+                            help='Name tokens are hashed into 2**bits columns')
+        parser.add_argument('--max-token-share', type=float, default=0.01,
+                            help='Ignore tokens in more than this share of products')
+        parser.add_argument('--max-user-reviews', type=int, default=500,
+                            help='Ignore reviewers with more reviews than this')
+        parser.add_argument('--batch-size', type=int, default=5000,
+                            help='Rows per bulk insert')
+
+    def handle(self, *args, **options):
+        try:
+            import numpy as np
+            from scipy import sparse
+        except ImportError:
+            raise CommandError("build_related_products needs numpy and scipy "
+                               "(pip install -r requirements.txt)")
+        self.np, self.sparse = np, sparse
+        self.verbosity = options['verbosity']
+        started = time.perf_counter()
+
+        ids, categories, prices, names = self.load_products()
+        n = len(ids)
+        if n < 2:
+            self.stdout.write("Not enough published products to relate")
+            return
+        self.log(f"Loaded {n} products")
+
+        content = sparse.hstack([
+            self.category_features(categories) * math.sqrt(WEIGHTS['category']),
+            self.price_features(categories, prices, options['price_bands'])
+            * math.sqrt(WEIGHTS['price']),
+            self.text_features(names, options['hash_bits'], options['max_token_share'])
+            * math.sqrt(WEIGHTS['text']),
+        ]).tocsr()
+        items = self.review_features(ids, options['max_user_reviews'])
+        self.log(f"Features built: {content.nnz} content, {items.nnz} review entries")
+
+        neighbors = self.top_k(content, items, options['top_k'], options['block_size'])
+        written = self.store(ids, neighbors, options['batch_size'])
+        self.stdout.write(self.style.SUCCESS(
+            f"Stored related products for {written} products "
+            f"in {time.perf_counter() - started:.1f}s"
+        ))
+
+    def log(self, message):
+        if self.verbosity > 1:
+            self.stdout.write(f"  {message}")
+
+    # -- loading -----------------------------------------------------------
+
+    def load_products(self):
+        np = self.np
+        rows = Product.objects.published().order_by('id').values_list(
+            'id', 'category_id', 'price', 'name'
+        ).iterator(chunk_size=20000)
+        ids, categories, prices, names = [], [], [], []
+        for pk, category_id, price, name in rows:
+            ids.append(pk)
+            categories.append(category_id or 0)
+            prices.append(float(price))
+            names.append(name)
+        return (np.array(ids, dtype=np.int64), np.array(categories, dtype=np.int64),
+                np.array(prices, dtype=np.float64), names)
+
+    # -- features ----------------------------------------------------------
+    # Each builder returns an n x m CSR matrix whose rows have unit norm, so
+    # row-by-row dot products are similarities in [0, 1].
+
+    def one_hot(self, columns, width, values=None):
+        np, sparse = self.np, self.sparse
+        n = len(columns)
+        values = np.ones(n) if values is None else values
+        return sparse.csr_matrix((values, (np.arange(n), columns)), shape=(n, width))
+
+    def category_features(self, categories):
+        np = self.np
+        # Products without a category (0) must not all match each other
+        _, columns = np.unique(categories, return_inverse=True)
+        values = (categories != 0).astype(np.float64)
+        return self.one_hot(columns, columns.max() + 1, values)
+
+    def price_features(self, categories, prices, bands):
+        """Price band within the category; neighbouring bands count half"""
+        np, sparse = self.np, self.sparse
+        n = len(prices)
+        log_price = np.log1p(prices)
+        edges = np.quantile(log_price, np.linspace(0, 1, bands + 1)[1:-1])
+        band = np.searchsorted(edges, log_price)
+        _, category = np.unique(categories, return_inverse=True)
+        rows, cols, vals = [], [], []
+        for offset, weight in ((0, 1.0), (-1, 0.5), (1, 0.5)):
+            neighbour = band + offset
+            ok = (neighbour >= 0) & (neighbour < bands) & (categories != 0)
+            rows.append(np.arange(n)[ok])
+            cols.append(category[ok] * bands + neighbour[ok])
+            vals.append(np.full(ok.sum(), weight))
+        matrix = sparse.csr_matrix(
+            (np.concatenate(vals), (np.concatenate(rows), np.concatenate(cols))),
+            shape=(n, (category.max() + 1) * bands),
+        )
+        return self.normalize_rows(matrix)
+
+    def text_features(self, names, bits, max_share):
+        """TF-IDF over hashed name tokens, ignoring near-universal tokens"""
+        np = self.np
+        width = 1 << bits
+        rows, cols = [], []
+        for row, name in enumerate(names):
+            for token in set(TOKEN_RE.findall(name.lower())):
+                rows.append(row)
+                cols.append(zlib.crc32(token.encode()) & (width - 1))
+        n = len(names)
+        matrix = self.sparse.csr_matrix(
+            (np.ones(len(rows)), (np.array(rows, dtype=np.int64), np.array(cols, dtype=np.int64))),
+            shape=(n, width),
+        )
+        matrix.data[:] = 1.0  # hash collisions within a name count once
+        df = np.bincount(matrix.indices, minlength=width)
+        idf = np.log((1 + n) / (1 + df)) + 1
+        idf[df > max(50, max_share * n)] = 0
+        matrix = matrix @ self.sparse.diags(idf)
+        matrix.eliminate_zeros()
+        return self.normalize_rows(matrix)
+
+    def review_features(self, ids, max_user_reviews):
+        """
+        Item vectors over reviewers: product i and j are similar when the
+        same people review both. Prolific reviewers are damped, and bots
+        above max_user_reviews ignored. Returns an (n x users) matrix.
+        """
+        np, sparse = self.np, self.sparse
+        pairs = ProductReview.objects.filter(
+            product__status='published'
+        ).values_list('product_id', 'user_id').iterator(chunk_size=50000)
+        flat = np.fromiter((v for pair in pairs for v in pair), dtype=np.int64)
+        n = len(ids)
+        if not len(flat):
+            return sparse.csr_matrix((n, 1))
+        product_ids, user_ids = flat[0::2], flat[1::2]
+        rows = np.searchsorted(ids, product_ids)
+        _, users = np.unique(user_ids, return_inverse=True)
+        degree = np.bincount(users)
+        keep = degree[users] <= max_user_reviews
+        weights = 1 / np.log2(1 + degree[users[keep]])
+        matrix = sparse.csr_matrix((weights, (rows[keep], users[keep])),
+                                   shape=(n, degree.size))
+        matrix.sum_duplicates()
+        return self.normalize_rows(matrix)
+
+    def normalize_rows(self, matrix):
+        np = self.np
+        norms = np.sqrt(np.asarray(matrix.multiply(matrix).sum(axis=1)).ravel())
+        norms[norms == 0] = 1
+        return (self.sparse.diags(1 / norms) @ matrix).tocsr()
+
+    # -- scoring -----------------------------------------------------------
+
+    def top_k(self, content, items, k, block_size):
+        """Row-blocked X @ X.T, keeping the k best columns of every row"""
+        np = self.np
+        n = content.shape[0]
+        content_t = content.T.tocsc()
+        items_t = items.T.tocsc()
+        neighbors = np.full((n, k), -1, dtype=np.int64)
+        for start in range(0, n, block_size):
+            stop = min(start + block_size, n)
+            scores = (content[start:stop] @ content_t
+                      + WEIGHTS['reviews'] * (items[start:stop] @ items_t)).tocoo()
+            keep = (scores.col != scores.row + start) & (scores.data > 0)
+            row, col, data = scores.row[keep], scores.col[keep], scores.data[keep]
+
+            # Sort every row by score (ties by id for determinism) and keep
+            # the first k entries, without a Python loop over rows
+            order = np.lexsort((col, -data, row))
+            row, col = row[order], col[order]
+            rank = np.arange(row.size) - np.searchsorted(row, row)
+            keep = rank < k
+            neighbors[start + row[keep], rank[keep]] = col[keep]
+            self.log(f"Scored {stop}/{n}")
+        return neighbors
+
+    # -- storage -----------------------------------------------------------
+
+    def store(self, ids, neighbors, batch_size):
+        now = timezone.now()
+        written = 0
+        with transaction.atomic():
+            RelatedProducts.objects.all().delete()
+            batch = []
+            for pk, row in zip(ids.tolist(), neighbors):
+                related = ids[row[row >= 0]].tolist()
+                if not related:
+                    continue
+                batch.append(RelatedProducts(product_id=pk, computed_at=now,
+                                             neighbors=RelatedProducts.pack(related)))
+                if len(batch) >= batch_size:
+                    RelatedProducts.objects.bulk_create(batch)
+                    written += len(batch)
+                    batch = []
+            RelatedProducts.objects.bulk_create(batch)
+            written += len(batch)
+        return written
@@ -0,0 +1,14 @@
+from django.core.management.base import BaseCommand
+from products.changelog import compact
+
+
+class Command(BaseCommand):
+    help = "Drop change log entries superseded by a newer entry for the same object"
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=5000,
+                            help='Sequence numbers scanned per transaction')
+
+    def handle(self, *args, **options):
+        removed = compact(options['batch_size'])
+        self.stdout.write(self.style.SUCCESS(f"Removed {removed} superseded entries"))
@@ -0,0 +1,16 @@
+from django.core.cache import caches
+from django.core.management.base import BaseCommand
+
+
+class Command(BaseCommand):
+    help = "Delete expired entries from the file caches, and random ones from any still at MAX_ENTRIES"
+
+    def handle(self, *args, **options):
+        for alias in caches.settings:
+            backend = caches[alias]
+            if not hasattr(backend, 'cull'):
+                # Redis and the in-memory backends evict by themselves
+                self.stdout.write(f"{alias}: nothing to cull")
+                continue
+            removed = backend.cull()
+            self.stdout.write(self.style.SUCCESS(f"{alias}: removed {removed} entries"))
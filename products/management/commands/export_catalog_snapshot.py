@@ -0,0 +1,210 @@
+import gzip
+import json
+import os
+from pathlib import Path
+
+from django.conf import settings
+from django.core.management.base import BaseCommand
+from django.core.serializers.json import DjangoJSONEncoder
+from django.db.models import Q
+from django.utils import timezone
+from products.models import Category, Product
+from products.pagination import StandardResultsSetPagination
+from products.serializers import ProductSerializer
+
+try:
+    import brotli
+except ImportError:  # brotli is optional, gzip is always written
+    brotli = None
+
+MANIFEST_NAME = 'manifest.json'
+
+
+class Command(BaseCommand):
+    help = ("Render the published catalog as precompressed static JSON "
+            "(category tree, per-category list pages, product details)")
+
+    def add_arguments(self, parser):
+        parser.add_argument('--output', type=str, default=None,
+                            help='Target directory (default: CATALOG_SNAPSHOT_ROOT)')
+        parser.add_argument('--full', action='store_true',
+                            help='Ignore the previous manifest and rewrite everything')
+        parser.add_argument('--page-size', type=int,
+                            default=StandardResultsSetPagination.page_size)
+        parser.add_argument('--chunk-size', type=int, default=500)
+
+    def handle(self, *args, **options):
+        self.root = Path(options['output'] or settings.CATALOG_SNAPSHOT_ROOT)
+        self.root.mkdir(parents=True, exist_ok=True)
+        self.written = 0
+        page_size = options['page_size']
+
+        previous = {} if options['full'] else self.load_manifest()
+        if previous.get('page_size') != page_size:
+            previous = {}
+        old_products = previous.get('products', {})
+        old_categories = previous.get('categories', {})
+
+        categories = list(Category.objects.filter(is_active=True).order_by('name'))
+        category_stamps = {c.slug: c.updated_at.isoformat() for c in categories}
+        changed_categories = {
+            slug for slug, stamp in category_stamps.items()
+            if old_categories.get(slug, {}).get('updated_at') != stamp
+        }
+
+        # One light query decides what needs re-rendering
+        products = {}
+        for pk, slug, category_slug, updated_at in Product.objects.published().filter(
+            Q(category__isnull=True) | Q(category__is_active=True)
+        ).values_list('id', 'slug', 'category__slug', 'updated_at').iterator():
+            products[str(pk)] = {
+                'slug': slug,
+                'category': category_slug,
+                'updated_at': updated_at.isoformat(),
+            }
+
+        stale_ids = [
+            int(pk) for pk, entry in products.items()
+            if old_products.get(pk) != entry or entry['category'] in changed_categories
+        ]
+        removed = {pk: entry for pk, entry in old_products.items() if pk not in products}
+        for pk in stale_ids:
+            changed_categories.add(products[str(pk)]['category'])
+            old = old_products.get(str(pk))
+            if old:
+                changed_categories.add(old['category'])
+        for entry in removed.values():
+            changed_categories.add(entry['category'])
+            self.remove(Path('products') / f"{entry['slug']}.json")
+        for pk in stale_ids:
+            old = old_products.get(str(pk))
+            if old and old['slug'] != products[str(pk)]['slug']:
+                self.remove(Path('products') / f"{old['slug']}.json")
+
+        # Product details
+        queryset = Product.objects.filter(id__in=stale_ids).for_catalog()
+        for product in queryset.iterator(chunk_size=options['chunk_size']):
+            self.write(Path('products') / f'{product.slug}.json',
+                       ProductSerializer(product).data)
+
+        # Category list pages, only for categories whose membership or content moved
+        category_manifest = {}
+        for category in categories:
+            entry = old_categories.get(category.slug)
+            if category.slug not in changed_categories and entry:
+                category_manifest[category.slug] = entry
+                continue
+            count = self.write_category_pages(category, page_size,
+                                              options['chunk_size'],
+                                              (entry or {}).get('pages', 0))
+            category_manifest[category.slug] = {
+                'updated_at': category_stamps[category.slug],
+                'count': count,
+                'pages': max(1, -(-count // page_size)),
+            }
+        for slug, entry in old_categories.items():
+            if slug not in category_manifest:
+                for page in range(1, entry.get('pages', 0) + 1):
+                    self.remove(Path('categories') / slug / f'page-{page}.json')
+
+        self.write('categories.json', self.category_tree(categories, category_manifest))
+
+        self.write(MANIFEST_NAME, {
+            'generated_at': timezone.now().isoformat(),
+            'page_size': page_size,
+            'categories': category_manifest,
+            'products': products,
+        }, compress=False)
+
+        self.stdout.write(self.style.SUCCESS(
+            f"Snapshot in {self.root}: {len(stale_ids)} products re-rendered, "
+            f"{len(removed)} removed, {self.written} files written"
+        ))
+
+    def write_category_pages(self, category, page_size, chunk_size, old_pages):
+        queryset = Product.objects.published().filter(category=category)
+        count = queryset.count()
+        total_pages = max(1, -(-count // page_size))
+        page, results = 1, []
+        for product in queryset.for_catalog().iterator(chunk_size=chunk_size):
+            results.append(ProductSerializer(product).data)
+            if len(results) == page_size:
+                self.write_page(category.slug, page, results, count, total_pages)
+                page, results = page + 1, []
+        if results or count == 0:
+            self.write_page(category.slug, page, results, count, total_pages)
+        for stale in range(total_pages + 1, old_pages + 1):
+            self.remove(Path('categories') / category.slug / f'page-{stale}.json')
+        return count
+
+    def write_page(self, slug, page, results, count, total_pages):
+        # Same shape as StandardResultsSetPagination, links relative to the page
+        self.write(Path('categories') / slug / f'page-{page}.json', {
+            'links': {
+                'next': f'page-{page + 1}.json' if page < total_pages else None,
+                'previous': f'page-{page - 1}.json' if page > 1 else None,
+            },
+            'count': count,
+            'total_pages': total_pages,
+            'current_page': page,
+            'results': results,
+        })
+
+    def category_tree(self, categories, category_manifest):
+        nodes = {
+            c.id: {
+                'id': c.id,
+                'name': c.name,
+                'slug': c.slug,
+                'description': c.description,
+                'product_count': category_manifest[c.slug]['count'],
+                'pages': category_manifest[c.slug]['pages'],
+                'children': [],
+            } for c in categories
+        }
+        roots = []
+        for c in categories:
+            if c.parent_id in nodes:
+                nodes[c.parent_id]['children'].append(nodes[c.id])
+            else:
+                roots.append(nodes[c.id])
+        return roots
+
+    def load_manifest(self):
+        try:
+            return json.loads((self.root / MANIFEST_NAME).read_text())
+        except (OSError, ValueError):
+            return {}
+
+    def write(self, relative_path, data, compress=True):
+        """Write JSON plus .gz/.br siblings, skipping files whose bytes are unchanged"""
+        path = self.root / relative_path
+        payload = json.dumps(data, cls=DjangoJSONEncoder, separators=(',', ':'),
+                             sort_keys=True).encode()
+        try:
+            if path.read_bytes() == payload:
+                return
+        except OSError:
+            pass
+        path.parent.mkdir(parents=True, exist_ok=True)
+        self.replace(path, payload)
+        if compress:
+            # mtime=0 keeps the gzip bytes stable so CDNs see identical ETags
+            self.replace(path.with_name(path.name + '.gz'),
+                         gzip.compress(payload, compresslevel=9, mtime=0))
+            if brotli is not None:
+                self.replace(path.with_name(path.name + '.br'), brotli.compress(payload))
+        self.written += 1
+
+    def replace(self, path, payload):
+        tmp = path.with_name(path.name + '.tmp')
+        tmp.write_bytes(payload)
+        os.replace(tmp, path)
+
+    def remove(self, relative_path):
+        path = self.root / relative_path
+        for suffix in ('', '.gz', '.br'):
+            try:
+                path.with_name(path.name + suffix).unlink()
+            except FileNotFoundError:
+                pass
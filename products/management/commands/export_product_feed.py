@@ -0,0 +1,47 @@
+import gzip
+import sys
+
+from django.core.management.base import BaseCommand, CommandError
+from django.utils import timezone
+from django.utils.dateparse import parse_datetime
+from products.feeds import CHUNK_SIZE, WRITERS, render_feed
+
+
+class Command(BaseCommand):
+    help = "Write the product feed (JSON lines, CSV or Google Shopping RSS) to a file or stdout"
+
+    def add_arguments(self, parser):
+        parser.add_argument('--format', choices=sorted(WRITERS), default='jsonl')
+        parser.add_argument('--since', type=str, default=None,
+                            help='ISO timestamp; only products updated after it')
+        parser.add_argument('--output', type=str, default='-',
+                            help="File to write ('-' for stdout, .gz to compress)")
+        parser.add_argument('--base-url', type=str, default='',
+                            help='Prefix for product and image links, e.g. https://shop.example.com')
+        parser.add_argument('--chunk-size', type=int, default=CHUNK_SIZE)
+
+    def handle(self, *args, **options):
+        since = None
+        if options['since']:
+            since = parse_datetime(options['since'])
+            if since is None:
+                raise CommandError(f"Invalid --since value: {options['since']}")
+            if timezone.is_naive(since):
+                since = timezone.make_aware(since)
+
+        generated_at = timezone.now()
+        chunks = render_feed(options['format'], since, options['base_url'].rstrip('/'),
+                             options['chunk_size'])
+        output = options['output']
+        if output == '-':
+            for chunk in chunks:
+                sys.stdout.write(chunk)
+            return
+        opener = gzip.open if output.endswith('.gz') else open
+        with opener(output, 'wt', encoding='utf-8', newline='') as out:
+            for chunk in chunks:
+                out.write(chunk)
+        # The next delta should start from here
+        self.stdout.write(self.style.SUCCESS(
+            f"Feed written to {output}; next --since {generated_at.isoformat()}"
+        ))
@@ -0,0 +1,330 @@
+import gzip
+import json
+import math
+import random
+import time
+from contextlib import contextmanager
+from decimal import Decimal
+
+from django.apps import apps
+from django.core.management.base import BaseCommand, CommandError
+from django.db import models, transaction
+from products import cache as product_cache
+from products.models import Category, Product, ProductImage, ProductReview
+from users.models import User
+
+# Dump/load order; foreign keys are checked at commit so order is only cosmetic
+FIXTURE_MODELS = [User, Category, Product, ProductImage, ProductReview]
+FIXTURE_FORMAT = 'ecommerce-compact-fixture'
+
+WORDS = ('wireless premium smart portable ultra compact classic pro mini max '
+         'eco slim heavy duty outdoor kids home office travel gaming studio '
+         'headphones watch speaker camera laptop phone charger cable keyboard '
+         'mouse monitor lamp bag bottle jacket shoe chair desk tent knife').split()
+
+
+class Command(BaseCommand):
+    help = ("Generate a large deterministic synthetic catalog, or dump/load it "
+            "in a compact gzip'd JSON-lines format")
+
+    def add_arguments(self, parser):
+        parser.add_argument('--products', type=int, default=100000)
+        parser.add_argument('--users', type=int, default=10000)
+        parser.add_argument('--depth', type=int, default=4,
+                            help='Levels in the category tree')
+        parser.add_argument('--branching', type=int, default=6,
+                            help='Children per category')
+        parser.add_argument('--reviews-per-product', type=float, default=3.0,
+                            help='Average reviews per product (Zipf distributed)')
+        parser.add_argument('--zipf', type=float, default=1.1,
+                            help='Zipf exponent for review popularity')
+        parser.add_argument('--max-images', type=int, default=4)
+        parser.add_argument('--seed', type=int, default=1)
+        parser.add_argument('--batch-size', type=int, default=5000)
+        parser.add_argument('--clear', action='store_true',
+                            help='Delete the existing catalog and users first')
+        parser.add_argument('--dump', type=str, metavar='PATH',
+                            help='Write the current catalog to a compact fixture and exit')
+        parser.add_argument('--load', type=str, metavar='PATH',
+                            help='Load a compact fixture instead of generating')
+
+    def handle(self, *args, **options):
+        self.batch_size = options['batch_size']
+        self.verbosity = options['verbosity']
+        started = time.perf_counter()
+        if options['dump']:
+            rows = dump_fixture(options['dump'], self.batch_size)
+            self.stdout.write(self.style.SUCCESS(
+                f"Dumped {rows} rows to {options['dump']} in {time.perf_counter() - started:.1f}s"
+            ))
+            return
+
+        with transaction.atomic():
+            if options['clear']:
+                self.clear()
+            if options['load']:
+                rows = load_fixture(options['load'], self.batch_size)
+                summary = f"Loaded {rows} rows from {options['load']}"
+            else:
+                summary = self.generate(options)
+        self.stdout.write(self.style.SUCCESS(
+            f"{summary} in {time.perf_counter() - started:.1f}s"
+        ))
+
+    def clear(self):
+        """
+        Delete the catalog and users, and every row that cascades from them,
+        with one DELETE per table. Model deletes would run the per-row signal
+        receivers (change log, caches, stock) for every row, which takes
+        minutes at the sizes this command is for. The catalog cache version
+        is bumped once instead; change log consumers are not told.
+        """
+        doomed = cascaded_models(FIXTURE_MODELS)
+        for model in apps.get_models(include_auto_created=True):
+            if model in doomed:
+                continue
+            for field in model._meta.concrete_fields:
+                if not field.is_relation or field.related_model not in doomed:
+                    continue
+                if field.remote_field.on_delete is not models.SET_NULL:
+                    raise CommandError(f"{model._meta.label}.{field.name} refers to rows --clear "
+                                       f"would delete")
+                # A plain queryset: no change log entries or signals
+                models.QuerySet(model).filter(**{f'{field.name}__isnull': False}).update(
+                    **{field.name: None})
+        for model in doomed:
+            queryset = models.QuerySet(model)
+            # Foreign keys are checked at commit, so the order doesn't matter
+            queryset._raw_delete(queryset.db)
+        transaction.on_commit(product_cache.invalidate_all)
+
+    def generate(self, options):
+        rng = random.Random(options['seed'])
+        # Explicit ids keep the output identical for a given seed and let
+        # child rows reference parents without reading ids back
+        user_ids = self.generate_users(options['users'], rng)
+        leaf_ids = self.generate_categories(options['depth'], options['branching'])
+        counts = self.generate_products(options, rng, user_ids, leaf_ids)
+        return (f"Generated {len(user_ids)} users, {counts['categories']} categories, "
+                f"{counts['products']} products, {counts['images']} images, "
+                f"{counts['reviews']} reviews")
+
+    def next_id(self, model):
+        return (model.objects.aggregate(m=models.Max('pk'))['m'] or 0) + 1
+
+    def generate_users(self, count, rng):
+        first_id = self.next_id(User)
+        template = User(email='template@example.com')
+        # Hashing once keeps user generation from being dominated by PBKDF2
+        template.set_password('password123')
+        users = (
+            User(id=first_id + i, email=f'user{first_id + i}@example.com',
+                 first_name=rng.choice(WORDS).title(), last_name=f'User{i}',
+                 password=template.password)
+            for i in range(count)
+        )
+        self.bulk_create(User, users)
+        return range(first_id, first_id + count)
+
+    def generate_categories(self, depth, branching):
+        next_id = self.next_id(Category)
+        level, leaves, total = [(None, '')], [], 0
+        for d in range(depth):
+            rows, next_level = [], []
+            for parent_id, path in level:
+                for b in range(1, branching + 1):
+                    node_path = f'{path}.{b}' if path else str(b)
+                    rows.append(Category(
+                        id=next_id, name=f'Category {node_path} #{next_id}',
+                        slug=f"category-{node_path.replace('.', '-')}-{next_id}",
+                        parent_id=parent_id,
+                    ))
+                    next_level.append((next_id, node_path))
+                    next_id += 1
+            self.bulk_create(Category, rows)
+            total += len(rows)
+            level = next_level
+        leaves = [category_id for category_id, _ in level]
+        self.category_total = total
+        return leaves
+
+    def generate_products(self, options, rng, user_ids, leaf_ids):
+        count = options['products']
+        product_id = self.next_id(Product)
+        image_id = self.next_id(ProductImage)
+        review_id = self.next_id(ProductReview)
+
+        # Zipf popularity: rank r gets reviews ∝ 1 / r^s. Ranks are spread
+        # over products with a multiplicative permutation so we never hold
+        # a list of a million ranks in memory.
+        s = options['zipf']
+        harmonic = math.fsum(1 / r ** s for r in range(1, count + 1)) if count else 1
+        total_reviews = options['reviews_per_product'] * count
+        stride = next(a for a in range(7919, 7919 + count + 1) if math.gcd(a, count or 1) == 1)
+
+        products, images, reviews = [], [], []
+        totals = {'products': 0, 'images': 0, 'reviews': 0,
+                  'categories': self.category_total}
+        for i in range(count):
+            pid = product_id + i
+            price = Decimal(rng.randint(199, 250000)) / 100
+            on_sale = rng.random() < 0.15
+            products.append(Product(
+                id=pid, name=' '.join(rng.choice(WORDS) for _ in range(3)).title(),
+                slug=f'product-{pid}', sku=f'GEN-{pid:010d}',
+                description=' '.join(rng.choice(WORDS) for _ in range(rng.randint(20, 80))),
+                price=price,
+                compare_price=(price * Decimal('1.3')).quantize(Decimal('0.01')) if on_sale else None,
+                quantity=rng.choice((0, 0, 1, 3, 10, 25, 100, 500)),
+                category_id=rng.choice(leaf_ids) if leaf_ids else None,
+                status=rng.choices(('published', 'draft', 'archived'), (90, 7, 3))[0],
+                featured=rng.random() < 0.02,
+            ))
+
+            for n in range(rng.randint(0, options['max_images'])):
+                images.append(ProductImage(
+                    id=image_id, product_id=pid, image=f'products/gen/{pid}-{n}.jpg',
+                    alt_text=f'Product {pid} image {n}', is_default=n == 0,
+                ))
+                image_id += 1
+
+            rank = (i * stride) % count + 1
+            wanted = min(len(user_ids), round(total_reviews / (rank ** s * harmonic)))
+            for user_id in rng.sample(user_ids, wanted):
+                review = ProductReview(
+                    id=review_id, product_id=pid, user_id=user_id,
+                    rating=rng.choices((1, 2, 3, 4, 5), (5, 5, 15, 35, 40))[0],
+                    title=' '.join(rng.choice(WORDS) for _ in range(4)).capitalize(),
+                    content=' '.join(rng.choice(WORDS) for _ in range(rng.randint(10, 60))),
+                    is_approved=rng.random() < 0.85,
+                )
+                review.moderation_status = 'approved' if review.is_approved else 'pending'
+                reviews.append(review)
+                review_id += 1
+
+            # Flush in dependency order whenever the products batch fills up
+            if len(products) >= self.batch_size:
+                self.flush(products, images, reviews, totals)
+        self.flush(products, images, reviews, totals)
+        return totals
+
+    def flush(self, products, images, reviews, totals):
+        for model, rows, key in ((Product, products, 'products'),
+                                 (ProductImage, images, 'images'),
+                                 (ProductReview, reviews, 'reviews')):
+            self.bulk_create(model, rows)
+            totals[key] += len(rows)
+            rows.clear()
+        if totals['products'] and self.verbosity > 1:
+            self.stdout.write(f"  {totals['products']} products written")
+
+    def bulk_create(self, model, rows):
+        rows = iter(rows)
+        while True:
+            batch = [row for _, row in zip(range(self.batch_size), rows)]
+            if not batch:
+                return
+            model.objects.bulk_create(batch, batch_size=self.batch_size)
+
+
+def cascaded_models(roots):
+    """`roots` and every model whose rows are deleted along with theirs"""
+    found = set(roots)
+    while True:
+        more = {
+            model for model in apps.get_models(include_auto_created=True)
+            if model not in found and any(
+                field.is_relation and field.related_model in found
+                and field.remote_field.on_delete is models.CASCADE
+                for field in model._meta.concrete_fields
+            )
+        }
+        if not more:
+            return found
+        found |= more
+
+
+def fixture_fields(model):
+    return [f for f in model._meta.concrete_fields]
+
+
+def dump_fixture(path, chunk_size):
+    """
+    Stream every FIXTURE_MODELS row to a gzip'd JSON-lines file: one header
+    object per model naming its columns, then one JSON array per row.
+    """
+    rows = 0
+    with gzip.open(path, 'wt', encoding='utf-8', compresslevel=6) as out:
+        out.write(json.dumps({'format': FIXTURE_FORMAT, 'version': 1}) + '\n')
+        for model in FIXTURE_MODELS:
+            fields = fixture_fields(model)
+            out.write(json.dumps({
+                'model': model._meta.label_lower,
+                'fields': [f.attname for f in fields],
+            }) + '\n')
+            values = model.objects.order_by('pk').values_list(
+                *[f.attname for f in fields]
+            ).iterator(chunk_size=chunk_size)
+            for row in values:
+                out.write(json.dumps([_encode(v) for v in row],
+                                     separators=(',', ':')) + '\n')
+                rows += 1
+    return rows
+
+
+def _encode(value):
+    if isinstance(value, Decimal):
+        return str(value)
+    if hasattr(value, 'isoformat'):
+        return value.isoformat()
+    return value
+
+
+@contextmanager
+def keep_timestamps(model):
+    """Stop auto_now/auto_now_add from overwriting the dumped timestamps"""
+    saved = []
+    for field in model._meta.concrete_fields:
+        if getattr(field, 'auto_now', False) or getattr(field, 'auto_now_add', False):
+            saved.append((field, field.auto_now, field.auto_now_add))
+            field.auto_now = field.auto_now_add = False
+    try:
+        yield
+    finally:
+        for field, auto_now, auto_now_add in saved:
+            field.auto_now, field.auto_now_add = auto_now, auto_now_add
+
+
+def load_fixture(path, batch_size):
+    """Load a file written by dump_fixture with streaming bulk_create batches"""
+    models_by_label = {m._meta.label_lower: m for m in FIXTURE_MODELS}
+    rows, model, fields, batch = 0, None, None, []
+
+    def flush():
+        if batch:
+            with keep_timestamps(model):
+                model.objects.bulk_create(batch, batch_size=batch_size)
+            batch.clear()
+
+    with gzip.open(path, 'rt', encoding='utf-8') as src:
+        header = json.loads(src.readline())
+        if header.get('format') != FIXTURE_FORMAT:
+            raise CommandError(f"{path} is not a compact catalog fixture")
+        for line in src:
+            record = json.loads(line)
+            if isinstance(record, dict):
+                flush()
+                model = models_by_label[record['model']]
+                by_attname = {f.attname: f for f in fixture_fields(model)}
+                fields = [by_attname[name] for name in record['fields']]
+                continue
+            obj = model(**{
+                f.attname: f.to_python(v) if v is not None else None
+                for f, v in zip(fields, record)
+            })
+            batch.append(obj)
+            rows += 1
+            if len(batch) >= batch_size:
+                flush()
+        flush()
+    return rows
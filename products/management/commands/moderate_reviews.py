@@ -0,0 +1,23 @@
+from django.core.management.base import BaseCommand
+from products import moderation
+
+
+class Command(BaseCommand):
+    help = "Approve pending reviews, or hold likely spam and near-duplicates for a moderator"
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=moderation.BATCH_SIZE,
+                            help='Reviews checked per transaction')
+        parser.add_argument('--limit', type=int, default=None,
+                            help='Reviews per run; the rest wait for the next run')
+        parser.add_argument('--index-existing', action='store_true',
+                            help='First index moderated reviews with no signature, e.g. after installing')
+
+    def handle(self, *args, **options):
+        if options['index_existing']:
+            indexed = moderation.index_existing()
+            self.stdout.write(f"Indexed {indexed} existing reviews")
+        approved, held = moderation.moderate(options['batch_size'], options['limit'])
+        self.stdout.write(self.style.SUCCESS(
+            f"{approved} reviews approved, {held} held for a moderator"
+        ))
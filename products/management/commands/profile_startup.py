@@ -0,0 +1,108 @@
+import json
+import os
+import subprocess
+import sys
+import time
+from collections import defaultdict
+
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+
+# Run in a fresh interpreter: this process has already imported everything
+PROBE = """
+import json, time
+started = time.perf_counter()
+import django
+django.setup()
+setup_done = time.perf_counter()
+if {urls}:
+    from django.urls import get_resolver
+    get_resolver().url_patterns
+print(json.dumps({{'setup': setup_done - started, 'total': time.perf_counter() - started}}))
+"""
+
+
+class Command(BaseCommand):
+    help = ("Measure cold start (django.setup() and URLconf loading) in fresh "
+            "interpreters and report the slowest imports against a budget")
+
+    def add_arguments(self, parser):
+        parser.add_argument('--runs', type=int, default=5,
+                            help='Fresh interpreters to start; the median run is reported')
+        parser.add_argument('--top', type=int, default=15,
+                            help='Modules and packages to list')
+        parser.add_argument('--budget', type=float, default=None,
+                            help='Cold-start budget in ms (default: settings.STARTUP_BUDGET_MS)')
+        parser.add_argument('--no-urls', action='store_true',
+                            help='Only measure django.setup(), not the URLconf')
+        parser.add_argument('--check', action='store_true',
+                            help='Exit with an error when the budget is exceeded')
+
+    def handle(self, *args, **options):
+        budget = options['budget'] or settings.STARTUP_BUDGET_MS
+        env = dict(os.environ, DJANGO_SETTINGS_MODULE=os.environ.get(
+            'DJANGO_SETTINGS_MODULE', 'ecommerce.settings'))
+        probe = PROBE.format(urls=not options['no_urls'])
+
+        runs = []
+        for _ in range(max(options['runs'], 1)):
+            started = time.perf_counter()
+            result = subprocess.run([sys.executable, '-X', 'importtime', '-c', probe],
+                                    capture_output=True, text=True, env=env, cwd=settings.BASE_DIR)
+            wall = time.perf_counter() - started
+            if result.returncode:
+                raise CommandError(f"Startup probe failed:\n{result.stderr[-2000:]}")
+            timings = json.loads(result.stdout.strip().splitlines()[-1])
+            runs.append((wall, timings, result.stderr))
+        runs.sort(key=lambda run: run[0])
+        wall, timings, importtime = runs[len(runs) // 2]
+        modules = parse_importtime(importtime)
+
+        total_ms = wall * 1000
+        self.stdout.write(f"Cold start (median of {len(runs)}): {total_ms:.0f} ms "
+                          f"[min {runs[0][0] * 1000:.0f}, max {runs[-1][0] * 1000:.0f}]")
+        self.stdout.write(f"  interpreter + django.setup(): {timings['setup'] * 1000:.0f} ms")
+        if not options['no_urls']:
+            self.stdout.write(f"  URLconf: {(timings['total'] - timings['setup']) * 1000:.0f} ms")
+        self.stdout.write(f"  imports: {sum(m['self'] for m in modules) / 1000:.0f} ms "
+                          f"in {len(modules)} modules")
+
+        self.stdout.write("\nSlowest top-level imports (cumulative ms):")
+        top_level = sorted((m for m in modules if m['depth'] == 0),
+                           key=lambda m: m['cumulative'], reverse=True)
+        for module in top_level[:options['top']]:
+            self.stdout.write(f"  {module['cumulative'] / 1000:8.1f}  {module['name']}")
+
+        self.stdout.write("\nImport time by package (self ms):")
+        packages = defaultdict(int)
+        for module in modules:
+            packages[module['name'].split('.')[0]] += module['self']
+        for package, micros in sorted(packages.items(), key=lambda item: item[1],
+                                      reverse=True)[:options['top']]:
+            self.stdout.write(f"  {micros / 1000:8.1f}  {package}")
+
+        summary = f"{total_ms:.0f} ms against a budget of {budget:.0f} ms"
+        if total_ms <= budget:
+            self.stdout.write(self.style.SUCCESS(f"\nWithin budget: {summary}"))
+        elif options['check']:
+            raise CommandError(f"Over budget: {summary}")
+        else:
+            self.stdout.write(self.style.WARNING(f"\nOver budget: {summary}"))
+
+
+def parse_importtime(output):
+    """`python -X importtime` lines as dicts with self/cumulative microseconds and depth"""
+    modules = []
+    for line in output.splitlines():
+        if not line.startswith('import time:') or 'self [us]' in line:
+            continue
+        own, cumulative, name = line[len('import time:'):].split('|', 2)
+        stripped = name.lstrip()
+        modules.append({
+            'name': stripped,
+            'self': int(own),
+            'cumulative': int(cumulative),
+            # Two spaces per nesting level after the separator's own space
+            'depth': (len(name) - len(stripped) - 1) // 2,
+        })
+    return modules
@@ -0,0 +1,46 @@
+from django.conf import settings
+from django.core.mail import send_mail
+from django.core.management.base import BaseCommand
+from django.db import transaction
+from django.utils import timezone
+from products.models import StockEvent
+from users.models import User
+
+
+class Command(BaseCommand):
+    help = "Mail queued stock level events to staff as one digest"
+
+    def add_arguments(self, parser):
+        parser.add_argument('--limit', type=int, default=500,
+                            help='Events per digest; the rest wait for the next run')
+        parser.add_argument('--dry-run', action='store_true',
+                            help='Print the digest without sending it or dequeuing')
+
+    def handle(self, *args, **options):
+        # Oldest first, off the partial index of unsent events
+        events = list(StockEvent.objects.filter(notified_at__isnull=True).order_by('id')[:options['limit']])
+        if not events:
+            self.stdout.write("No stock events queued")
+            return
+
+        sold_out = sum(event.level == 0 for event in events)
+        subject = f"Stock alerts: {len(events)} changes, {sold_out} sold out"
+        body = '\n'.join(
+            f"{event.created_at:%Y-%m-%d %H:%M} {event.sku} {event.name}: {event.describe()}"
+            for event in events
+        )
+        if options['dry_run']:
+            self.stdout.write(f"{subject}\n\n{body}")
+            return
+
+        recipients = settings.STOCK_ALERT_RECIPIENTS or list(
+            User.objects.filter(is_staff=True, is_active=True).values_list('email', flat=True)
+        )
+        with transaction.atomic():
+            # Dequeued with the send, so a failed send leaves them queued
+            StockEvent.objects.filter(id__in=[event.id for event in events]).update(
+                notified_at=timezone.now())
+            send_mail(subject, body, None, recipients)
+        self.stdout.write(self.style.SUCCESS(
+            f"Sent {len(events)} stock events to {len(recipients)} recipients"
+        ))
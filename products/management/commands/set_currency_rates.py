@@ -0,0 +1,39 @@
+from decimal import Decimal, InvalidOperation
+
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+from django.utils import timezone
+from products.currency import MINOR_UNITS, invalidate_rates
+from products.models import CurrencyRate
+
+
+class Command(BaseCommand):
+    help = "Create or update currency rates from CODE=RATE pairs, e.g. EUR=0.92 JPY=151.3"
+
+    def add_arguments(self, parser):
+        parser.add_argument('rates', nargs='+', help='CODE=RATE, units per unit of the base currency')
+
+    def handle(self, *args, **options):
+        now = timezone.now()
+        rows = []
+        for pair in options['rates']:
+            code, _, value = pair.partition('=')
+            code = code.strip().upper()
+            if len(code) != 3 or code == settings.BASE_CURRENCY:
+                raise CommandError(f"Invalid currency code in {pair!r}")
+            try:
+                rate = Decimal(value)
+            except InvalidOperation:
+                raise CommandError(f"Invalid rate in {pair!r}")
+            if not rate > 0:
+                raise CommandError(f"Rate must be positive in {pair!r}")
+            rows.append(CurrencyRate(code=code, rate=rate, updated_at=now,
+                                     decimals=MINOR_UNITS.get(code, 2)))
+
+        # One upsert; existing rows keep their decimals, increment and rounding
+        CurrencyRate.objects.bulk_create(
+            rows, update_conflicts=True, unique_fields=['code'], update_fields=['rate', 'updated_at'],
+        )
+        # bulk_create sends no post_save, so invalidate once here
+        invalidate_rates()
+        self.stdout.write(self.style.SUCCESS(f"{len(rows)} currency rates set"))
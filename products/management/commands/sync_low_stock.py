@@ -0,0 +1,29 @@
+from django.core.management.base import BaseCommand
+from products import stock
+from products.models import LowStockProduct, Product
+
+
+class Command(BaseCommand):
+    help = "Rebuild the low-stock table from product quantities, e.g. after changing STOCK_ALERT_LEVELS"
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=5000,
+                            help='Products checked per pass')
+        parser.add_argument('--no-events', action='store_true',
+                            help='Fill the table without recording events, e.g. on the first run')
+
+    def handle(self, *args, **options):
+        levels = stock.alert_levels()
+        # Only products at some level now, or recorded at one before, can change
+        candidates = set(LowStockProduct.objects.values_list('product_id', flat=True))
+        if levels:
+            candidates |= set(Product.objects.filter(quantity__lte=levels[-1]).values_list('id', flat=True))
+        candidates = sorted(candidates)
+
+        events = 0
+        for start in range(0, len(candidates), options['batch_size']):
+            events += stock.sync(candidates[start:start + options['batch_size']],
+                                 record_events=not options['no_events'])
+        self.stdout.write(self.style.SUCCESS(
+            f"Checked {len(candidates)} products, {events} stock events recorded"
+        ))
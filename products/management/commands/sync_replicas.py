@@ -0,0 +1,39 @@
+import sqlite3
+import time
+
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+
+
+class Command(BaseCommand):
+    help = "Copy the primary SQLite database onto every configured read replica"
+
+    def add_arguments(self, parser):
+        parser.add_argument('--pages', type=int, default=1024,
+                            help='Pages copied per backup step; readers are served between steps')
+
+    def handle(self, *args, **options):
+        primary = settings.DATABASES['default']
+        if primary['ENGINE'] != 'django.db.backends.sqlite3':
+            raise CommandError("sync_replicas only supports SQLite databases")
+        replicas = getattr(settings, 'DATABASE_REPLICAS', {})
+        if not replicas:
+            self.stdout.write("No replicas configured (set SQLITE_REPLICAS)")
+            return
+
+        source = sqlite3.connect(str(primary['NAME']))
+        try:
+            for alias in replicas:
+                started = time.perf_counter()
+                target = sqlite3.connect(str(settings.DATABASES[alias]['NAME']))
+                try:
+                    # The online backup API gives a consistent snapshot even
+                    # while the primary is taking writes
+                    source.backup(target, pages=options['pages'])
+                finally:
+                    target.close()
+                self.stdout.write(self.style.SUCCESS(
+                    f"{alias}: synced in {time.perf_counter() - started:.2f}s"
+                ))
+        finally:
+            source.close()
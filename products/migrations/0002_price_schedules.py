@@ -0,0 +1,85 @@
+# Generated by Django 5.2.7 on 2026-10-19 12:30
+
+import django.db.models.deletion
+import django.utils.timezone
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('products', '0001_initial'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='PriceHistory',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('price', models.DecimalField(decimal_places=2, max_digits=10)),
+                ('compare_price', models.DecimalField(blank=True, decimal_places=2, max_digits=10, null=True)),
+                ('source', models.CharField(choices=[('manual', 'Manual edit'), ('schedule', 'Schedule started'), ('revert', 'Schedule ended')], default='manual', max_length=20)),
+                ('recorded_at', models.DateTimeField(default=django.utils.timezone.now)),
+            ],
+            options={
+                'verbose_name_plural': 'Price history',
+                'ordering': ['-recorded_at'],
+            },
+        ),
+        migrations.CreateModel(
+            name='PriceSchedule',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('price', models.DecimalField(decimal_places=2, max_digits=10)),
+                ('compare_price', models.DecimalField(blank=True, decimal_places=2, max_digits=10, null=True)),
+                ('starts_at', models.DateTimeField()),
+                ('ends_at', models.DateTimeField(blank=True, null=True)),
+                ('applied_at', models.DateTimeField(blank=True, editable=False, null=True)),
+                ('reverted_at', models.DateTimeField(blank=True, editable=False, null=True)),
+                ('previous_price', models.DecimalField(blank=True, decimal_places=2, editable=False, max_digits=10, null=True)),
+                ('previous_compare_price', models.DecimalField(blank=True, decimal_places=2, editable=False, max_digits=10, null=True)),
+                ('created_at', models.DateTimeField(auto_now_add=True)),
+            ],
+            options={
+                'ordering': ['-starts_at'],
+            },
+        ),
+        migrations.AddField(
+            model_name='pricehistory',
+            name='product',
+            field=models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='price_history', to='products.product'),
+        ),
+        migrations.AddField(
+            model_name='priceschedule',
+            name='created_by',
+            field=models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='price_schedules', to=settings.AUTH_USER_MODEL),
+        ),
+        migrations.AddField(
+            model_name='priceschedule',
+            name='product',
+            field=models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='price_schedules', to='products.product'),
+        ),
+        migrations.AddField(
+            model_name='pricehistory',
+            name='schedule',
+            field=models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='history', to='products.priceschedule'),
+        ),
+        migrations.AddIndex(
+            model_name='priceschedule',
+            index=models.Index(fields=['product', 'starts_at'], name='products_pr_product_0c378b_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='priceschedule',
+            index=models.Index(fields=['applied_at', 'starts_at'], name='products_pr_applied_b29732_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='priceschedule',
+            index=models.Index(fields=['reverted_at', 'ends_at'], name='products_pr_reverte_844906_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='pricehistory',
+            index=models.Index(fields=['product', 'recorded_at'], name='products_pr_product_045f8f_idx'),
+        ),
+    ]
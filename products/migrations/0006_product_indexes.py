@@ -0,0 +1,138 @@
+# Generated by Django 5.2.7 on 2026-10-19 13:17
+
+import django.db.models.deletion
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('products', '0005_change_log'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.RemoveIndex(
+            model_name='category',
+            name='products_ca_slug_da4386_idx',
+        ),
+        migrations.RemoveIndex(
+            model_name='category',
+            name='products_ca_name_693421_idx',
+        ),
+        migrations.RemoveIndex(
+            model_name='category',
+            name='products_ca_parent__1cafc9_idx',
+        ),
+        migrations.RemoveIndex(
+            model_name='product',
+            name='products_pr_slug_3edc0c_idx',
+        ),
+        migrations.RemoveIndex(
+            model_name='product',
+            name='products_pr_sku_ca0cdc_idx',
+        ),
+        migrations.RemoveIndex(
+            model_name='product',
+            name='products_pr_categor_9edb3d_idx',
+        ),
+        migrations.RemoveIndex(
+            model_name='product',
+            name='products_pr_status_041708_idx',
+        ),
+        migrations.RemoveIndex(
+            model_name='product',
+            name='products_pr_price_9b1a5f_idx',
+        ),
+        migrations.RemoveIndex(
+            model_name='product',
+            name='products_pr_quantit_ac4fa0_idx',
+        ),
+        migrations.RemoveIndex(
+            model_name='product',
+            name='products_pr_created_dd9578_idx',
+        ),
+        migrations.RemoveIndex(
+            model_name='product',
+            name='products_pr_price_ab2632_idx',
+        ),
+        migrations.RemoveIndex(
+            model_name='product',
+            name='sku_barcode_idx',
+        ),
+        migrations.RemoveIndex(
+            model_name='productreview',
+            name='products_pr_product_160d92_idx',
+        ),
+        migrations.AlterField(
+            model_name='category',
+            name='slug',
+            field=models.SlugField(blank=True, max_length=100, unique=True),
+        ),
+        # Only the foreign key's own index goes; AlterField would rebuild the table
+        migrations.SeparateDatabaseAndState(
+            state_operations=[
+                migrations.AlterField(
+                    model_name='product',
+                    name='category',
+                    field=models.ForeignKey(db_index=False, null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='products', to='products.category'),
+                ),
+            ],
+            database_operations=[
+                migrations.RunSQL(
+                    'DROP INDEX "products_product_category_id_9b594869"',
+                    reverse_sql='CREATE INDEX "products_product_category_id_9b594869" ON "products_product" ("category_id")',
+                ),
+            ],
+        ),
+        migrations.AlterField(
+            model_name='product',
+            name='slug',
+            field=models.SlugField(blank=True, max_length=200, unique=True),
+        ),
+        # Only the foreign key's own index goes; AlterField would rebuild the table
+        migrations.SeparateDatabaseAndState(
+            state_operations=[
+                migrations.AlterField(
+                    model_name='productreview',
+                    name='product',
+                    field=models.ForeignKey(db_index=False, on_delete=django.db.models.deletion.CASCADE, related_name='reviews', to='products.product'),
+                ),
+            ],
+            database_operations=[
+                migrations.RunSQL(
+                    'DROP INDEX "products_productreview_product_id_7e81c4a6"',
+                    reverse_sql='CREATE INDEX "products_productreview_product_id_7e81c4a6" ON "products_productreview" ("product_id")',
+                ),
+            ],
+        ),
+        migrations.AddIndex(
+            model_name='product',
+            index=models.Index(fields=['status', '-created_at'], name='products_pr_status_8ee08e_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='product',
+            index=models.Index(fields=['status', 'price'], name='products_pr_status_157382_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='product',
+            index=models.Index(fields=['category', 'status', '-created_at'], name='products_pr_categor_23d7e7_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='product',
+            index=models.Index(condition=models.Q(('featured', True)), fields=['status', '-created_at'], name='product_featured_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='product',
+            index=models.Index(condition=models.Q(('quantity__gt', 0)), fields=['status', '-created_at'], name='product_in_stock_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='product',
+            index=models.Index(condition=models.Q(('compare_price__isnull', False)), fields=['status', '-created_at'], name='product_on_sale_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='productreview',
+            index=models.Index(condition=models.Q(('is_approved', True)), fields=['product', '-created_at'], name='review_approved_idx'),
+        ),
+    ]
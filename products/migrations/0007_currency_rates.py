@@ -0,0 +1,29 @@
+# Generated by Django 5.2.7 on 2026-10-19 13:28
+
+import django.core.validators
+from decimal import Decimal
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('products', '0006_product_indexes'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='CurrencyRate',
+            fields=[
+                ('code', models.CharField(help_text='ISO 4217 code, e.g. EUR', max_length=3, primary_key=True, serialize=False)),
+                ('rate', models.DecimalField(decimal_places=8, help_text='Units of this currency per unit of the base currency', max_digits=18, validators=[django.core.validators.MinValueValidator(Decimal('1E-8'))])),
+                ('decimals', models.PositiveSmallIntegerField(default=2, help_text='Digits of the minor unit (JPY 0, KWD 3)', validators=[django.core.validators.MaxValueValidator(4)])),
+                ('increment', models.PositiveIntegerField(default=1, help_text='Prices are multiples of this many minor units (e.g. 5 for CHF cash rounding)', validators=[django.core.validators.MinValueValidator(1)])),
+                ('rounding', models.CharField(choices=[('half_even', 'Half to even'), ('half_up', 'Half up'), ('up', 'Up'), ('down', 'Down')], default='half_even', max_length=10)),
+                ('updated_at', models.DateTimeField(auto_now=True)),
+            ],
+            options={
+                'ordering': ['code'],
+            },
+        ),
+    ]
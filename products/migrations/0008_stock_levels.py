@@ -0,0 +1,47 @@
+# Generated by Django 5.2.7 on 2026-10-19 13:33
+
+import django.db.models.deletion
+import django.utils.timezone
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('products', '0007_currency_rates'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='LowStockProduct',
+            fields=[
+                ('product', models.OneToOneField(on_delete=django.db.models.deletion.CASCADE, primary_key=True, related_name='low_stock', serialize=False, to='products.product')),
+                ('quantity', models.IntegerField()),
+                ('level', models.IntegerField()),
+                ('since', models.DateTimeField(default=django.utils.timezone.now, help_text='When the product reached this level')),
+            ],
+            options={
+                'verbose_name_plural': 'Low stock',
+                'ordering': ['quantity', 'product_id'],
+                'indexes': [models.Index(fields=['level', 'quantity'], name='products_lo_level_e81f23_idx'), models.Index(fields=['quantity'], name='products_lo_quantit_e09f00_idx')],
+            },
+        ),
+        migrations.CreateModel(
+            name='StockEvent',
+            fields=[
+                ('id', models.BigAutoField(primary_key=True, serialize=False)),
+                ('product_id', models.BigIntegerField()),
+                ('sku', models.CharField(max_length=100)),
+                ('name', models.CharField(max_length=200)),
+                ('quantity', models.IntegerField()),
+                ('level', models.IntegerField(blank=True, null=True)),
+                ('previous_level', models.IntegerField(blank=True, null=True)),
+                ('created_at', models.DateTimeField(default=django.utils.timezone.now)),
+                ('notified_at', models.DateTimeField(blank=True, null=True)),
+            ],
+            options={
+                'ordering': ['id'],
+                'indexes': [models.Index(fields=['product_id', 'id'], name='products_st_product_405227_idx'), models.Index(condition=models.Q(('notified_at__isnull', True)), fields=['id'], name='stock_event_pending_idx')],
+            },
+        ),
+    ]
@@ -0,0 +1,61 @@
+# Generated by Django 5.2.7 on 2026-10-19 13:47
+
+import django.db.models.deletion
+from django.conf import settings
+from django.db import migrations, models
+
+
+def mark_approved(apps, schema_editor):
+    # Reviews approved before moderation existed are not queued again
+    ProductReview = apps.get_model('products', 'ProductReview')
+    ProductReview.objects.filter(is_approved=True).update(moderation_status='approved')
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('products', '0009_product_wishlist_count'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ReviewBand',
+            fields=[
+                ('id', models.BigAutoField(primary_key=True, serialize=False)),
+                ('key', models.BigIntegerField(db_index=True)),
+            ],
+        ),
+        migrations.CreateModel(
+            name='ReviewSignature',
+            fields=[
+                ('review', models.OneToOneField(on_delete=django.db.models.deletion.CASCADE, primary_key=True, related_name='signature', serialize=False, to='products.productreview')),
+                ('minhash', models.BinaryField()),
+            ],
+        ),
+        migrations.AddField(
+            model_name='productreview',
+            name='moderated_at',
+            field=models.DateTimeField(blank=True, null=True),
+        ),
+        migrations.AddField(
+            model_name='productreview',
+            name='moderation_note',
+            field=models.CharField(blank=True, max_length=255),
+        ),
+        migrations.AddField(
+            model_name='productreview',
+            name='moderation_status',
+            field=models.CharField(choices=[('pending', 'Pending'), ('approved', 'Approved'), ('held', 'Held for a moderator'), ('rejected', 'Rejected')], default='pending', max_length=10),
+        ),
+        migrations.AddIndex(
+            model_name='productreview',
+            index=models.Index(condition=models.Q(('moderation_status', 'pending')), fields=['id'], name='review_pending_idx'),
+        ),
+        migrations.AddField(
+            model_name='reviewband',
+            name='review',
+            field=models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='+', to='products.productreview'),
+        ),
+        migrations.RunPython(mark_approved, migrations.RunPython.noop),
+    ]
@@ -1,10 +1,19 @@
+import sys
+from array import array
+from decimal import Decimal
+
 from django.db import models
 from django.core.validators import MinValueValidator, MaxValueValidator
+from django.core.exceptions import ValidationError
 from users.models import User
 from django.utils.text import slugify
 from django.urls import reverse
+from django.utils import timezone
+from django.db.models import Q, OuterRef, Subquery
+from django.db.models.functions import Coalesce
+from .changelog import ChangeLoggedModel, ChangeLoggedQuerySet
 
-class Category(models.Model):
+class Category(ChangeLoggedModel):
     name = models.CharField(max_length=100, unique=True)
     slug = models.SlugField(max_length=100, unique=True, blank=True)  # Changed to allow blank
     description = models.TextField(blank=True)
@@ -14,12 +23,10 @@ class Category(models.Model):
     created_at = models.DateTimeField(auto_now_add=True)
     updated_at = models.DateTimeField(auto_now=True)
     
+    objects = ChangeLoggedQuerySet.as_manager()
+    
     class Meta:
         verbose_name_plural = "Categories"
-        indexes = [
-            models.Index(fields=['slug']),
-            models.Index(fields=['name']),
-        ]
     
     def __str__(self):
         return self.name
@@ -40,7 +47,49 @@ class Category(models.Model):
         return reverse('category-detail', kwargs={'slug': self.slug})
     
 
-class Product(models.Model):
+class ProductQuerySet(ChangeLoggedQuerySet):
+    def published(self):
+        return self.filter(status='published')
+    
+    def for_catalog(self, fields=None):
+        """
+        Annotations and joins ProductSerializer expects. With a sparse
+        fieldset only the requested columns, joins and prefetches are used.
+        """
+        def wanted(name):
+            return fields is None or name in fields
+        
+        queryset = self
+        # Per-product subqueries rather than a join on reviews: the join needs
+        # a GROUP BY over every selected column, which rules out reading the
+        # listing in index order and sorts the whole filtered set per page
+        reviews = ProductReview.objects.filter(product=OuterRef('pk')).order_by().values('product')
+        if wanted('average_rating'):
+            queryset = queryset.annotate(average_rating=Subquery(
+                reviews.annotate(value=models.Avg('rating')).values('value')
+            ))
+        if wanted('review_count'):
+            queryset = queryset.annotate(review_count=Coalesce(Subquery(
+                reviews.annotate(value=models.Count('pk')).values('value')
+            ), 0))
+        if wanted('category'):
+            queryset = queryset.select_related('category')
+        if fields is None:
+            queryset = queryset.select_related('created_by')
+        if wanted('images'):
+            queryset = queryset.prefetch_related('images')
+        if wanted('reviews'):
+            queryset = queryset.prefetch_related(
+                models.Prefetch('reviews', queryset=ProductReview.objects.filter(
+                    is_approved=True
+                ).select_related('user').order_by('-created_at'))
+            )
+        if fields is not None:
+            columns = {f.name for f in self.model._meta.concrete_fields} & set(fields)
+            queryset = queryset.only('id', *columns)
+        return queryset
+
+class Product(ChangeLoggedModel):
     PRODUCT_STATUS = [
         ('draft', 'Draft'),
         ('published', 'Published'),
@@ -58,8 +107,9 @@ class Product(models.Model):
     sku = models.CharField(max_length=100, unique=True)
     barcode = models.CharField(max_length=100, blank=True)
     quantity = models.IntegerField(default=0)
+    # Indexed by the (category, status, -created_at) index below
     category = models.ForeignKey(Category, on_delete=models.SET_NULL,
-                                null=True, related_name='products')
+                                null=True, related_name='products', db_index=False)
     status = models.CharField(max_length=20, choices=PRODUCT_STATUS, 
                             default='draft')
     featured = models.BooleanField(default=False)
@@ -67,21 +117,82 @@ class Product(models.Model):
                                   null=True, related_name='products_created')
     created_at = models.DateTimeField(auto_now_add=True)
     updated_at = models.DateTimeField(auto_now=True)
+    # Written in batches by products.tracking, never by save()
+    view_count = models.PositiveBigIntegerField(default=0, editable=False)
+    popularity = models.FloatField(default=0, editable=False)
+    # Users with the product on their wishlist, written in batches by wishlist.store
+    wishlist_count = models.PositiveIntegerField(default=0, editable=False)
+    
+    TRACKING_FIELDS = ('view_count', 'popularity', 'wishlist_count')
+    CHANGELOG_IGNORED_FIELDS = TRACKING_FIELDS
+    # Changes to these are recorded in PriceHistory on save
+    PRICE_FIELDS = ('price', 'compare_price')
+    
+    objects = ProductQuerySet.as_manager()
     
     class Meta:
+        # Matched to the listing's filter + order paths; slug and sku are
+        # indexed by their unique constraints. See benchmarks/index_plans.py
         indexes = [
-            models.Index(fields=['slug']),
-            models.Index(fields=['sku']),
-            models.Index(fields=['category']),
-            models.Index(fields=['status']),
+            # Staff listing, which is not filtered by status
             models.Index(fields=['created_at']),
-            models.Index(fields=['price']),
+            # Published listing: newest first, by price, price ranges
+            models.Index(fields=['status', '-created_at']),
+            models.Index(fields=['status', 'price']),
+            # ?category=<slug>, and the category foreign key itself
+            models.Index(fields=['category', 'status', '-created_at']),
+            # ?ordering=-popularity / -view_count on the published listing
+            models.Index(fields=['status', '-popularity']),
+            models.Index(fields=['status', '-view_count']),
+            # Featured, in-stock and on-sale slices of the listing, newest
+            # first. Partial, so they hold only those rows; status stays the
+            # leading column since SQLite's planner prefers a (status=?)
+            # search to scanning a partial index, however small
+            models.Index(fields=['status', '-created_at'], name='product_featured_idx',
+                         condition=Q(featured=True)),
+            models.Index(fields=['status', '-created_at'], name='product_in_stock_idx',
+                         condition=Q(quantity__gt=0)),
+            models.Index(fields=['status', '-created_at'], name='product_on_sale_idx',
+                         condition=Q(compare_price__isnull=False)),
         ]
         ordering = ['-created_at']
     
     def __str__(self):
         return self.name
     
+    @classmethod
+    def from_db(cls, db, field_names, values):
+        instance = super().from_db(db, field_names, values)
+        # Remember the loaded prices so save() can tell whether they changed;
+        # deferred ones are left out rather than remembered as None
+        instance._loaded_prices = {
+            name: instance.__dict__[name] for name in cls.PRICE_FIELDS if name in instance.__dict__
+        }
+        # And the slug, so a rename can drop the cached slug -> id mapping
+        instance._loaded_slug = instance.__dict__.get('slug')
+        # And the quantity, so saves that cross no stock level skip products.stock
+        instance._loaded_quantity = instance.__dict__.get('quantity')
+        return instance
+    
+    def refresh_from_db(self, using=None, fields=None, from_queryset=None):
+        super().refresh_from_db(using=using, fields=fields, from_queryset=from_queryset)
+        # Also runs when a deferred price is first read: that value is the baseline
+        loaded = getattr(self, '_loaded_prices', None)
+        if loaded is not None:
+            loaded.update({
+                name: self.__dict__[name] for name in self.PRICE_FIELDS
+                if name in self.__dict__ and (fields is None or name in fields)
+            })
+    
+    def _prices_changed(self):
+        loaded = getattr(self, '_loaded_prices', None)
+        if loaded is None:
+            # Not loaded from the database: a new product
+            return True
+        deferred = self.get_deferred_fields()
+        return any(name not in deferred and self.__dict__[name] != loaded.get(name)
+                   for name in self.PRICE_FIELDS)
+    
     def save(self, *args, **kwargs):
         # Generate slug from name if not provided
         if not self.slug:
@@ -92,7 +203,23 @@ class Product(models.Model):
             while Product.objects.filter(slug=self.slug).exists():
                 self.slug = f"{original_slug}-{counter}"
                 counter += 1
+        prices_changed = self._prices_changed()
+        if (not self._state.adding and kwargs.get('update_fields') is None
+                and not kwargs.get('force_insert') and not args):
+            # Don't write back view counts loaded before the last tracking flush
+            deferred = self.get_deferred_fields()
+            kwargs['update_fields'] = [
+                f.name for f in self._meta.concrete_fields
+                if not f.primary_key and f.name not in self.TRACKING_FIELDS
+                and f.attname not in deferred
+            ]
         super().save(*args, **kwargs)
+        self._loaded_slug = self.slug
+        if prices_changed:
+            PriceHistory.objects.create(product=self, price=self.price,
+                                        compare_price=self.compare_price,
+                                        source=PriceHistory.SOURCE_MANUAL)
+            self._loaded_prices = {name: getattr(self, name) for name in self.PRICE_FIELDS}
     
     def get_absolute_url(self):
         return reverse('product-detail', kwargs={'slug': self.slug})
@@ -107,7 +234,7 @@ class Product(models.Model):
             return round(((self.compare_price - self.price) / self.compare_price) * 100, 1)
         return 0
 
-class ProductImage(models.Model):
+class ProductImage(ChangeLoggedModel):
     product = models.ForeignKey(Product, on_delete=models.CASCADE,
                               related_name='images')
     image = models.ImageField(upload_to='products/')
@@ -115,12 +242,15 @@ class ProductImage(models.Model):
     is_default = models.BooleanField(default=False)
     created_at = models.DateTimeField(auto_now_add=True)
     
+    objects = ChangeLoggedQuerySet.as_manager()
+    
     class Meta:
         ordering = ['-is_default', 'created_at']
 
-class ProductReview(models.Model):
+class ProductReview(ChangeLoggedModel):
+    # Indexed by the unique (product, user) constraint
     product = models.ForeignKey(Product, on_delete=models.CASCADE,
-                              related_name='reviews')
+                              related_name='reviews', db_index=False)
     user = models.ForeignKey(User, on_delete=models.CASCADE,
                            related_name='reviews')
     rating = models.IntegerField(validators=[MinValueValidator(1),
@@ -128,15 +258,323 @@ class ProductReview(models.Model):
     title = models.CharField(max_length=200)
     content = models.TextField()
     is_approved = models.BooleanField(default=False)
+    # Set by `manage.py moderate_reviews` (see products.moderation) or a moderator
+    MODERATION_CHOICES = [
+        ('pending', 'Pending'),
+        ('approved', 'Approved'),
+        ('held', 'Held for a moderator'),
+        ('rejected', 'Rejected'),
+    ]
+    moderation_status = models.CharField(max_length=10, choices=MODERATION_CHOICES,
+                                         default='pending')
+    moderation_note = models.CharField(max_length=255, blank=True)
+    moderated_at = models.DateTimeField(null=True, blank=True)
     created_at = models.DateTimeField(auto_now_add=True)
     updated_at = models.DateTimeField(auto_now=True)
     
+    objects = ChangeLoggedQuerySet.as_manager()
+    
     class Meta:
         unique_together = ['product', 'user']
         indexes = [
-            models.Index(fields=['product', 'is_approved']),
+            # A product's approved reviews, newest first
+            models.Index(fields=['product', '-created_at'], name='review_approved_idx',
+                         condition=Q(is_approved=True)),
             models.Index(fields=['rating']),
+            # The moderation queue
+            models.Index(fields=['id'], name='review_pending_idx',
+                         condition=Q(moderation_status='pending')),
         ]
 
 
+class ReviewSignature(models.Model):
+    """MinHash signature of a review's text, for near-duplicate checks"""
+    review = models.OneToOneField(ProductReview, on_delete=models.CASCADE,
+                                  primary_key=True, related_name='signature')
+    # products.moderation.SIGNATURE_SIZE little-endian uint32 values
+    minhash = models.BinaryField()
+
+
+class ReviewBand(models.Model):
+    """
+    One LSH band of a review's signature. Reviews sharing a band key are
+    near-duplicate candidates, found with an index seek per key however
+    many reviews there are.
+    """
+    id = models.BigAutoField(primary_key=True)
+    key = models.BigIntegerField(db_index=True)
+    review = models.ForeignKey(ProductReview, on_delete=models.CASCADE, related_name='+')
+
+
+class PriceScheduleQuerySet(models.QuerySet):
+    def active(self, at=None):
+        """Schedules whose time window contains `at` (default: now)"""
+        at = at or timezone.now()
+        return self.filter(
+            Q(ends_at__isnull=True) | Q(ends_at__gt=at),
+            starts_at__lte=at,
+        )
+    
+    def due(self, at=None):
+        """Active schedules the scheduler has not written to their product yet"""
+        return self.active(at).filter(applied_at__isnull=True)
+    
+    def expired(self, at=None):
+        """Applied schedules whose window has closed but are still live on the product"""
+        at = at or timezone.now()
+        return self.filter(applied_at__isnull=False, reverted_at__isnull=True,
+                           ends_at__lte=at)
+
+class PriceSchedule(models.Model):
+    """
+    Time-bounded price for a product. The apply_price_schedules command
+    copies it onto Product.price when it starts and restores the previous
+    price when it ends; the latest starting schedule wins on overlap.
+    """
+    product = models.ForeignKey(Product, on_delete=models.CASCADE,
+                              related_name='price_schedules')
+    price = models.DecimalField(max_digits=10, decimal_places=2)
+    compare_price = models.DecimalField(max_digits=10, decimal_places=2,
+                                       null=True, blank=True)
+    starts_at = models.DateTimeField()
+    ends_at = models.DateTimeField(null=True, blank=True)
+    # Filled in by the scheduler
+    applied_at = models.DateTimeField(null=True, blank=True, editable=False)
+    reverted_at = models.DateTimeField(null=True, blank=True, editable=False)
+    previous_price = models.DecimalField(max_digits=10, decimal_places=2,
+                                        null=True, blank=True, editable=False)
+    previous_compare_price = models.DecimalField(max_digits=10, decimal_places=2,
+                                                null=True, blank=True, editable=False)
+    created_by = models.ForeignKey(User, on_delete=models.SET_NULL,
+                                  null=True, blank=True, related_name='price_schedules')
+    created_at = models.DateTimeField(auto_now_add=True)
+    
+    objects = PriceScheduleQuerySet.as_manager()
+    
+    class Meta:
+        ordering = ['-starts_at']
+        indexes = [
+            models.Index(fields=['product', 'starts_at']),
+            models.Index(fields=['applied_at', 'starts_at']),
+            models.Index(fields=['reverted_at', 'ends_at']),
+        ]
+    
+    def __str__(self):
+        return f"{self.product} @ {self.price} from {self.starts_at:%Y-%m-%d %H:%M}"
+    
+    def clean(self):
+        if self.ends_at and self.ends_at <= self.starts_at:
+            raise ValidationError({'ends_at': 'End must be after start.'})
+
+class PriceHistory(models.Model):
+    """Append-only log of every price a product has had"""
+    SOURCE_MANUAL = 'manual'
+    SOURCE_SCHEDULE = 'schedule'
+    SOURCE_REVERT = 'revert'
+    SOURCES = [
+        (SOURCE_MANUAL, 'Manual edit'),
+        (SOURCE_SCHEDULE, 'Schedule started'),
+        (SOURCE_REVERT, 'Schedule ended'),
+    ]
+    
+    product = models.ForeignKey(Product, on_delete=models.CASCADE,
+                              related_name='price_history')
+    price = models.DecimalField(max_digits=10, decimal_places=2)
+    compare_price = models.DecimalField(max_digits=10, decimal_places=2,
+                                       null=True, blank=True)
+    source = models.CharField(max_length=20, choices=SOURCES, default=SOURCE_MANUAL)
+    schedule = models.ForeignKey(PriceSchedule, on_delete=models.SET_NULL,
+                               null=True, blank=True, related_name='history')
+    recorded_at = models.DateTimeField(default=timezone.now)
+    
+    class Meta:
+        verbose_name_plural = "Price history"
+        ordering = ['-recorded_at']
+        indexes = [
+            models.Index(fields=['product', 'recorded_at']),
+        ]
+    
+    def save(self, *args, **kwargs):
+        # History rows are never rewritten
+        if self.pk is not None:
+            raise ValueError("PriceHistory entries are append-only")
+        super().save(*args, **kwargs)
+
+
+class CurrencyRate(models.Model):
+    """
+    Exchange rate from settings.BASE_CURRENCY, in which product prices are
+    stored, to another currency, with that currency's rounding rule.
+    products.currency converts prices with it for ?currency=.
+    """
+    ROUND_HALF_EVEN = 'half_even'
+    ROUND_HALF_UP = 'half_up'
+    ROUND_UP = 'up'
+    ROUND_DOWN = 'down'
+    ROUNDING = [
+        (ROUND_HALF_EVEN, 'Half to even'),
+        (ROUND_HALF_UP, 'Half up'),
+        (ROUND_UP, 'Up'),
+        (ROUND_DOWN, 'Down'),
+    ]
+    
+    code = models.CharField(max_length=3, primary_key=True,
+                            help_text='ISO 4217 code, e.g. EUR')
+    rate = models.DecimalField(max_digits=18, decimal_places=8,
+                               validators=[MinValueValidator(Decimal('0.00000001'))],
+                               help_text='Units of this currency per unit of the base currency')
+    decimals = models.PositiveSmallIntegerField(default=2, validators=[MaxValueValidator(4)],
+                                                help_text='Digits of the minor unit (JPY 0, KWD 3)')
+    increment = models.PositiveIntegerField(default=1, validators=[MinValueValidator(1)],
+                                            help_text='Prices are multiples of this many minor units '
+                                                      '(e.g. 5 for CHF cash rounding)')
+    rounding = models.CharField(max_length=10, choices=ROUNDING, default=ROUND_HALF_EVEN)
+    updated_at = models.DateTimeField(auto_now=True)
+    
+    class Meta:
+        ordering = ['code']
+    
+    def __str__(self):
+        return f"{self.code} {self.rate}"
+    
+    def save(self, *args, **kwargs):
+        self.code = self.code.upper()
+        super().save(*args, **kwargs)
+
+
+class RelatedProducts(models.Model):
+    """
+    Precomputed neighbours of a product, most related first, written by
+    `manage.py build_related_products`. Ids are packed as little-endian
+    int64 so the usual list of 12 is a 96 byte blob.
+    """
+    product = models.OneToOneField(Product, on_delete=models.CASCADE,
+                                 primary_key=True, related_name='related_list')
+    neighbors = models.BinaryField()
+    computed_at = models.DateTimeField(default=timezone.now)
+    
+    class Meta:
+        verbose_name_plural = "Related products"
+    
+    @staticmethod
+    def pack(ids):
+        packed = array('q', ids)
+        if sys.byteorder == 'big':
+            packed.byteswap()
+        return packed.tobytes()
+    
+    @staticmethod
+    def unpack(blob):
+        ids = array('q')
+        ids.frombytes(bytes(blob))
+        if sys.byteorder == 'big':
+            ids.byteswap()
+        return ids.tolist()
+    
+    @property
+    def neighbor_ids(self):
+        return self.unpack(self.neighbors)
+
+
+class ChangeLogEntry(models.Model):
+    """
+    One insert/update/delete of a catalog row (see products.changelog).
+    seq is AUTOINCREMENT on SQLite, so numbers are never reused, and
+    writers are serialized, so entries commit in seq order.
+    """
+    ACTIONS = [
+        ('upsert', 'Created or updated'),
+        ('delete', 'Deleted'),
+    ]
+    
+    seq = models.BigAutoField(primary_key=True)
+    model = models.CharField(max_length=30)
+    object_id = models.BigIntegerField()
+    action = models.CharField(max_length=10, choices=ACTIONS, default='upsert')
+    changed_at = models.DateTimeField(default=timezone.now)
+    # Set on product deletes: feed deltas tombstone the row by it once it is gone
+    sku = models.CharField(max_length=100, blank=True)
+    
+    class Meta:
+        verbose_name_plural = "Change log"
+        ordering = ['seq']
+        indexes = [
+            # Compaction looks for newer entries of the same object
+            models.Index(fields=['model', 'object_id', 'seq']),
+            # Feed deltas read the products deleted since a moment
+            models.Index(fields=['model', 'action', 'changed_at']),
+        ]
+    
+    def __str__(self):
+        return f"#{self.seq} {self.action} {self.model} {self.object_id}"
+
+
+class LowStockProduct(models.Model):
+    """
+    Products at or below the highest of settings.STOCK_ALERT_LEVELS, kept
+    up to date by products.stock on every quantity change, so the low-stock
+    list reads this small table rather than filtering every product.
+    """
+    product = models.OneToOneField(Product, on_delete=models.CASCADE,
+                                   primary_key=True, related_name='low_stock')
+    quantity = models.IntegerField()
+    # The lowest alert level the quantity is at or below; 0 is sold out
+    level = models.IntegerField()
+    since = models.DateTimeField(default=timezone.now, help_text='When the product reached this level')
+    
+    class Meta:
+        verbose_name_plural = "Low stock"
+        ordering = ['quantity', 'product_id']
+        indexes = [
+            # The list, optionally filtered by ?level=, emptiest first
+            models.Index(fields=['level', 'quantity']),
+            models.Index(fields=['quantity']),
+        ]
+    
+    def __str__(self):
+        return f"{self.product_id}: {self.quantity} (level {self.level})"
+
+
+class StockEvent(models.Model):
+    """
+    A product's quantity crossed one of settings.STOCK_ALERT_LEVELS (see
+    products.stock). Streamed to staff over server-sent events; rows with
+    no notified_at are the queue `manage.py send_stock_alerts` drains.
+    """
+    id = models.BigAutoField(primary_key=True)
+    # Plain ids and copies: events outlive the products they describe
+    product_id = models.BigIntegerField()
+    sku = models.CharField(max_length=100)
+    name = models.CharField(max_length=200)
+    quantity = models.IntegerField()
+    # Alert level the quantity is now at (None: above all levels) and was at before
+    level = models.IntegerField(null=True, blank=True)
+    previous_level = models.IntegerField(null=True, blank=True)
+    created_at = models.DateTimeField(default=timezone.now)
+    notified_at = models.DateTimeField(null=True, blank=True)
+    
+    class Meta:
+        ordering = ['id']
+        indexes = [
+            models.Index(fields=['product_id', 'id']),
+            # The notification queue
+            models.Index(fields=['id'], name='stock_event_pending_idx',
+                         condition=Q(notified_at__isnull=True)),
+        ]
+    
+    def __str__(self):
+        return f"{self.sku}: {self.describe()}"
+    
+    @property
+    def is_drop(self):
+        return self.previous_level is None or (self.level is not None and self.level < self.previous_level)
+    
+    def describe(self):
+        if self.level == 0:
+            return "sold out"
+        if self.level is not None and self.is_drop:
+            return f"{self.quantity} left (at or below {self.level})"
+        if self.level is None:
+            return f"back above {self.previous_level}, {self.quantity} available"
+        return f"restocked to {self.quantity} (at or below {self.level})"
 
@@ -1,8 +1,37 @@
 from rest_framework import serializers
-from .models import Category, Product, ProductImage, ProductReview
+from .models import Category, LowStockProduct, Product, ProductImage, ProductReview
 from django.utils.text import slugify
+from rest_framework.permissions import SAFE_METHODS
 
-class CategorySerializer(serializers.ModelSerializer):
+
+def requested_fields(request, expandable=()):
+    """
+    Field names asked for with `?fields=a,b` plus any `expandable` relations
+    named in `?expand=`, or None when the full payload is wanted.
+    """
+    if request is None or request.method not in SAFE_METHODS:
+        return None
+    fields = request.query_params.get('fields')
+    if not fields:
+        return None
+    selected = {name.strip() for name in fields.split(',') if name.strip()}
+    expand = request.query_params.get('expand', '')
+    selected |= {name.strip() for name in expand.split(',')} & set(expandable)
+    return selected
+
+class SparseFieldsetMixin:
+    """Drop every field the request's sparse fieldset does not ask for"""
+    expandable_fields = ()
+    
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        selected = requested_fields(self.context.get('request'), self.expandable_fields)
+        if selected is not None:
+            for name in set(self.fields) - selected:
+                self.fields.pop(name)
+
+
+class CategorySerializer(SparseFieldsetMixin, serializers.ModelSerializer):
     class Meta:
         model = Category
         fields = '__all__'
@@ -34,13 +63,31 @@ class ProductReviewSerializer(serializers.ModelSerializer):
     class Meta:
         model = ProductReview
         fields = '__all__'
-        read_only_fields = ('user', 'created_at', 'updated_at')
+        # Approval is decided by moderation, not by the reviewer
+        read_only_fields = ('user', 'is_approved', 'moderation_status', 'moderation_note',
+                            'moderated_at', 'created_at', 'updated_at')
     
     def create(self, validated_data):
         validated_data['user'] = self.context['request'].user
         return super().create(validated_data)
 
-class ProductSerializer(serializers.ModelSerializer):
+class ProductBulkItemSerializer(serializers.ModelSerializer):
+    """
+    One product of a bulk write. Checks that need the database (sku
+    uniqueness, category existence) run once for the whole batch in
+    products.bulk, so validating an item never queries.
+    """
+    category_id = serializers.IntegerField()
+    
+    class Meta:
+        model = Product
+        fields = ['name', 'description', 'price', 'compare_price', 'cost_price',
+                  'sku', 'barcode', 'quantity', 'category_id', 'status', 'featured']
+        extra_kwargs = {'sku': {'validators': []}}
+
+class ProductSerializer(SparseFieldsetMixin, serializers.ModelSerializer):
+    expandable_fields = ('category', 'images', 'reviews')
+    
     category = CategorySerializer(read_only=True)
     category_id = serializers.PrimaryKeyRelatedField(
         queryset=Category.objects.all(),
@@ -72,4 +119,14 @@ class ProductSerializer(serializers.ModelSerializer):
                 'category': 1,
                 'status': 'published'
             }
-        }
\ No newline at end of file
+        }
+
+class LowStockProductSerializer(serializers.ModelSerializer):
+    product_id = serializers.IntegerField(read_only=True)
+    name = serializers.CharField(source='product.name', read_only=True)
+    slug = serializers.CharField(source='product.slug', read_only=True)
+    sku = serializers.CharField(source='product.sku', read_only=True)
+    
+    class Meta:
+        model = LowStockProduct
+        fields = ['product_id', 'name', 'slug', 'sku', 'quantity', 'level', 'since']
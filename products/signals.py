@@ -1,26 +1,104 @@
-from django.db.models.signals import post_save, post_delete
+from django.db import transaction
+from django.db.models.signals import post_save, post_delete, pre_delete
 from django.dispatch import receiver
-from django.db.models import Avg
-from .models import ProductReview, Product
+from .models import Category, CurrencyRate, Product, ProductImage, ProductReview
+from .cache import (BULK_INVALIDATION_THRESHOLD, batch_invalidations, forget_slug, invalidate_all,
+                    invalidate_category, invalidate_products)
+from .changelog import record, record_delete, rows_changed
+from .currency import invalidate_rates
+from . import autocomplete, stock
 
+@receiver([post_save, post_delete], sender=Product)
+def invalidate_product(sender, instance, using, **kwargs):
+    """Rebuild the cached payload when a product changes (on commit)"""
+    with batch_invalidations(using):
+        invalidate_products([instance.pk])
+
+@receiver([post_save, post_delete], sender=Product)
+def forget_product_slug(sender, instance, using, **kwargs):
+    """Drop the slug -> id mappings a delete, re-create or rename made stale"""
+    with batch_invalidations(using):
+        forget_slug(instance.slug, getattr(instance, '_loaded_slug', None))
+
+@receiver([post_save, post_delete], sender=ProductImage)
 @receiver([post_save, post_delete], sender=ProductReview)
-def update_product_rating(sender, instance, **kwargs):
-    """Update product rating cache when reviews change"""
-    product = instance.product
-    approved_reviews = product.reviews.filter(is_approved=True)
-    
-    if approved_reviews.exists():
-        avg_rating = approved_reviews.aggregate(
-            avg_rating=Avg('rating')
-        )['avg_rating']
-        product.average_rating = round(avg_rating, 2)
-        product.review_count = approved_reviews.count()
-    else:
-        product.average_rating = None
-        product.review_count = 0
-    
-    # Save only rating fields to avoid recursion
-    Product.objects.filter(id=product.id).update(
-        average_rating=product.average_rating,
-        review_count=product.review_count
-    )
\ No newline at end of file
+def invalidate_product_children(sender, instance, using, **kwargs):
+    """Images, reviews and review stats are part of the product payload"""
+    with batch_invalidations(using):
+        invalidate_products([instance.product_id])
+
+@receiver([post_save, post_delete], sender=Category)
+def invalidate_category_products(sender, instance, using, **kwargs):
+    """The category is nested in every one of its products' payloads"""
+    with batch_invalidations(using):
+        invalidate_category(instance.pk)
+
+@receiver([post_save, post_delete], sender=CurrencyRate)
+def invalidate_currency_rates(sender, instance, using, **kwargs):
+    """Workers reload the rate table, and converted prices, on their next request"""
+    transaction.on_commit(invalidate_rates, using=using)
+
+@receiver(rows_changed, sender=Product)
+def invalidate_updated_products(sender, pks, **kwargs):
+    """queryset.update()/bulk_update() don't send post_save"""
+    invalidate_products(pks)
+
+@receiver(post_save, sender=Product)
+def track_stock_level(sender, instance, created, using, **kwargs):
+    """Stock events and the low-stock table, in the saving transaction"""
+    stock.quantity_saved(instance, created, using=using)
+
+@receiver(rows_changed, sender=Product)
+def track_stock_levels(sender, pks, **kwargs):
+    """rows_changed doesn't say which columns changed, so every row is checked"""
+    stock.sync(pks)
+
+@receiver(rows_changed, sender=ProductImage)
+@receiver(rows_changed, sender=ProductReview)
+def invalidate_updated_children(sender, pks, **kwargs):
+    if len(pks) > BULK_INVALIDATION_THRESHOLD:
+        invalidate_all()
+        return
+    invalidate_products(set(
+        sender.objects.filter(pk__in=pks).values_list('product_id', flat=True)
+    ))
+
+@receiver(rows_changed, sender=Category)
+def invalidate_updated_categories(sender, pks, **kwargs):
+    if len(pks) > BULK_INVALIDATION_THRESHOLD:
+        invalidate_all()
+        return
+    for pk in pks:
+        invalidate_category(pk)
+
+@receiver([post_save, post_delete], sender=Product)
+def refresh_suggested_product(sender, instance, using, **kwargs):
+    """Autocomplete reloads the product once the change commits"""
+    pk = instance.pk
+    transaction.on_commit(lambda: autocomplete.products_changed([pk]), using=using)
+
+@receiver([post_save, post_delete], sender=Category)
+def refresh_suggested_category(sender, instance, using, **kwargs):
+    pk = instance.pk
+    transaction.on_commit(lambda: autocomplete.categories_changed([pk]), using=using)
+
+@receiver(rows_changed, sender=Product)
+def refresh_suggested_products(sender, pks, **kwargs):
+    autocomplete.products_changed(pks)
+
+@receiver(rows_changed, sender=Category)
+def refresh_suggested_categories(sender, pks, **kwargs):
+    autocomplete.categories_changed(pks)
+
+@receiver(post_delete, sender=Product)
+@receiver(post_delete, sender=Category)
+@receiver(post_delete, sender=ProductImage)
+@receiver(post_delete, sender=ProductReview)
+def log_delete(sender, instance, using, **kwargs):
+    """Change log entry, in the deletion's transaction (cascades included)"""
+    record_delete(instance, using)
+
+@receiver(pre_delete, sender=Category)
+def log_orphaned_products(sender, instance, using, **kwargs):
+    """Deleting a category sets its products' category to NULL without saving them"""
+    record(Product, list(instance.products.values_list('pk', flat=True)), using=using)
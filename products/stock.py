@@ -0,0 +1,171 @@
+"""
+Stock level events and the low-stock table.
+
+settings.STOCK_ALERT_LEVELS lists quantities worth an alert, e.g. [0, 5]:
+a product is at level 5 with 1 to 5 left and at level 0 when sold out.
+Every quantity change is checked here:
+
+* save() through post_save, in the saving transaction. Products keep the
+  quantity they were loaded with, so a save that crosses no level costs
+  nothing,
+* queryset update(), bulk_update() and bulk_create() through rows_changed,
+  once they commit, one read per chunk of changed rows.
+
+A product whose level changed gets a StockEvent, and LowStockProduct holds
+every product at some level with its current quantity. Nothing compares
+against the previous quantity: the previous level is the product's
+LowStockProduct row, so F() updates and concurrent writers are judged
+against what was last recorded.
+
+Events are delivered twice. event_stream() serves them as server-sent
+events; streams in the writing process wake on commit, the others look
+for new rows every STOCK_STREAM_POLL seconds with one primary key range
+read. Rows with no notified_at are the queue `manage.py send_stock_alerts`
+mails in digests.
+"""
+import json
+import threading
+import time
+
+from django.conf import settings
+from django.db import transaction
+from django.utils import timezone
+from rest_framework.renderers import BaseRenderer
+
+SYNC_CHUNK = 500
+STREAM_BATCH = 200
+STREAM_POLL = getattr(settings, 'STOCK_STREAM_POLL', 2)
+# Milliseconds EventSource waits before reconnecting with Last-Event-ID
+STREAM_RETRY = 3000
+
+_wakeup = threading.Condition()
+_state = {'generation': 0}   # bumped whenever this process commits events
+
+
+def alert_levels():
+    return sorted(set(getattr(settings, 'STOCK_ALERT_LEVELS', [0])))
+
+
+def level_for(quantity, levels=None):
+    """The lowest alert level `quantity` is at or below, or None"""
+    for level in alert_levels() if levels is None else levels:
+        if quantity <= level:
+            return level
+    return None
+
+
+def quantity_saved(product, created, using='default'):
+    """post_save of a product: sync it unless the save crossed no level"""
+    quantity = product.quantity
+    loaded = None if created else getattr(product, '_loaded_quantity', None)
+    # F() expressions are only known after a read
+    product._loaded_quantity = quantity if isinstance(quantity, int) else None
+    if isinstance(quantity, int):
+        level = level_for(quantity)
+        if created and level is None:
+            return
+        if isinstance(loaded, int) and (loaded == quantity or (level is None and level_for(loaded) is None)):
+            return
+    sync([product.pk], using=using)
+
+
+def sync(pks, using='default', record_events=True):
+    """
+    Bring the low-stock rows of `pks` in line with their quantities and
+    record an event for each product whose level changed. Returns the
+    number of events.
+    """
+    from .models import LowStockProduct, Product, StockEvent
+
+    levels = alert_levels()
+    pks = list(pks)
+    created = 0
+    for start in range(0, len(pks), SYNC_CHUNK):
+        now = timezone.now()
+        rows = Product.objects.using(using).filter(pk__in=pks[start:start + SYNC_CHUNK]).order_by('id').values_list(
+            'id', 'sku', 'name', 'quantity', 'low_stock__level', 'low_stock__quantity')
+        events, entered, moved, cleared = [], [], [], []
+        for product_id, sku, name, quantity, previous, recorded in rows:
+            level = level_for(quantity, levels)
+            if level != previous and record_events:
+                events.append(StockEvent(product_id=product_id, sku=sku, name=name, quantity=quantity,
+                                         level=level, previous_level=previous, created_at=now))
+            if level is None:
+                if previous is not None:
+                    cleared.append(product_id)
+            elif level != previous:
+                entered.append(LowStockProduct(product_id=product_id, quantity=quantity,
+                                               level=level, since=now))
+            elif quantity != recorded:
+                moved.append(LowStockProduct(product_id=product_id, quantity=quantity, level=level))
+        if not (events or entered or moved or cleared):
+            continue
+        with transaction.atomic(using=using, savepoint=False):
+            for upserts, fields in ((entered, ['quantity', 'level', 'since']), (moved, ['quantity'])):
+                if upserts:
+                    LowStockProduct.objects.using(using).bulk_create(
+                        upserts, update_conflicts=True, unique_fields=['product'], update_fields=fields)
+            if cleared:
+                LowStockProduct.objects.using(using).filter(product_id__in=cleared).delete()
+            if events:
+                StockEvent.objects.using(using).bulk_create(events)
+                created += len(events)
+                transaction.on_commit(_wake, using=using)
+    return created
+
+
+def _wake():
+    with _wakeup:
+        _state['generation'] += 1
+        _wakeup.notify_all()
+
+
+def serialize(event):
+    return {
+        'id': event.id, 'product_id': event.product_id, 'sku': event.sku, 'name': event.name,
+        'quantity': event.quantity, 'level': event.level, 'previous_level': event.previous_level,
+        'created_at': event.created_at.isoformat(),
+    }
+
+
+def event_stream(after=0, duration=None):
+    """
+    Server-sent events for events after id `after`, for `duration` seconds
+    (settings.STOCK_STREAM_SECONDS); the browser reconnects on its own and
+    resumes from the last id it saw.
+    """
+    from .models import StockEvent
+
+    if duration is None:
+        duration = getattr(settings, 'STOCK_STREAM_SECONDS', 300)
+    deadline = time.monotonic() + duration
+    yield f'retry: {STREAM_RETRY}\n\n'
+    while True:
+        # Taken before reading, so events committed meanwhile are not waited out
+        generation = _state['generation']
+        events = list(StockEvent.objects.using('default').filter(id__gt=after)[:STREAM_BATCH])
+        for event in events:
+            after = event.id
+            yield f'id: {event.id}\nevent: stock\ndata: {json.dumps(serialize(event))}\n\n'
+        if len(events) == STREAM_BATCH:
+            continue
+        remaining = deadline - time.monotonic()
+        if remaining <= 0:
+            return
+        with _wakeup:
+            woken = _wakeup.wait_for(lambda: _state['generation'] != generation,
+                                     timeout=min(remaining, STREAM_POLL))
+        if not woken:
+            # Keeps proxies from closing an idle connection
+            yield ': keepalive\n\n'
+
+
+class EventStreamRenderer(BaseRenderer):
+    """Lets `Accept: text/event-stream` through content negotiation"""
+    media_type = 'text/event-stream'
+    format = 'event-stream'
+    charset = 'utf-8'
+
+    def render(self, data, accepted_media_type=None, renderer_context=None):
+        # Only errors get here; the stream itself is a StreamingHttpResponse
+        return f'event: error\ndata: {json.dumps(data)}\n\n'.encode()
@@ -1,3 +1,1095 @@
-from django.test import TestCase
+import json
+import tempfile
+from datetime import timedelta
+from decimal import Decimal
+from io import StringIO
+from pathlib import Path
+from unittest import mock
 
-# Create your tests here.
+from django.conf import settings
+from django.core.cache import cache
+from django.core.management import call_command
+from django.db import DatabaseError, connection, transaction
+from django.test import SimpleTestCase, TestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from django.utils import timezone
+
+from benchmarks.seed import seed_catalog
+from ecommerce import cache as tiered_cache
+from ecommerce import throttling
+from ecommerce.testing import QueryPlanTestCase
+from rest_framework.test import APIClient, APITestCase
+from users.models import User
+
+from . import autocomplete, currency, moderation, stock, tracking
+from . import cache as product_cache
+from .models import (Category, ChangeLogEntry, CurrencyRate, LowStockProduct, PriceHistory, PriceSchedule,
+                     Product, ProductImage, ProductQuerySet, ProductReview, RelatedProducts, ReviewBand,
+                     ReviewSignature, StockEvent)
+
+TEST_SETTINGS = {
+    'CACHES': {'default': {'BACKEND': 'django.core.cache.backends.locmem.LocMemCache'}},
+    'PASSWORD_HASHERS': ['django.contrib.auth.hashers.MD5PasswordHasher'],
+    'STOCK_ALERT_LEVELS': [0, 5],
+    # Streams send what is there and end
+    'STOCK_STREAM_SECONDS': 0,
+}
+
+
+@override_settings(**TEST_SETTINGS)
+class ProductEndpointQueryTests(QueryPlanTestCase):
+    """
+    Query budgets and plans of the catalog endpoints against a seeded
+    catalog. Caches start empty in every test, so "cold" counts include
+    building cached payloads.
+    """
+    snapshot_path = Path(__file__).parent / 'snapshots' / 'query_plans.txt'
+
+    @classmethod
+    def setUpTestData(cls):
+        seed_catalog(products=300, categories=12, users=30, reviews_per_product=3)
+        cls.admin = User.objects.create_superuser(
+            email='admin@example.com', password='adminpass123', first_name='Ad', last_name='Min')
+        cls.user = User.objects.get(email='john.doe@example.com')
+        cls.product = Product.objects.get(slug='premium-wireless-headphones')
+        cls.category = cls.product.category
+        cls.subcategory = Category.objects.filter(parent__isnull=False).order_by('id').first()
+        neighbors = list(Product.objects.published().exclude(pk=cls.product.pk)
+                         .order_by('id').values_list('id', flat=True)[:8])
+        RelatedProducts.objects.create(product=cls.product, neighbors=RelatedProducts.pack(neighbors))
+        CurrencyRate.objects.create(code='EUR', rate=Decimal('0.92'))
+        stock.sync(Product.objects.values_list('id', flat=True), record_events=False)
+
+    def setUp(self):
+        cache.clear()
+        tiered_cache._local.clear()
+        throttling._buckets.clear()
+        currency._table = (None, {})
+        # View counts must not be flushed from a background thread mid-test
+        patcher = mock.patch.object(tracking, 'FLUSH_INTERVAL', float('inf'))
+        patcher.start()
+        self.addCleanup(patcher.stop)
+        # Nor at exit, into whatever database is configured by then
+        self.addCleanup(tracking._views.clear)
+        self.addCleanup(tracking._recent.clear)
+        autocomplete._state['index'] = None
+        self.addCleanup(autocomplete._state.update, index=None)
+
+    # -- listing ---------------------------------------------------------------
+
+    def test_list(self):
+        self.assertQueries('list', 4, 'get', '/api/products/')
+
+    def test_list_page_size(self):
+        response = self.assertQueries('list page_size=100', 4, 'get', '/api/products/?page_size=100')
+        self.assertEqual(len(response.data['results']), 100)
+
+    def test_list_second_page(self):
+        self.assertQueries('list page=3', 4, 'get', '/api/products/?page=3')
+
+    def test_list_category_filter(self):
+        self.assertQueries('list category', 4, 'get',
+                           f'/api/products/?category={self.subcategory.slug}')
+
+    def test_list_search(self):
+        self.assertQueries('list search', 4, 'get', '/api/products/?search=wireless')
+
+    def test_list_price_range(self):
+        self.assertQueries('list price range', 4, 'get',
+                           '/api/products/?min_price=100&max_price=200&ordering=price')
+
+    def test_list_popular(self):
+        self.assertQueries('list ordering=-popularity', 4, 'get', '/api/products/?ordering=-popularity')
+
+    def test_list_top_rated(self):
+        self.assertQueries('list ordering=-average_rating', 4, 'get',
+                           '/api/products/?ordering=-average_rating')
+
+    def test_list_sparse_fields(self):
+        self.assertQueries('list fields=name,slug', 2, 'get', '/api/products/?fields=name,slug')
+
+    def test_list_currency(self):
+        # One more query loads the rate table for this rate version
+        response = self.assertQueries('list currency=EUR', 5, 'get', '/api/products/?currency=EUR')
+        self.assertEqual(response.data['results'][0]['currency'], 'EUR')
+
+    def test_list_unknown_currency(self):
+        self.assertQueries('list currency=XXX', 1, 'get', '/api/products/?currency=xxx', status=400)
+
+    def test_list_staff(self):
+        self.client.force_authenticate(self.admin)
+        # Counting every product reads every row; a scan is the right plan
+        self.assertQueries('list staff', 4, 'get', '/api/products/', allow_scans=['products_product'])
+
+    def test_featured(self):
+        self.assertQueries('featured', 3, 'get', '/api/products/featured/')
+
+    def test_on_sale(self):
+        self.assertQueries('on_sale', 4, 'get', '/api/products/on_sale/')
+
+    # -- detail ----------------------------------------------------------------
+
+    def test_detail_cold_then_warm(self):
+        url = f'/api/products/{self.product.slug}/'
+        self.assertQueries('detail cold', 4, 'get', url)
+        self.assertQueries('detail warm', 0, 'get', url)
+
+    def test_detail_currency(self):
+        url = f'/api/products/{self.product.slug}/?currency=EUR'
+        response = self.assertQueries('detail currency=EUR cold', 5, 'get', url)
+        self.assertEqual(response.data['price'], str((self.product.price * Decimal('0.92')).quantize(
+            Decimal('0.01'))))
+        self.assertQueries('detail currency=EUR warm', 0, 'get', url)
+
+    def test_detail_after_delete_and_rename(self):
+        self.client.force_authenticate(self.admin)
+        data = {'name': 'Lamp', 'description': 'A lamp', 'price': '20.00', 'quantity': 30,
+                'category_id': self.category.id, 'status': 'published'}
+        deleted = self.client.post('/api/products/', {**data, 'sku': 'LAMP-1'}).data
+        self.assertEqual(self.client.get('/api/products/lamp/').status_code, 200)
+        with self.captureOnCommitCallbacks(execute=True):
+            self.assertEqual(self.client.delete('/api/products/lamp/').status_code, 204)
+        # Another worker still maps the slug to the deleted product
+        product_cache.remember_slug('lamp', deleted['id'])
+        lamp = self.client.post('/api/products/', {**data, 'sku': 'LAMP-2'}).data
+        response = self.client.get('/api/products/lamp/')
+        self.assertEqual((response.status_code, response.data['id']), (200, lamp['id']))
+
+        product = Product.objects.get(pk=lamp['id'])
+        version = cache.get(product_cache.version_key('product', product.pk))
+        with self.captureOnCommitCallbacks(execute=True):
+            product.slug = 'desk-lamp'
+            product.save()
+            # Readers may still cache the old row until the commit
+            self.assertEqual(cache.get(product_cache.version_key('product', product.pk)), version)
+        self.assertNotEqual(cache.get(product_cache.version_key('product', product.pk)), version)
+        self.assertEqual(self.client.get('/api/products/lamp/').status_code, 404)
+        self.assertEqual(self.client.get('/api/products/desk-lamp/').status_code, 200)
+
+    def test_detail_sparse_fields(self):
+        self.assertQueries('detail fields=name,price', 1, 'get',
+                           f'/api/products/{self.product.slug}/?fields=name,price')
+
+    def test_detail_missing(self):
+        self.assertQueries('detail missing', 1, 'get', '/api/products/no-such-product/', status=404)
+
+    def test_batch(self):
+        slugs = ','.join(Product.objects.published().order_by('id').values_list('slug', flat=True)[:20])
+        self.assertQueries('batch cold', 4, 'get', f'/api/products/batch/?slugs={slugs}')
+        self.assertQueries('batch warm', 1, 'get', f'/api/products/batch/?slugs={slugs}')
+
+    def test_related(self):
+        self.assertQueries('related', 4, 'get', f'/api/products/{self.product.slug}/related/')
+
+    def test_recently_viewed(self):
+        self.client.force_authenticate(self.user)
+        self.client.get(f'/api/products/{self.product.slug}/')
+        self.assertQueries('recently_viewed', 0, 'get', '/api/products/recently_viewed/')
+
+    def test_failed_view_flush_is_retried(self):
+        self.client.force_authenticate(self.user)
+        self.client.get(f'/api/products/{self.product.slug}/')
+        with mock.patch.object(tracking, 'apply_views', side_effect=DatabaseError('locked')), \
+                self.assertLogs('ecommerce', 'ERROR'):
+            self.assertEqual(tracking.flush(), 0)
+        self.assertEqual(tracking._views, {self.product.pk: 1})
+        self.assertEqual(tracking.recently_viewed(self.user), [self.product.pk])
+
+        self.assertEqual(tracking.flush(), 1)
+        self.assertEqual(Product.objects.get(pk=self.product.pk).view_count, self.product.view_count + 1)
+        self.assertEqual(tracking._recent, {})
+        self.assertEqual(tracking.recently_viewed(self.user), [self.product.pk])
+
+    def test_failed_view_flush_does_not_double_count(self):
+        products = list(Product.objects.order_by('pk')[:3])
+        for product in products:
+            tracking.record_view(product.pk)
+        update = ProductQuerySet.update
+        calls = []
+
+        def fail_second_chunk(queryset, **kwargs):
+            calls.append(kwargs)
+            if len(calls) == 2:
+                raise DatabaseError('disk I/O error')
+            return update(queryset, **kwargs)
+
+        with mock.patch.object(tracking, 'FLUSH_CHUNK', 2), \
+                mock.patch.object(ProductQuerySet, 'update', fail_second_chunk), \
+                self.assertLogs('ecommerce', 'ERROR'):
+            self.assertEqual(tracking.flush(), 0)
+        self.assertEqual(len(calls), 2)
+        self.assertEqual(tracking._views, {product.pk: 1 for product in products})
+        self.assertEqual(tracking.flush(), 3)
+        self.assertEqual([p.view_count for p in Product.objects.filter(pk__in=[p.pk for p in products])
+                          .order_by('pk')], [product.view_count + 1 for product in products])
+
+    def test_autocomplete(self):
+        # The first lookup builds the index: the change log cursor and the products
+        response = self.assertQueries('autocomplete', 2, 'get', '/api/products/autocomplete/?q=wirel')
+        self.assertIn(self.product.id, [result['id'] for result in response.data['results']])
+        self.assertQueries('autocomplete warm', 0, 'get', '/api/products/autocomplete/?q=headphone')
+
+    # -- categories and reviews ------------------------------------------------
+
+    def test_categories(self):
+        self.assertQueries('categories', 2, 'get', '/api/categories/')
+
+    def test_category_detail(self):
+        self.assertQueries('category detail', 1, 'get', f'/api/categories/{self.category.slug}/')
+
+    def test_reviews(self):
+        self.assertQueries('reviews', 2, 'get', f'/api/products/{self.product.slug}/reviews/')
+
+    def test_review_create(self):
+        product = Product.objects.published().exclude(reviews__user=self.admin).order_by('id').first()
+        self.client.force_authenticate(self.admin)
+        self.assertQueries('review create', 4, 'post', f'/api/products/{product.slug}/reviews/',
+                           {'product': product.id, 'rating': 4, 'title': 'Good',
+                            'content': 'Works well'}, status=201)
+
+    # -- writes ----------------------------------------------------------------
+
+    def test_create(self):
+        self.client.force_authenticate(self.admin)
+        # Starts at 3, below the level 5 stock alert: the low-stock row and event are 3 of them
+        self.assertQueries('create', 11, 'post', '/api/products/', {
+            'name': 'Test Lamp', 'description': 'A lamp', 'price': '20.00', 'sku': 'TEST-LAMP',
+            'quantity': 3, 'category_id': self.category.id, 'status': 'published',
+        }, status=201)
+
+    def test_partial_update(self):
+        self.client.force_authenticate(self.admin)
+        self.assertQueries('partial update', 8, 'patch', f'/api/products/{self.product.slug}/',
+                           {'quantity': 7})
+
+    def test_partial_update_sold_out(self):
+        self.client.force_authenticate(self.admin)
+        # Crossing a stock level adds the low-stock row and event to the save
+        self.assertQueries('partial update sold out', 11, 'patch', f'/api/products/{self.product.slug}/',
+                           {'quantity': 0})
+        self.assertEqual(StockEvent.objects.get().level, 0)
+
+    def test_bulk(self):
+        skus = list(Product.objects.order_by('id').values_list('sku', flat=True)[1:21])
+        self.client.force_authenticate(self.admin)
+        # Deleted products' reviews take their moderation signatures and bands with them
+        response = self.assertQueries('bulk', 23, 'post', '/api/products/bulk/', {
+            'create': [{'name': f'Bulk Item {i}', 'sku': f'BULK-{i}', 'price': '5.00',
+                        'description': 'x', 'category_id': self.category.id} for i in range(20)],
+            'update': [{'sku': sku, 'quantity': 1} for sku in skus[:10]],
+            'delete': [{'sku': sku} for sku in skus[10:]],
+        }, format='json')
+        self.assertEqual(response.data['counts'].get('created'), 20)
+
+    # -- stock -------------------------------------------------------------------
+
+    def test_low_stock(self):
+        self.client.force_authenticate(self.admin)
+        response = self.assertQueries('stock low', 2, 'get', '/api/stock/low/')
+        self.assertEqual(response.data['count'], Product.objects.filter(quantity__lte=5).count())
+        self.assertQueries('stock low level=0', 2, 'get', '/api/stock/low/?level=0')
+
+    def test_stock_events(self):
+        with self.captureOnCommitCallbacks(execute=True):
+            Product.objects.filter(pk=self.product.pk).update(quantity=2)
+        self.client.force_authenticate(self.admin)
+        self.assertQueries('stock events', 1, 'get', '/api/stock/events/',
+                           HTTP_ACCEPT='text/event-stream')
+        response = self.client.get('/api/stock/events/', HTTP_ACCEPT='text/event-stream')
+        body = b''.join(response.streaming_content).decode()
+        event = StockEvent.objects.get()
+        self.assertIn(f'id: {event.id}\nevent: stock\n', body)
+        self.assertIn('"level": 5, "previous_level": null', body)
+        # Reconnecting with the last id seen resumes after it
+        response = self.client.get('/api/stock/events/', HTTP_ACCEPT='text/event-stream',
+                                   HTTP_LAST_EVENT_ID=str(event.id))
+        self.assertNotIn('event: stock', b''.join(response.streaming_content).decode())
+
+    def test_stock_anonymous(self):
+        self.assertQueries('stock events anonymous', 0, 'get', '/api/stock/events/', status=401,
+                           HTTP_ACCEPT='text/event-stream')
+
+    # -- feeds -------------------------------------------------------------------
+
+    def test_product_feed(self):
+        self.assertQueries('feed jsonl', 1, 'get', '/api/feed/products.jsonl')
+
+    def test_product_feed_delta(self):
+        since = timezone.now()
+        draft = Product.objects.filter(status='draft').first()
+        draft.quantity += 1
+        draft.save()
+        # update() sets updated_at too, so the delta has these rows
+        published = list(Product.objects.published().order_by('id').values_list('id', flat=True)[:2])
+        Product.objects.filter(id__in=published).update(quantity=9)
+        response = self.client.get('/api/feed/products.jsonl', {'since': since.isoformat()},
+                                   HTTP_ACCEPT='application/x-ndjson')
+        rows = [json.loads(line) for line in b''.join(response.streaming_content).splitlines()]
+        self.assertEqual(response.status_code, 200)
+        # Drafts are not public: id, sku and status only
+        self.assertEqual(rows[0], {'id': draft.id, 'sku': draft.sku, 'status': 'draft'})
+        self.assertEqual([row['id'] for row in rows[1:]], published)
+        self.assertEqual({row['quantity'] for row in rows[1:]}, {9})
+
+        response = self.client.get('/api/feed/products.xml', {'since': since.isoformat()})
+        self.assertIn(f'<item><g:id>{draft.sku}</g:id><g:availability>out_of_stock</g:availability>'
+                      '</item>', b''.join(response.streaming_content).decode())
+        response = self.client.get('/api/feed/products.csv', {'since': 'yesterday'})
+        self.assertEqual(response.status_code, 400)
+
+    def test_product_feed_delta_deleted(self):
+        since = timezone.now()
+        gone, recreated = Product.objects.published().order_by('id')[:2]
+        gone_id = gone.id
+        gone.delete()
+        recreated.delete()
+        Product.objects.create(name='Second Life', description='x', price=5, sku=recreated.sku,
+                               status='published')
+        response = self.client.get('/api/feed/products.jsonl', {'since': since.isoformat()},
+                                   HTTP_ACCEPT='application/x-ndjson')
+        rows = [json.loads(line) for line in b''.join(response.streaming_content).splitlines()]
+        # In time order: the re-created SKU's tombstone comes before its new row
+        self.assertEqual([(row['sku'], row['status']) for row in rows],
+                         [(gone.sku, 'deleted'), (recreated.sku, 'deleted'), (recreated.sku, 'published')])
+        self.assertEqual(rows[0], {'id': gone_id, 'sku': gone.sku, 'status': 'deleted'})
+
+        response = self.client.get('/api/feed/products.xml', {'since': since.isoformat()})
+        self.assertIn(f'<item><g:id>{gone.sku}</g:id><g:availability>out_of_stock</g:availability>'
+                      '</item>', b''.join(response.streaming_content).decode())
+
+    def test_change_feed(self):
+        self.client.force_authenticate(self.admin)
+        self.assertQueries('changes', 1, 'get', '/api/changes/?after=0&limit=100')
+        for limit in ('0', '-1', '5001', 'all'):
+            self.assertEqual(self.client.get(f'/api/changes/?limit={limit}').status_code, 400, limit)
+
+
+@override_settings(**TEST_SETTINGS)
+class ProductCacheInvalidationTests(TestCase):
+    """A delete invalidates the products once, on commit, however many rows it removes"""
+
+    @classmethod
+    def setUpTestData(cls):
+        category = Category.objects.create(name='Lamps')
+        cls.products = Product.objects.bulk_create([
+            Product(name=f'Lamp {i}', slug=f'lamp-{i}', description='x', price=10, sku=f'LAMP-{i}',
+                    category=category, status='published')
+            for i in range(12)
+        ])
+        ProductImage.objects.bulk_create([ProductImage(product=product, image=f'products/{product.slug}.jpg')
+                                          for product in cls.products])
+        cls.pks = [product.pk for product in cls.products]
+
+    def setUp(self):
+        cache.clear()
+        tiered_cache._local.clear()
+
+    def versions(self):
+        return product_cache._versions('product', self.pks)
+
+    def test_queryset_delete_writes_each_cache_once(self):
+        before = self.versions()
+        shared = mock.Mock(wraps=cache)
+        with mock.patch.object(product_cache, 'cache', shared), \
+                self.captureOnCommitCallbacks(execute=True):
+            # Cascades to the images; every row sends post_delete
+            Product.objects.filter(pk__in=self.pks).delete()
+            self.assertEqual(shared.method_calls, [])
+        self.assertEqual([call[0] for call in shared.method_calls], ['set_many'])
+        after = self.versions()
+        self.assertFalse([pk for pk in self.pks if after[pk] == before[pk]])
+        self.assertEqual(ChangeLogEntry.objects.filter(action='delete').count(), 24)
+
+    def test_cascading_delete_writes_each_cache_once(self):
+        product = self.products[0]
+        product_cache.remember_slug(product.slug, product.pk)
+        ProductImage.objects.bulk_create([ProductImage(product=product, image=f'products/more-{i}.jpg')
+                                          for i in range(5)])
+        before = self.versions()
+        shared = mock.Mock(wraps=cache)
+        with mock.patch.object(product_cache, 'cache', shared), \
+                self.captureOnCommitCallbacks(execute=True):
+            Product.objects.get(pk=product.pk).delete()
+        self.assertEqual([call[0] for call in shared.method_calls], ['set_many'])
+        self.assertNotEqual(self.versions()[product.pk], before[product.pk])
+        self.assertIsNone(product_cache.id_for_slug(product.slug))
+        self.assertEqual(ChangeLogEntry.objects.filter(action='delete').count(), 7)
+
+
+@override_settings(**TEST_SETTINGS)
+class CurrencyConversionTests(SimpleTestCase):
+    """Page conversion rounds exactly as Decimal would"""
+
+    def assertConverts(self, rate, amounts, expected):
+        self.assertEqual(rate.convert_amounts(amounts), expected)
+        # Memoized the second time, same answers
+        self.assertEqual(rate.convert_amounts(amounts), expected)
+
+    def test_half_even(self):
+        # 0.125 and 0.135 are exact halves of a cent; floats would misround them
+        rate = currency.Rate('EUR', Decimal('0.5'))
+        self.assertConverts(rate, ['0.25', '0.27', '0.29', '10.00'], ['0.12', '0.14', '0.14', '5.00'])
+
+    def test_half_up_and_directed(self):
+        amounts = ['0.25', '0.27', '0.01']
+        self.assertConverts(currency.Rate('EUR', Decimal('0.5'), rounding='half_up'),
+                            amounts, ['0.13', '0.14', '0.01'])
+        self.assertConverts(currency.Rate('EUR', Decimal('0.5'), rounding='up'),
+                            amounts, ['0.13', '0.14', '0.01'])
+        self.assertConverts(currency.Rate('EUR', Decimal('0.5'), rounding='down'),
+                            amounts, ['0.12', '0.13', '0.00'])
+
+    def test_minor_units_and_increment(self):
+        self.assertConverts(currency.Rate('JPY', Decimal('151.337'), decimals=0),
+                            ['1.00', '99.99'], ['151', '15132'])
+        self.assertConverts(currency.Rate('KWD', Decimal('0.30712'), decimals=3),
+                            ['1.00', '99.99'], ['0.307', '30.709'])
+        # Swiss cash rounding to 0.05
+        self.assertConverts(currency.Rate('CHF', Decimal('0.88'), increment=5),
+                            ['1.00', '1.04', '3.10'], ['0.90', '0.90', '2.75'])
+
+    def test_matches_decimal(self):
+        rate = Decimal('1.23456789')
+        amounts = [f'{n // 100}.{n % 100:02d}' for n in range(0, 200000, 37)]
+        expected = [str((Decimal(a) * rate).quantize(Decimal('0.01'))) for a in amounts]
+        self.assertConverts(currency.Rate('EUR', rate), amounts, expected)
+
+
+@override_settings(**TEST_SETTINGS, REST_FRAMEWORK={
+    **settings.REST_FRAMEWORK,
+    'DEFAULT_THROTTLE_RATES': {'search': '2/min', 'list': '3/min', 'detail': '3/min', 'feed': '1/hour'},
+})
+class ThrottleTests(APITestCase):
+    """Scoped token buckets on the catalog endpoints"""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.product = Product.objects.create(name='Lamp', description='x', price=10, sku='LAMP',
+                                             status='published')
+        cls.user = User.objects.create_user(email='user@example.com', password='x',
+                                            first_name='U', last_name='Ser')
+        cls.admin = User.objects.create_superuser(email='admin@example.com', password='x',
+                                                  first_name='Ad', last_name='Min')
+
+    def setUp(self):
+        cache.clear()
+        tiered_cache._local.clear()
+        throttling._buckets.clear()
+
+    def statuses(self, url, times):
+        return [self.client.get(url).status_code for _ in range(times)]
+
+    def test_search_has_its_own_bucket(self):
+        self.assertEqual(self.statuses('/api/products/?search=lamp', 3), [200, 200, 429])
+        # Plain listing pages are still allowed
+        self.assertEqual(self.statuses('/api/products/', 4), [200, 200, 200, 429])
+        response = self.client.get('/api/products/?search=lamp')
+        self.assertGreater(int(response['Retry-After']), 0)
+
+    def test_feed(self):
+        # Partners ask for the feed's own type; the refusal is still JSON
+        self.assertEqual(self.statuses('/api/feed/products.csv', 2), [200, 429])
+        response = self.client.get('/api/feed/products.jsonl', HTTP_ACCEPT='text/csv')
+        self.assertEqual((response.status_code, response['Content-Type']), (429, 'application/json'))
+
+    def test_buckets_refill(self):
+        with mock.patch('ecommerce.throttling.time.time', return_value=1000.0):
+            self.assertEqual(self.statuses('/api/products/', 4), [200, 200, 200, 429])
+        # 3/min: one request back every 20 seconds
+        with mock.patch('ecommerce.throttling.time.time', return_value=1020.0):
+            self.assertEqual(self.statuses('/api/products/', 2), [200, 429])
+
+    def test_spoofed_forwarded_for(self):
+        # Through the proxy: whatever the client sent, then the address the proxy saw
+        statuses = [
+            self.client.get('/api/products/', REMOTE_ADDR='10.0.0.1',
+                            HTTP_X_FORWARDED_FOR=f'198.51.100.{n}, 203.0.113.7').status_code
+            for n in range(4)
+        ]
+        self.assertEqual(statuses, [200, 200, 200, 429])
+        response = self.client.get('/api/products/', REMOTE_ADDR='10.0.0.1',
+                                   HTTP_X_FORWARDED_FOR='203.0.113.8')
+        self.assertEqual(response.status_code, 200)
+        # Served directly, the header is ignored
+        with override_settings(REST_FRAMEWORK={**settings.REST_FRAMEWORK, 'NUM_PROXIES': 0}):
+            statuses = [self.client.get('/api/products/', HTTP_X_FORWARDED_FOR=f'198.51.100.{n}').status_code
+                        for n in range(4)]
+        self.assertEqual(statuses, [200, 200, 200, 429])
+
+    def test_per_user_and_staff_exempt(self):
+        url = f'/api/products/{self.product.slug}/'
+        self.assertEqual(self.statuses(url, 4), [200, 200, 200, 429])
+        self.client.force_authenticate(self.user)
+        self.assertEqual(self.statuses(url, 4), [200, 200, 200, 429])
+        self.client.force_authenticate(self.admin)
+        self.assertEqual(self.statuses(url, 5), [200] * 5)
+
+
+@override_settings(**TEST_SETTINGS)
+class PriceTests(TestCase):
+    """Price history on save, and apply_price_schedules"""
+
+    @classmethod
+    def setUpTestData(cls):
+        category = Category.objects.create(name='Prices')
+        cls.product = Product.objects.create(name='Priced', description='x', price=Decimal('100'),
+                                             sku='PRICED', quantity=5, category=category)
+        cls.start = timezone.now()
+
+    def history(self):
+        return list(PriceHistory.objects.filter(product=self.product).order_by('id')
+                    .values_list('price', 'source'))
+
+    def test_save_records_price_changes(self):
+        self.assertEqual(self.history(), [(Decimal('100'), PriceHistory.SOURCE_MANUAL)])
+        product = Product.objects.get(pk=self.product.pk)
+        product.name = 'Renamed'
+        product.save()
+        product.price = Decimal('90')
+        product.save()
+        self.assertEqual(self.history()[1:], [(Decimal('90'), PriceHistory.SOURCE_MANUAL)])
+
+    def test_save_with_deferred_prices(self):
+        PriceHistory.objects.filter(product=self.product).delete()
+        product = Product.objects.only('id', 'name').get(pk=self.product.pk)
+        product.name = 'Renamed'
+        product.save()
+        self.assertEqual(self.history(), [])
+        # Read on access, then changed
+        product = Product.objects.defer('price').get(pk=self.product.pk)
+        self.assertEqual(product.price, Decimal('100'))
+        product.price = Decimal('80')
+        product.save()
+        self.assertEqual(self.history(), [(Decimal('80'), PriceHistory.SOURCE_MANUAL)])
+
+    def schedule(self, price, starts, ends=None):
+        return PriceSchedule.objects.create(
+            product=self.product, price=Decimal(price), starts_at=self.start + timedelta(hours=starts),
+            ends_at=None if ends is None else self.start + timedelta(hours=ends))
+
+    def price_at(self, hours):
+        """Run the scheduler `hours` after self.start; returns the product's price"""
+        call_command('apply_price_schedules', at=(self.start + timedelta(hours=hours)).isoformat(),
+                     stdout=StringIO())
+        return Product.objects.get(pk=self.product.pk).price
+
+    def test_schedule_starts_and_reverts(self):
+        sale = self.schedule('80', 1, 3)
+        self.assertEqual(self.price_at(0), Decimal('100'))
+        self.assertEqual(self.price_at(2), Decimal('80'))
+        # Nothing due: nothing written
+        self.assertEqual(self.price_at(2.5), Decimal('80'))
+        self.assertEqual(self.price_at(4), Decimal('100'))
+        sale.refresh_from_db()
+        self.assertEqual(sale.previous_price, Decimal('100'))
+        self.assertIsNotNone(sale.reverted_at)
+        self.assertEqual([source for price, source in self.history()], [
+            PriceHistory.SOURCE_MANUAL, PriceHistory.SOURCE_SCHEDULE, PriceHistory.SOURCE_REVERT])
+
+    def test_overlapping_schedules(self):
+        self.schedule('80', 0, 4)
+        self.schedule('70', 2, 6)
+        # The latest start wins while both are active
+        self.assertEqual([self.price_at(hours) for hours in (1, 3, 5, 7)],
+                         [Decimal('80'), Decimal('70'), Decimal('70'), Decimal('100')])
+
+    def test_nested_schedules(self):
+        self.schedule('80', 0, 10)
+        self.schedule('60', 2, 4)
+        # The outer sale resumes when the inner one ends, then the base price returns
+        self.assertEqual([self.price_at(hours) for hours in (1, 3, 5, 11)],
+                         [Decimal('80'), Decimal('60'), Decimal('80'), Decimal('100')])
+
+    def test_revert_keeps_manual_edits(self):
+        sale = self.schedule('80', 0, 2)
+        self.assertEqual(self.price_at(1), Decimal('80'))
+        product = Product.objects.get(pk=self.product.pk)
+        product.price = Decimal('75')
+        product.save()
+        self.assertEqual(self.price_at(3), Decimal('75'))
+        sale.refresh_from_db()
+        self.assertIsNotNone(sale.reverted_at)
+        self.assertNotIn(PriceHistory.SOURCE_REVERT, [source for price, source in self.history()])
+
+        # The edited price is what a later sale reverts to
+        self.schedule('50', 4, 6)
+        self.assertEqual([self.price_at(hours) for hours in (5, 7)], [Decimal('50'), Decimal('75')])
+
+    def test_manual_edit_during_nested_schedule(self):
+        self.schedule('80', 0, 10)
+        self.schedule('60', 2, 4)
+        self.assertEqual(self.price_at(3), Decimal('60'))
+        product = Product.objects.get(pk=self.product.pk)
+        product.price = Decimal('65')
+        product.save()
+        # The outer sale resumes and then reverts to the edited price
+        self.assertEqual([self.price_at(hours) for hours in (5, 11)], [Decimal('80'), Decimal('65')])
+
+
+@override_settings(**TEST_SETTINGS)
+class CatalogSnapshotTests(TestCase):
+    """export_catalog_snapshot rewrites only what changed since the last run"""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.lamps = Category.objects.create(name='Lamps')
+        cls.chairs = Category.objects.create(name='Chairs')
+        cls.lamp, cls.desk_lamp, cls.chair = Product.objects.bulk_create([
+            Product(name=name, slug=slug, description='x', price=10, sku=slug.upper(), quantity=5,
+                    category=category, status='published')
+            for name, slug, category in [('Lamp', 'lamp', cls.lamps), ('Desk Lamp', 'desk-lamp', cls.lamps),
+                                         ('Chair', 'chair', cls.chairs)]
+        ])
+        Product.objects.create(name='Draft', description='x', price=10, sku='DRAFT', category=cls.lamps)
+
+    def setUp(self):
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        self.root = Path(directory.name)
+
+    def export(self):
+        out = StringIO()
+        call_command('export_catalog_snapshot', output=str(self.root), page_size=1, stdout=out)
+        return out.getvalue()
+
+    def files(self):
+        # Files are replaced by rename, so a rewritten file has a new inode.
+        # .br siblings depend on brotli being installed
+        return {str(path.relative_to(self.root)): path.stat().st_ino
+                for path in self.root.rglob('*') if path.is_file() and path.suffix != '.br'}
+
+    def test_full_export(self):
+        self.assertIn('3 products re-rendered', self.export())
+        files = self.files()
+        self.assertEqual(sorted(name for name in files if name.startswith('products/')),
+                         ['products/chair.json', 'products/chair.json.gz', 'products/desk-lamp.json',
+                          'products/desk-lamp.json.gz', 'products/lamp.json', 'products/lamp.json.gz'])
+        page = json.loads((self.root / 'categories' / 'lamps' / 'page-1.json').read_text())
+        self.assertEqual((page['count'], page['total_pages'], page['links']['next']), (2, 2, 'page-2.json'))
+        tree = json.loads((self.root / 'categories.json').read_text())
+        self.assertEqual({node['slug']: node['product_count'] for node in tree}, {'lamps': 2, 'chairs': 1})
+        detail = json.loads((self.root / 'products' / 'lamp.json').read_text())
+        self.assertEqual(detail['name'], 'Lamp')
+
+    def test_rerun_rewrites_nothing(self):
+        self.export()
+        before = self.files()
+        self.assertIn('0 products re-rendered, 0 removed, 1 files written', self.export())
+        after = self.files()
+        # Only the manifest, which records when it was generated
+        self.assertEqual({name for name in after if after[name] != before.get(name)}, {'manifest.json'})
+
+    def test_one_changed_product(self):
+        self.export()
+        before = self.files()
+        product = Product.objects.get(pk=self.chair.pk)
+        product.name = 'Armchair'
+        product.save()
+        self.assertIn('1 products re-rendered', self.export())
+        after = self.files()
+        changed = {name for name in after if after[name] != before.get(name)}
+        self.assertEqual(changed, {'products/chair.json', 'products/chair.json.gz',
+                                   'categories/chairs/page-1.json', 'categories/chairs/page-1.json.gz',
+                                   'manifest.json'})
+        self.assertEqual(json.loads((self.root / 'products' / 'chair.json').read_text())['name'],
+                         'Armchair')
+
+    def test_unpublished_product_is_removed(self):
+        self.export()
+        Product.objects.filter(pk=self.desk_lamp.pk).update(status='archived')
+        self.assertIn('1 removed', self.export())
+        self.assertFalse((self.root / 'products' / 'desk-lamp.json').exists())
+        self.assertFalse((self.root / 'categories' / 'lamps' / 'page-2.json').exists())
+
+
+@override_settings(**TEST_SETTINGS)
+class GenerateCatalogTests(TestCase):
+    """generate_catalog output, its compact fixtures and --clear"""
+
+    def generate(self, products=30, **options):
+        call_command('generate_catalog', products=products, users=10, depth=2, branching=2,
+                     batch_size=7, stdout=StringIO(), **options)
+
+    def catalog(self):
+        return {model._meta.label: list(model.objects.order_by('pk').values_list())
+                for model in (User, Category, Product, ProductReview, ProductImage)}
+
+    def test_same_seed_same_catalog(self):
+        self.generate(seed=3)
+        first = self.catalog()
+        self.assertEqual([len(first[label]) for label in ('users.User', 'products.Category',
+                                                           'products.Product')], [10, 6, 30])
+        self.assertTrue(first['products.ProductReview'])
+        self.generate(seed=3, clear=True)
+        # Timestamps are the only columns that depend on when it ran
+        names = lambda catalog: [row[:8] for row in catalog['products.Product']]
+        self.assertEqual(names(self.catalog()), names(first))
+        self.generate(seed=4, clear=True)
+        self.assertNotEqual(names(self.catalog()), names(first))
+
+    def test_dump_load_round_trip(self):
+        self.generate()
+        before = self.catalog()
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        path = str(Path(directory.name) / 'catalog.jsonl.gz')
+        call_command('generate_catalog', dump=path, stdout=StringIO())
+        call_command('generate_catalog', load=path, clear=True, stdout=StringIO())
+        self.assertEqual(self.catalog(), before)
+
+    def test_clear_deletes_cascaded_rows_per_table(self):
+        def clear():
+            with self.captureOnCommitCallbacks(execute=True), CaptureQueriesContext(connection) as queries:
+                call_command('generate_catalog', products=0, users=0, depth=0, clear=True,
+                             stdout=StringIO())
+            return len(queries)
+
+        self.generate(products=5)
+        product = Product.objects.order_by('pk').first()
+        RelatedProducts.objects.create(product=product, neighbors=RelatedProducts.pack([product.pk + 1]))
+        small = clear()
+        self.generate(products=60)
+        version = cache.get(product_cache.version_key('catalog', 'all'))
+        self.assertEqual(clear(), small)
+        self.assertNotEqual(cache.get(product_cache.version_key('catalog', 'all')), version)
+        for model in (User, Category, Product, ProductReview, ProductImage, RelatedProducts):
+            self.assertFalse(model.objects.exists(), model)
+
+
+@override_settings(**TEST_SETTINGS)
+class RelatedProductsTests(APITestCase):
+    """build_related_products scoring, the packed neighbour lists and the related endpoint"""
+
+    @classmethod
+    def setUpTestData(cls):
+        lamps = Category.objects.create(name='Lamps')
+        chairs = Category.objects.create(name='Chairs')
+        cls.products = {}
+        for name, category, price, status in [
+            ('Brass Desk Lamp', lamps, 40, 'published'),
+            ('Brass Floor Lamp', lamps, 45, 'published'),
+            ('Steel Desk Lamp', lamps, 300, 'published'),
+            ('Brass Desk Lamp Prototype', lamps, 40, 'draft'),
+            ('Oak Chair', chairs, 120, 'published'),
+            ('Oak Armchair', chairs, 130, 'published'),
+        ]:
+            product = Product.objects.create(name=name, description='x', price=price, category=category,
+                                             sku=name.upper().replace(' ', '-'), status=status)
+            cls.products[product.slug] = product
+        # The same people review the steel lamp and the chair
+        for i in range(3):
+            user = User.objects.create_user(email=f'buyer{i}@example.com', password='x',
+                                            first_name='Buyer', last_name=str(i))
+            for slug in ('steel-desk-lamp', 'oak-chair'):
+                ProductReview.objects.create(product=cls.products[slug], user=user, rating=5, title='Good',
+                                             content='Good', is_approved=True)
+        cls.admin = User.objects.create_superuser(email='admin@example.com', password='x',
+                                                  first_name='Ad', last_name='Min')
+
+    def setUp(self):
+        cache.clear()
+        tiered_cache._local.clear()
+        throttling._buckets.clear()
+
+    def neighbors(self, slug):
+        return [Product.objects.get(pk=pk).slug
+                for pk in RelatedProducts.objects.get(product=self.products[slug]).neighbor_ids]
+
+    def test_pack_round_trip(self):
+        ids = [3, 1, 2 ** 40]
+        packed = RelatedProducts.pack(ids)
+        self.assertEqual(len(packed), 24)
+        self.assertEqual(RelatedProducts.unpack(packed), ids)
+        self.assertEqual(RelatedProducts.unpack(memoryview(packed)), ids)
+        self.assertEqual(RelatedProducts.unpack(RelatedProducts.pack([])), [])
+
+    def test_build(self):
+        draft = self.products['brass-desk-lamp-prototype']
+        RelatedProducts.objects.create(product=draft, neighbors=RelatedProducts.pack([draft.pk]))
+        out = StringIO()
+        call_command('build_related_products', top_k=2, stdout=out)
+        self.assertIn('Stored related products for 5 products', out.getvalue())
+        # Same category, nearest price and shared name tokens first; unrelated
+        # and unpublished products never
+        self.assertEqual(self.neighbors('brass-desk-lamp'), ['brass-floor-lamp', 'steel-desk-lamp'])
+        self.assertEqual(self.neighbors('oak-armchair'), ['oak-chair'])
+        # Co-reviews relate products across categories
+        self.assertEqual(self.neighbors('oak-chair'), ['oak-armchair', 'steel-desk-lamp'])
+        self.assertFalse(RelatedProducts.objects.filter(product=draft).exists())
+
+    def test_build_is_deterministic(self):
+        call_command('build_related_products', stdout=StringIO())
+        first = dict(RelatedProducts.objects.values_list('product_id', 'neighbors'))
+        call_command('build_related_products', stdout=StringIO())
+        self.assertEqual(dict(RelatedProducts.objects.values_list('product_id', 'neighbors')), first)
+
+    def test_related_keeps_order_and_hides_unpublished(self):
+        lamp, steel, draft, floor = (self.products[slug] for slug in (
+            'brass-desk-lamp', 'steel-desk-lamp', 'brass-desk-lamp-prototype', 'brass-floor-lamp'))
+        RelatedProducts.objects.create(product=lamp,
+                                       neighbors=RelatedProducts.pack([steel.pk, draft.pk, floor.pk]))
+        RelatedProducts.objects.create(product=draft, neighbors=RelatedProducts.pack([lamp.pk]))
+
+        def related(slug):
+            response = self.client.get(f'/api/products/{slug}/related/')
+            if response.status_code != 200:
+                return response.status_code, None
+            return response.status_code, [product['slug'] for product in response.data]
+
+        self.assertEqual(related('brass-desk-lamp'), (200, ['steel-desk-lamp', 'brass-floor-lamp']))
+        self.assertEqual(related('brass-desk-lamp-prototype'), (404, None))
+        self.assertEqual(related('oak-chair'), (200, []))
+        self.client.force_authenticate(self.admin)
+        self.assertEqual(related('brass-desk-lamp'),
+                         (200, ['steel-desk-lamp', 'brass-desk-lamp-prototype', 'brass-floor-lamp']))
+        self.assertEqual(related('brass-desk-lamp-prototype'), (200, ['brass-desk-lamp']))
+
+
+@override_settings(**TEST_SETTINGS)
+class StockLevelTests(TestCase):
+    """Stock events and low-stock rows follow every kind of quantity change"""
+
+    @classmethod
+    def setUpTestData(cls):
+        category = Category.objects.create(name='Stock')
+        cls.products = Product.objects.bulk_create([
+            Product(name=f'Stock {i}', slug=f'stock-{i}', description='x', price=10,
+                    sku=f'STOCK-{i}', quantity=50, category=category)
+            for i in range(3)
+        ])
+
+    def levels(self):
+        return dict(LowStockProduct.objects.values_list('product_id', 'level'))
+
+    def events(self):
+        return list(StockEvent.objects.values_list('product_id', 'previous_level', 'level'))
+
+    def test_queryset_update(self):
+        first, second, third = (product.pk for product in self.products)
+        with self.captureOnCommitCallbacks(execute=True):
+            Product.objects.filter(pk__in=[first, second]).update(quantity=3)
+        with self.captureOnCommitCallbacks(execute=True):
+            Product.objects.filter(pk=first).update(quantity=0)
+        # Same level, new quantity: no event
+        with self.captureOnCommitCallbacks(execute=True):
+            Product.objects.filter(pk=second).update(quantity=1)
+        self.assertEqual(self.levels(), {first: 0, second: 5})
+        self.assertEqual(LowStockProduct.objects.get(pk=second).quantity, 1)
+        with self.captureOnCommitCallbacks(execute=True):
+            Product.objects.filter(pk__in=[first, second, third]).update(quantity=20)
+        self.assertEqual(self.levels(), {})
+        self.assertEqual(self.events(), [
+            (first, None, 5), (second, None, 5), (first, 5, 0), (first, 0, None), (second, 5, None),
+        ])
+
+    def test_save(self):
+        product = Product.objects.get(pk=self.products[0].pk)
+        with self.assertNumQueries(2):
+            # Quantity above every level before and after: no stock queries
+            product.quantity = 40
+            product.save()
+        product.quantity = 0
+        product.save()
+        product.quantity = 0
+        product.save()
+        self.assertEqual(self.levels(), {product.pk: 0})
+        self.assertEqual(self.events(), [(product.pk, None, 0)])
+        self.assertEqual(str(StockEvent.objects.get()), 'STOCK-0: sold out')
+
+
+@override_settings(**TEST_SETTINGS)
+class ReviewModerationTests(TestCase):
+    """Pending reviews are approved, or held as spam or near-duplicates"""
+    client_class = APIClient
+    TEXT = 'The battery easily lasts two full days and the screen stays readable in bright sun'
+
+    @classmethod
+    def setUpTestData(cls):
+        category = Category.objects.create(name='Reviews')
+        cls.first, cls.second = Product.objects.bulk_create([
+            Product(name=f'Reviewed {i}', slug=f'reviewed-{i}', description='x', price=10,
+                    sku=f'REVIEWED-{i}', quantity=50, category=category)
+            for i in range(2)
+        ])
+        cls.users = [User.objects.create_user(email=f'reviewer{i}@example.com', password='x',
+                                              first_name='R', last_name=str(i))
+                     for i in range(3)]
+
+    def review(self, product, user, content, **fields):
+        return ProductReview.objects.create(product=product, user=user, rating=4,
+                                            title='Review', content=content, **fields)
+
+    def status(self, review):
+        review.refresh_from_db()
+        return review.moderation_status
+
+    def test_moderate(self):
+        original = self.review(self.first, self.users[0], self.TEXT)
+        copied = self.review(self.first, self.users[1], self.TEXT.replace('sun', 'sunlight'))
+        reposted = self.review(self.second, self.users[0], self.TEXT)
+        genuine = self.review(self.second, self.users[2],
+                              'Solid build, although the charger gets warm after an hour of use')
+        spam = self.review(self.second, self.users[1],
+                           'Click here: www.cheap-deals.example.com and use my discount code')
+        # Two per batch: later batches find earlier ones through the stored bands
+        self.assertEqual(moderation.moderate(batch_size=2), (2, 3))
+
+        self.assertEqual(self.status(original), 'approved')
+        self.assertTrue(original.is_approved)
+        self.assertEqual(self.status(genuine), 'approved')
+        for review in (copied, reposted, spam):
+            self.assertEqual(self.status(review), 'held')
+            self.assertFalse(review.is_approved)
+        self.assertIn(f'of review #{original.pk} on the same product', copied.moderation_note)
+        self.assertIn(f'of review #{original.pk} by the same user', reposted.moderation_note)
+        self.assertIn("'discount code'", spam.moderation_note)
+        self.assertEqual(ReviewBand.objects.count(), moderation.BANDS * ReviewSignature.objects.count())
+        # Nothing left in the queue
+        self.assertEqual(moderation.moderate(), (0, 0))
+
+    def test_moderator_decisions_stand(self):
+        spam = self.review(self.first, self.users[0], 'Click here for free money: www.deals.example.com')
+        genuine = self.review(self.second, self.users[1], self.TEXT)
+        batch = list(ProductReview.objects.filter(pk__in=[spam.pk, genuine.pk]))
+        # Decided by hand while the batch was being scored
+        ProductReview.objects.filter(pk=spam.pk).update(moderation_status='rejected')
+        ProductReview.objects.filter(pk=genuine.pk).update(moderation_status='held',
+                                                           moderation_note='Checking with the buyer')
+        self.assertEqual(moderation.moderate_batch(batch), (0, 0))
+        self.assertEqual(self.status(spam), 'rejected')
+        self.assertEqual(self.status(genuine), 'held')
+        self.assertEqual(genuine.moderation_note, 'Checking with the buyer')
+
+    def test_unrelated_reviews(self):
+        # Same words, but another product and another user: not compared
+        self.review(self.first, self.users[0], self.TEXT)
+        self.review(self.second, self.users[1], self.TEXT)
+        self.assertEqual(moderation.moderate(), (2, 0))
+
+    def test_index_existing(self):
+        approved = self.review(self.first, self.users[0], self.TEXT,
+                               is_approved=True, moderation_status='approved')
+        self.assertEqual(moderation.index_existing(), 1)
+        self.assertEqual(moderation.index_existing(), 0)
+        copied = self.review(self.first, self.users[1], self.TEXT)
+        self.assertEqual(moderation.moderate(), (0, 1))
+        self.assertIn(f'review #{approved.pk}', ProductReview.objects.get(pk=copied.pk).moderation_note)
+
+    def test_short_reviews_are_not_compared(self):
+        self.review(self.first, self.users[0], 'Great product')
+        self.review(self.first, self.users[1], 'Great product')
+        self.assertEqual(moderation.moderate(), (2, 0))
+        self.assertFalse(ReviewSignature.objects.exists())
+
+    def test_similarity(self):
+        base = moderation.signature(moderation.shingles(self.TEXT))
+        edited = moderation.signature(moderation.shingles(self.TEXT.replace('two', 'three')))
+        other = moderation.signature(moderation.shingles('Arrived late and the box was damaged on one side'))
+        self.assertEqual(moderation.similarity(base, base), 1.0)
+        # Jaccard similarity of the shingle sets is 12/18
+        self.assertAlmostEqual(moderation.similarity(base, edited), 12 / 18, delta=0.15)
+        self.assertLess(moderation.similarity(base, other), 0.2)
+        self.assertEqual(len(set(moderation.band_keys(base)) & set(moderation.band_keys(other))), 0)
+
+    def test_spam_score(self):
+        self.assertEqual(moderation.spam_score(self.TEXT), (0.0, []))
+        score, reasons = moderation.spam_score('BEST DEAL EVER, ORDER TODAY AND SAVE!!!!!!! deals@example.com')
+        self.assertGreaterEqual(score, 0.5)
+        self.assertEqual(reasons, ['1 link', 'contact details', 'shouting', 'repeated characters'])
+
+    def test_reviewers_cannot_approve_their_own(self):
+        self.client.force_authenticate(self.users[0])
+        response = self.client.post(f'/api/products/{self.first.slug}/reviews/', {
+            'product': self.first.id, 'rating': 5, 'title': 'Mine', 'content': 'Mine',
+            'is_approved': True,
+        })
+        self.assertEqual(response.status_code, 201)
+        self.assertEqual(response.data['moderation_status'], 'pending')
+        self.assertFalse(ProductReview.objects.get(pk=response.data['id']).is_approved)
+
+
+@override_settings(**TEST_SETTINGS)
+class AutocompleteTests(TestCase):
+    """Prefix and typo-tolerant suggestions, kept in step with catalog changes"""
+    client_class = APIClient
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.audio = Category.objects.create(name='Audio')
+        cls.cables = Category.objects.create(name='Cables')
+        cls.headphones, cls.speaker, cls.earbuds, cls.cable = Product.objects.bulk_create([
+            Product(name=name, slug=slug, description='x', price=10, sku=sku, quantity=5,
+                    category=category, status='published', popularity=popularity)
+            for name, slug, sku, category, popularity in [
+                ('Wireless Headphones', 'wireless-headphones', 'AUD-100', cls.audio, 50),
+                ('Wireless Speaker', 'wireless-speaker', 'AUD-200', cls.audio, 80),
+                ('Noise Cancelling Earbuds', 'earbuds', 'AUD-300', cls.audio, 20),
+                ('Braided Charging Cable', 'charging-cable', 'CAB-100', cls.cables, 10),
+            ]
+        ])
+
+    def setUp(self):
+        throttling._buckets.clear()
+        autocomplete._state['index'] = None
+        self.addCleanup(autocomplete._state.update, index=None)
+        self.addCleanup(autocomplete._dirty['products'].clear)
+        self.addCleanup(autocomplete._dirty['categories'].clear)
+        # Change log polling runs when a test asks for it
+        for name in ('SYNC_INTERVAL', 'REBUILD_INTERVAL'):
+            patcher = mock.patch.object(autocomplete, name, float('inf'))
+            patcher.start()
+            self.addCleanup(patcher.stop)
+
+    def suggest(self, query, **params):
+        response = self.client.get('/api/products/autocomplete/', {'q': query, **params})
+        self.assertEqual(response.status_code, 200)
+        return [result['slug'] for result in response.data['results']]
+
+    def test_prefix(self):
+        # Most popular first
+        self.assertEqual(self.suggest('wirel'), ['wireless-speaker', 'wireless-headphones'])
+        self.assertEqual(self.suggest('WIRELESS head'), ['wireless-headphones'])
+        self.assertEqual(self.suggest('wire', limit=1), ['wireless-speaker'])
+        self.assertEqual(self.suggest(''), [])
+
+    def test_category_and_sku(self):
+        self.assertEqual(self.suggest('cables'), ['charging-cable'])
+        self.assertEqual(self.suggest('aud 300'), ['earbuds'])
+
+    def test_typos(self):
+        self.assertEqual(self.suggest('wireles speeker'), ['wireless-speaker'])
+        self.assertEqual(self.suggest('cancleling'), ['earbuds'])
+        # Short words must match as typed
+        self.assertEqual(self.suggest('cbl'), [])
+
+    def test_invalid_limit(self):
+        response = self.client.get('/api/products/autocomplete/?q=wire&limit=many')
+        self.assertEqual(response.status_code, 400)
+
+    def test_follows_changes(self):
+        self.assertEqual(self.suggest('earb'), ['earbuds'])
+        with self.captureOnCommitCallbacks(execute=True):
+            self.earbuds.name = 'Noise Cancelling Headphones'
+            self.earbuds.save()
+        self.assertEqual(self.suggest('earb'), [])
+        self.assertIn('earbuds', self.suggest('headph'))
+
+        with self.captureOnCommitCallbacks(execute=True):
+            Product.objects.filter(pk=self.speaker.pk).update(status='archived')
+        self.assertEqual(self.suggest('wirel'), ['wireless-headphones'])
+
+        with self.captureOnCommitCallbacks(execute=True):
+            self.cables.name = 'Chargers'
+            self.cables.save()
+        self.assertEqual(self.suggest('charger'), ['charging-cable'])
+
+    def test_syncs_changes_from_other_processes(self):
+        self.assertEqual(self.suggest('wirel'), ['wireless-speaker', 'wireless-headphones'])
+        with self.captureOnCommitCallbacks(execute=True):
+            Product.objects.create(name='Wireless Keyboard', slug='wireless-keyboard', description='x',
+                                   price=30, sku='KEY-100', category=self.audio, status='published')
+        # As if another worker had saved it: only the change log tells
+        autocomplete._dirty['products'].clear()
+        self.assertNotIn('wireless-keyboard', self.suggest('wirel'))
+        with mock.patch.object(autocomplete, 'SYNC_INTERVAL', 0):
+            self.assertIn('wireless-keyboard', self.suggest('wirel'))
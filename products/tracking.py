@@ -0,0 +1,162 @@
+"""
+Product view tracking.
+
+record_view() only bumps in-process counters, so a detail read costs a
+dict update. Every PRODUCT_VIEWS_FLUSH_INTERVAL seconds the next view
+starts a background flush that writes the accumulated counts with one
+batched `UPDATE ... SET view_count = CASE id WHEN ...` per chunk, all in
+one transaction.
+
+`popularity` is a time-decayed view count stored in log2 space relative
+to a fixed epoch: a view at time t adds 2 ** ((t - EPOCH) / HALF_LIFE).
+Older views are therefore worth less than new ones without ever
+rewriting rows that are not being viewed, and ordering by the column
+ranks by the decayed score as of any moment.
+"""
+import atexit
+import logging
+import math
+import threading
+import time
+from collections import Counter, OrderedDict
+from datetime import datetime, timezone as dt_timezone
+
+from django.conf import settings
+from django.db import DatabaseError, connections, transaction
+from django.db.models import Case, F, Value, When
+from django.utils import timezone
+
+from ecommerce.cache import TieredCache
+
+logger = logging.getLogger('ecommerce')
+
+FLUSH_INTERVAL = getattr(settings, 'PRODUCT_VIEWS_FLUSH_INTERVAL', 10)
+HALF_LIFE = getattr(settings, 'PRODUCT_POPULARITY_HALF_LIFE', 3 * 24 * 60 * 60)
+EPOCH = datetime(2025, 1, 1, tzinfo=dt_timezone.utc)
+RECENT_LIMIT = 20
+FLUSH_CHUNK = 500
+
+# Read-modify-write from several workers, so skip the in-process tier
+recently_viewed_cache = TieredCache('recently-viewed', timeout=30 * 24 * 60 * 60, local_ttl=0)
+
+_lock = threading.Lock()
+_views = Counter()    # product id -> views since the last flush
+_recent = {}          # user id -> OrderedDict of product ids, newest last
+_state = {'flushed_at': time.monotonic(), 'flushing': False}
+
+
+def record_view(product_id, user=None):
+    """Count a view of `product_id`; never touches the database"""
+    with _lock:
+        _views[product_id] += 1
+        if user is not None and user.is_authenticated:
+            recent = _recent.setdefault(user.pk, OrderedDict())
+            recent.pop(product_id, None)
+            recent[product_id] = None
+            while len(recent) > RECENT_LIMIT:
+                recent.popitem(last=False)
+        due = (not _state['flushing']
+               and time.monotonic() - _state['flushed_at'] >= FLUSH_INTERVAL)
+        if due:
+            _state['flushing'] = True
+    if due:
+        threading.Thread(target=_flush_in_background, daemon=True).start()
+
+
+def _flush_in_background():
+    try:
+        flush()
+    finally:
+        # This thread's DB connections would otherwise never be closed
+        connections.close_all()
+
+
+def flush():
+    """Write the buffered counts of this process; returns the number of products updated"""
+    with _lock:
+        views, recent = dict(_views), _recent.copy()
+        _views.clear()
+        _recent.clear()
+        _state['flushing'] = True
+    try:
+        updated = apply_views(views)
+        for user_id, product_ids in recent.items():
+            _merge_recent(user_id, list(product_ids))
+        return updated
+    except DatabaseError:
+        # Keep the counts for the next attempt rather than losing them
+        logger.exception('Flushing product views failed')
+        with _lock:
+            _views.update(views)
+            for user_id, product_ids in recent.items():
+                # Views recorded during the flush are newer
+                newer = _recent.pop(user_id, OrderedDict())
+                merged = OrderedDict.fromkeys(pk for pk in product_ids if pk not in newer)
+                merged.update(newer)
+                while len(merged) > RECENT_LIMIT:
+                    merged.popitem(last=False)
+                _recent[user_id] = merged
+        return 0
+    finally:
+        with _lock:
+            _state['flushed_at'] = time.monotonic()
+            _state['flushing'] = False
+
+
+# Don't drop the last interval's views on a clean shutdown
+atexit.register(flush)
+
+
+def decayed_score(views, at):
+    """log2 of `views` views at `at`, in popularity units"""
+    return math.log2(views) + (at - EPOCH).total_seconds() / HALF_LIFE
+
+
+def _log2_add(a, b):
+    """log2(2**a + 2**b) without overflowing"""
+    hi, lo = max(a, b), min(a, b)
+    return hi + math.log2(1 + 2 ** (lo - hi))
+
+
+def apply_views(views, at=None):
+    """Add {product_id: views} to view_count and popularity in batched UPDATEs"""
+    from .models import Product
+
+    at = at or timezone.now()
+    ids = list(views)
+    updated = 0
+    # One transaction for every chunk: a failed flush puts all of its views
+    # back, so none of them may have been committed. IMMEDIATE transactions
+    # take the write lock before the first read, so concurrent flushes from
+    # other workers can't lose each other's scores
+    with transaction.atomic():
+        for start in range(0, len(ids), FLUSH_CHUNK):
+            chunk = ids[start:start + FLUSH_CHUNK]
+            current = dict(Product.objects.filter(id__in=chunk).values_list('id', 'popularity'))
+            if not current:
+                continue
+            scores = {}
+            for pk, popularity in current.items():
+                score = decayed_score(views[pk], at)
+                # 0 is the default for products never viewed
+                scores[pk] = _log2_add(popularity, score) if popularity > 0 else score
+            updated += Product.objects.filter(id__in=current).update(
+                view_count=Case(*[When(id=pk, then=F('view_count') + views[pk]) for pk in current]),
+                popularity=Case(*[When(id=pk, then=Value(score)) for pk, score in scores.items()]),
+            )
+    return updated
+
+
+def _merge_recent(user_id, product_ids):
+    key = f'user:{user_id}'
+    merged = [pk for pk in recently_viewed_cache.get(key, []) if pk not in product_ids]
+    merged = (list(reversed(product_ids)) + merged)[:RECENT_LIMIT]
+    recently_viewed_cache.set(key, merged)
+
+
+def recently_viewed(user):
+    """Product ids the user viewed, newest first, including unflushed views"""
+    with _lock:
+        pending = list(reversed(_recent.get(user.pk, {})))
+    stored = recently_viewed_cache.get(f'user:{user.pk}', [])
+    return (pending + [pk for pk in stored if pk not in pending])[:RECENT_LIMIT]
@@ -1,6 +1,7 @@
-from django.urls import path, include
+from django.urls import path, include, re_path
 from rest_framework.routers import DefaultRouter
-from .views import CategoryViewSet, ProductViewSet, ProductReviewViewSet
+from .views import (CategoryViewSet, ProductViewSet, ProductReviewViewSet, LowStockView,
+                    ProductFeedView, change_feed, stock_events)
 
 router = DefaultRouter()
 router.register(r'categories', CategoryViewSet)
@@ -13,4 +14,9 @@ router.register(
 
 urlpatterns = [
     path('', include(router.urls)),
+    path('changes/', change_feed, name='change-feed'),
+    path('stock/low/', LowStockView.as_view(), name='low-stock'),
+    path('stock/events/', stock_events, name='stock-events'),
+    re_path(r'^feed/products\.(?P<fmt>jsonl|csv|xml)$', ProductFeedView.as_view(),
+            name='product-feed'),
 ]
\ No newline at end of file
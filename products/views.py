@@ -2,6 +2,7 @@ from django.shortcuts import render
 from rest_framework import viewsets, filters, status
 from rest_framework.decorators import action
 from rest_framework.response import Response
+from rest_framework.exceptions import NotFound, ValidationError
 from rest_framework.permissions import IsAuthenticatedOrReadOnly, IsAdminUser
 from django_filters.rest_framework import DjangoFilterBackend
 from .models import Category, Product, ProductImage, ProductReview 
@@ -14,14 +15,33 @@ from django.db.models import Count, Avg, Q, Prefetch
 from django.utils.decorators import method_decorator
 from django.views.decorators.vary import vary_on_cookie
 from django.db import models
-from .models import Category, Product, ProductImage, ProductReview
-from .serializers import CategorySerializer, ProductSerializer, ProductReviewSerializer
+from .models import Category, LowStockProduct, Product, ProductImage, ProductReview, RelatedProducts
+from .serializers import (CategorySerializer, ProductSerializer, ProductReviewSerializer,
+                          LowStockProductSerializer, requested_fields)
 from .filters import ProductFilter
 from .pagination import StandardResultsSetPagination
 from rest_framework.permissions import IsAuthenticated, AllowAny
+from ecommerce.db_router import ReplicaReadMixin
+from . import autocomplete as product_autocomplete
+from . import cache as product_cache
+from . import currency
+from . import stock
+from . import tracking
+from .feeds import CONTENT_TYPES, render_feed
+from .bulk import BulkProductWrite
+from .changelog import changes_after
+from rest_framework.decorators import api_view, permission_classes, renderer_classes
+from rest_framework.generics import ListAPIView
+from rest_framework.negotiation import BaseContentNegotiation
+from rest_framework.renderers import JSONRenderer
+from rest_framework.settings import api_settings
+from rest_framework.views import APIView
+from django.http import StreamingHttpResponse
+from django.utils import timezone
+from django.utils.dateparse import parse_datetime
 
 
-class CategoryViewSet(viewsets.ModelViewSet):
+class CategoryViewSet(ReplicaReadMixin, viewsets.ModelViewSet):
     """
     Category API - Admin only for write operations
     """
@@ -29,23 +49,35 @@ class CategoryViewSet(viewsets.ModelViewSet):
     serializer_class = CategorySerializer
     permission_classes = [IsAdminOrReadOnly]  # Only admin can create/edit
     lookup_field = 'slug'
+    throttle_scopes = {'list': 'list', 'retrieve': 'detail'}
     
     def get_queryset(self):
         # Show only active categories to everyone
-        return Category.objects.filter(is_active=True)
+        queryset = Category.objects.filter(is_active=True)
+        fields = requested_fields(self.request)
+        if fields is not None:
+            columns = {f.name for f in Category._meta.concrete_fields} & fields
+            queryset = queryset.only('id', *columns)
+        return queryset
 
-class ProductViewSet(viewsets.ModelViewSet):
+class ProductViewSet(ReplicaReadMixin, viewsets.ModelViewSet):
     """
     Product API - Admin only for write operations
     """
     queryset = Product.objects.all()
     serializer_class = ProductSerializer
     permission_classes = [IsAdminOrReadOnly]  # Only admin can create/edit
-    filter_backends = [DjangoFilterBackend, filters.SearchFilter, filters.OrderingFilter]
+    # ?search= is handled by ProductFilter; SearchFilter on the same
+    # parameter only repeated the LIKE conditions
+    filter_backends = [DjangoFilterBackend, filters.OrderingFilter]
     filterset_class = ProductFilter
     pagination_class = StandardResultsSetPagination
-    search_fields = ['name', 'description', 'sku']
-    ordering_fields = ['price', 'created_at', 'name', 'average_rating']
+    throttle_scopes = {
+        'list': 'list', 'featured': 'list', 'on_sale': 'list',
+        'retrieve': 'detail', 'batch': 'detail', 'related': 'detail', 'recently_viewed': 'detail',
+        'autocomplete': 'autocomplete',
+    }
+    ordering_fields = ['price', 'created_at', 'name', 'average_rating', 'popularity', 'view_count']
     ordering = ['-created_at']
     lookup_field = 'slug'
     
@@ -53,28 +85,193 @@ class ProductViewSet(viewsets.ModelViewSet):
         """
         Optimized queryset that avoids the select_related + annotations conflict
         """
-        # Apply annotations FIRST
-        queryset = Product.objects.annotate(
-            average_rating=Avg('reviews__rating'),
-            review_count=Count('reviews')
-        )
+        if getattr(self, 'swagger_fake_view', False):
+            return Product.objects.none()
+        queryset = Product.objects.all()
         
         # Only show published products for non-staff users
         if not self.request.user.is_staff:
-            queryset = queryset.filter(status='published')
+            queryset = queryset.published()
         
-        # Apply select_related and prefetch_related
-        queryset = queryset.select_related('category', 'created_by').prefetch_related(
-            'images',
-            Prefetch('reviews', queryset=ProductReview.objects.filter(is_approved=True))
-        )
+        # Sparse fieldsets (?fields=/?expand=) only load what they render
+        fields = requested_fields(self.request, ProductSerializer.expandable_fields)
+        if fields is not None and 'average_rating' in self.request.query_params.get('ordering', ''):
+            fields = fields | {'average_rating'}
         
-        return queryset
+        # Annotations, select_related and prefetch_related
+        return queryset.for_catalog(fields)
+    
+    def get_throttle_scope(self, request):
+        scope = self.throttle_scopes.get(self.action)
+        # Searches are LIKE scans, far dearer than a page of the listing
+        if scope == 'list' and request.query_params.get('search'):
+            return 'search'
+        return scope
+    
+    def initial(self, request, *args, **kwargs):
+        super().initial(request, *args, **kwargs)
+        # ?currency=: checked before any work, applied to the payloads on the way out
+        self.currency = currency.requested(request)
+    
+    def _priced(self, payloads):
+        """Serialized products with their prices in the requested currency"""
+        if self.currency is None:
+            return payloads
+        return currency.convert_payloads(payloads, self.currency)
+    
+    def get_paginated_response(self, data):
+        return super().get_paginated_response(self._priced(data))
     
     def perform_create(self, serializer):
         # Auto-set the creator as the current user (admin)
         serializer.save(created_by=self.request.user)
     
+    def perform_update(self, serializer):
+        product = serializer.save()
+        # DRF drops the object's prefetched images/reviews after saving, and
+        # rendering it would then load every review and its user one by one
+        # (unapproved ones included); render a copy loaded like a detail read
+        serializer.instance = self.get_queryset().get(pk=product.pk)
+    
+    batch_max_size = 300
+    batch_lookups = {'slugs': 'slug', 'ids': 'id', 'skus': 'sku'}
+    
+    @action(detail=False, methods=['get', 'post'], permission_classes=[AllowAny])
+    def batch(self, request):
+        """
+        Fetch many products in one request, in request order.
+        GET ?slugs=a,b (or ids=/skus=), or POST {"slugs": [...]} for long lists.
+        """
+        source = request.data if request.method == 'POST' else request.query_params
+        given = [key for key in self.batch_lookups if key in source]
+        if len(given) != 1:
+            return Response({'detail': 'Provide exactly one of: slugs, ids, skus.'},
+                            status=status.HTTP_400_BAD_REQUEST)
+        key = given[0]
+        field = self.batch_lookups[key]
+        values = source[key]
+        if isinstance(values, str):
+            values = [v for v in values.split(',') if v]
+        if not isinstance(values, list) or len(values) > self.batch_max_size:
+            return Response({'detail': f'{key} must be a list of at most {self.batch_max_size} values.'},
+                            status=status.HTTP_400_BAD_REQUEST)
+        if field == 'id':
+            try:
+                values = [int(v) for v in values]
+            except (TypeError, ValueError):
+                return Response({'detail': 'ids must be integers.'},
+                                status=status.HTTP_400_BAD_REQUEST)
+        values = [str(v) if field != 'id' else v for v in values]
+        
+        # One narrow IN query maps the lookups to ids (and applies visibility)
+        visible = Product.objects.all() if request.user.is_staff else Product.objects.published()
+        ids_by_value = dict(visible.filter(**{f'{field}__in': set(values)}).values_list(field, 'id'))
+        
+        fields = requested_fields(request, ProductSerializer.expandable_fields)
+        if fields is None:
+            # Full payloads are cached per product; only misses hit the DB
+            payloads = product_cache.get_or_build(ids_by_value.values(), self._build_payloads)
+        else:
+            products = list(Product.objects.filter(id__in=ids_by_value.values()).for_catalog(fields))
+            payloads = {
+                product.id: data
+                for product, data in zip(products, self.get_serializer(products, many=True).data)
+            }
+        
+        payloads = dict(zip(payloads, self._priced(list(payloads.values()))))
+        results = []
+        for value in values:
+            product_id = ids_by_value.get(value)
+            results.append({
+                'lookup': value,
+                'found': product_id in payloads,
+                'product': payloads.get(product_id),
+            })
+        return Response({'count': len(results), 'results': results})
+    
+    def _build_payloads(self, ids):
+        """Full payloads for the product cache, always read from the primary"""
+        products = list(Product.objects.using('default').filter(id__in=ids).for_catalog())
+        data = self.get_serializer(products, many=True).data
+        return {product.id: payload for product, payload in zip(products, data)}
+    
+    def retrieve(self, request, *args, **kwargs):
+        # Sparse fieldsets are cheap to build and are not cached
+        if requested_fields(request, ProductSerializer.expandable_fields) is not None:
+            instance = self.get_object()
+            tracking.record_view(instance.pk, request.user)
+            return Response(self._priced([self.get_serializer(instance).data])[0])
+        
+        slug = kwargs[self.lookup_field]
+        product_id = product_cache.id_for_slug(slug)
+        payload = None
+        if product_id is not None:
+            payload = product_cache.get_or_build([product_id], self._build_payloads).get(product_id)
+        if payload is None or payload['slug'] != slug:
+            # Not cached, or a stale mapping: the product was renamed, or deleted
+            # and another one created with its slug. Look it up again, once
+            product_id = Product.objects.filter(slug=slug).values_list('id', flat=True).first()
+            if product_id is None:
+                product_cache.forget_slug(slug)
+                raise NotFound()
+            product_cache.remember_slug(slug, product_id)
+            payload = product_cache.get_or_build([product_id], self._build_payloads).get(product_id)
+        # Visibility is checked on the payload
+        if (payload is None or payload['slug'] != slug
+                or (not request.user.is_staff and payload['status'] != 'published')):
+            raise NotFound()
+        tracking.record_view(product_id, request.user)
+        return Response(self._priced([payload])[0])
+    
+    @action(detail=False, methods=['post'], permission_classes=[IsAdminUser])
+    def bulk(self, request):
+        """
+        Create, update and delete many products in one transaction.
+        POST {"create": [...], "update": [{"sku": ..., ...}], "delete": [{"slug": ...}], "atomic": true}
+        """
+        status_code, body = BulkProductWrite(request.data, request.user).run()
+        return Response(body, status=status_code)
+    
+    @action(detail=True, methods=['get'])
+    def related(self, request, slug=None):
+        """Precomputed related products (manage.py build_related_products)"""
+        visible = Product.objects.all() if request.user.is_staff else Product.objects.published()
+        # One query: the product's visibility and its packed neighbour list
+        row = visible.filter(slug=slug).values_list('related_list__neighbors').first()
+        if row is None:
+            raise NotFound()
+        ids = RelatedProducts.unpack(row[0]) if row[0] is not None else []
+        payloads = product_cache.get_or_build(ids, self._build_payloads)
+        return Response(self._priced([
+            payloads[pk] for pk in ids
+            if pk in payloads and (request.user.is_staff or payloads[pk]['status'] == 'published')
+        ]))
+    
+    @action(detail=False, methods=['get'], permission_classes=[AllowAny])
+    def autocomplete(self, request):
+        """
+        Suggestions while typing: ?q=<text>&limit=8. Published products whose
+        name, SKU or category words start with the typed words, allowing a
+        typo, most popular first. Served from memory (products/autocomplete.py).
+        """
+        query = request.query_params.get('q', '')[:100]
+        try:
+            limit = int(request.query_params.get('limit', product_autocomplete.DEFAULT_LIMIT))
+        except ValueError:
+            raise ValidationError({'limit': ['A valid integer is required.']})
+        limit = max(1, min(limit, product_autocomplete.TOP_K))
+        return Response({'query': query, 'results': product_autocomplete.suggest(query, limit)})
+    
+    @action(detail=False, methods=['get'], permission_classes=[IsAuthenticated])
+    def recently_viewed(self, request):
+        """Products the current user viewed, newest first"""
+        ids = tracking.recently_viewed(request.user)
+        payloads = product_cache.get_or_build(ids, self._build_payloads)
+        return Response(self._priced([
+            payloads[pk] for pk in ids
+            if pk in payloads and (request.user.is_staff or payloads[pk]['status'] == 'published')
+        ]))
+    
     @action(detail=False, methods=['get'])
     def featured(self, request):
         """Get featured products - Public access"""
@@ -82,7 +279,7 @@ class ProductViewSet(viewsets.ModelViewSet):
             featured=True
         )[:10]
         serializer = self.get_serializer(featured_products, many=True)
-        return Response(serializer.data)
+        return Response(self._priced(serializer.data))
     
     @action(detail=False, methods=['get'])
     def on_sale(self, request):
@@ -96,12 +293,14 @@ class ProductViewSet(viewsets.ModelViewSet):
             serializer = self.get_serializer(page, many=True)
             return self.get_paginated_response(serializer.data)
         serializer = self.get_serializer(on_sale_products, many=True)
-        return Response(serializer.data)
+        return Response(self._priced(serializer.data))
 
-class ProductReviewViewSet(viewsets.ModelViewSet):
+class ProductReviewViewSet(ReplicaReadMixin, viewsets.ModelViewSet):
     """
     Product Review API - Authenticated users can create, admins can manage
     """
+    replica_actions = ('list',)
+    throttle_scopes = {'list': 'list', 'retrieve': 'detail', 'create': 'review_create'}
     # ADD THIS LINE - Required for DRF router to work
     queryset = ProductReview.objects.all()
     
@@ -123,10 +322,13 @@ class ProductReviewViewSet(viewsets.ModelViewSet):
         return [permission() for permission in permission_classes]
     
     def get_queryset(self):
+        if getattr(self, 'swagger_fake_view', False):
+            # Schema generation has no product in the URL
+            return ProductReview.objects.none()
         return ProductReview.objects.filter(
             product__slug=self.kwargs['product_slug'],
             is_approved=True  # Only show approved reviews to public
-        )
+        ).select_related('user').order_by('-created_at')
     
     def perform_create(self, serializer):
         # Get the product from the URL slug
@@ -140,4 +342,110 @@ class ProductReviewViewSet(viewsets.ModelViewSet):
     
     def perform_destroy(self, instance):
         # Only admins can delete
-        instance.delete()
\ No newline at end of file
+        instance.delete()
+
+
+class _FeedContentNegotiation(BaseContentNegotiation):
+    """Feed clients send Accept: text/csv and the like; errors are always JSON"""
+    
+    def select_parser(self, request, parsers):
+        return parsers[0] if parsers else None
+    
+    def select_renderer(self, request, renderers, format_suffix=None):
+        return renderers[0], renderers[0].media_type
+
+
+class ProductFeedView(APIView):
+    """
+    The catalog as one streamed JSON lines, CSV or RSS feed. ?since=<ISO
+    timestamp> returns only products updated after it, with unpublished
+    ones as id/sku/status tombstones; pass the previous response's
+    X-Feed-Generated-At to fetch the next delta.
+    """
+    permission_classes = [AllowAny]
+    throttle_scope = 'feed'
+    renderer_classes = [JSONRenderer]
+    content_negotiation_class = _FeedContentNegotiation
+    
+    def get(self, request, fmt):
+        since = request.query_params.get('since')
+        if since:
+            since = parse_datetime(since)
+            if since is None:
+                return Response({'detail': 'since must be an ISO 8601 timestamp.'},
+                                status=status.HTTP_400_BAD_REQUEST)
+            if timezone.is_naive(since):
+                since = timezone.make_aware(since)
+        # Taken before reading, so a product changing mid-stream is sent again next time
+        generated_at = timezone.now()
+        base_url = request.build_absolute_uri('/').rstrip('/')
+        response = StreamingHttpResponse(render_feed(fmt, since, base_url),
+                                         content_type=CONTENT_TYPES[fmt])
+        response['X-Feed-Generated-At'] = generated_at.isoformat()
+        return response
+
+
+@api_view(['GET'])
+@permission_classes([IsAdminUser])
+def change_feed(request):
+    """
+    Catalog change log after a cursor: ?after=<seq>&limit=500&models=product,category.
+    Keep the returned cursor and pass it as `after` next time.
+    """
+    try:
+        cursor = int(request.query_params.get('after', 0))
+        limit = int(request.query_params.get('limit', 500))
+    except ValueError:
+        return Response({'detail': 'after and limit must be integers.'},
+                        status=status.HTTP_400_BAD_REQUEST)
+    if not 1 <= limit <= 5000:
+        return Response({'detail': 'limit must be between 1 and 5000.'},
+                        status=status.HTTP_400_BAD_REQUEST)
+    model_names = [m for m in request.query_params.get('models', '').split(',') if m]
+    changes, next_cursor = changes_after(cursor, limit, model_names)
+    return Response({
+        'changes': changes,
+        'cursor': next_cursor,
+        'has_more': len(changes) == limit,
+    })
+
+
+class LowStockView(ReplicaReadMixin, ListAPIView):
+    """
+    Products at or below an alert level, emptiest first: ?level=0 for the
+    sold out ones. Reads the low-stock table, not the catalog.
+    """
+    serializer_class = LowStockProductSerializer
+    permission_classes = [IsAdminUser]
+    pagination_class = StandardResultsSetPagination
+    
+    def get_queryset(self):
+        queryset = LowStockProduct.objects.select_related('product').only(
+            'quantity', 'level', 'since', 'product__name', 'product__slug', 'product__sku')
+        level = self.request.query_params.get('level')
+        if level is not None:
+            try:
+                queryset = queryset.filter(level=int(level))
+            except ValueError:
+                raise ValidationError({'level': ['Must be an integer.']})
+        return queryset
+
+
+@api_view(['GET'])
+@permission_classes([IsAdminUser])
+@renderer_classes([*api_settings.DEFAULT_RENDERER_CLASSES, stock.EventStreamRenderer])
+def stock_events(request):
+    """
+    Stock level events as server-sent events. Resumes after the
+    Last-Event-ID header (sent by EventSource on reconnect) or ?after=<id>.
+    """
+    after = request.headers.get('Last-Event-ID') or request.query_params.get('after', 0)
+    try:
+        after = int(after)
+    except ValueError:
+        return Response({'detail': 'after must be an integer.'}, status=status.HTTP_400_BAD_REQUEST)
+    response = StreamingHttpResponse(stock.event_stream(after), content_type='text/event-stream')
+    response['Cache-Control'] = 'no-cache'
+    # Don't let nginx buffer the stream
+    response['X-Accel-Buffering'] = 'no'
+    return response
@@ -0,0 +1,51 @@
+from django.utils.translation import gettext_lazy as _
+from rest_framework_simplejwt.authentication import JWTAuthentication
+from rest_framework_simplejwt.exceptions import AuthenticationFailed, InvalidToken
+from rest_framework_simplejwt.settings import api_settings
+
+from ecommerce.cache import TieredCache
+
+users = TieredCache('users', timeout=15 * 60)
+
+# The password hash stays out of the cache; it loads on demand if needed
+CACHED_FIELDS = ('id', 'email', 'first_name', 'last_name', 'is_active',
+                 'is_staff', 'is_superuser', 'last_login', 'date_joined')
+
+
+def user_key(user_id):
+    return f'auth:{user_id}'
+
+
+def invalidate_user(user_id):
+    users.delete(user_key(user_id))
+
+
+class CachedJWTAuthentication(JWTAuthentication):
+    """
+    JWTAuthentication that caches the user row behind each token, so an
+    authenticated request does not cost a users query. Entries are dropped
+    by the users signals whenever the user is saved or deleted.
+    """
+
+    def get_user(self, validated_token):
+        if api_settings.CHECK_REVOKE_TOKEN or api_settings.USER_ID_FIELD != 'id':
+            return super().get_user(validated_token)
+        try:
+            user_id = validated_token[api_settings.USER_ID_CLAIM]
+        except KeyError:
+            raise InvalidToken(_("Token contained no recognizable user identification"))
+
+        def load():
+            row = self.user_model.objects.filter(id=user_id).values(*CACHED_FIELDS).first()
+            # Unknown ids are cached too (as {}), so a stale token can't hammer the DB
+            return row or {}
+
+        row = users.get_or_set(user_key(user_id), load)
+        if not row:
+            raise AuthenticationFailed(_("User not found"), code="user_not_found")
+        # from_db wants the loaded values in concrete field order
+        names = [f.attname for f in self.user_model._meta.concrete_fields if f.attname in row]
+        user = self.user_model.from_db('default', names, [row[name] for name in names])
+        if not user.is_active:
+            raise AuthenticationFailed(_("User is inactive"), code="user_inactive")
+        return user
@@ -1,6 +1,8 @@
 from rest_framework import serializers
 from rest_framework_simplejwt.serializers import TokenObtainPairSerializer
+from rest_framework_simplejwt.settings import api_settings as jwt_settings
 from django.contrib.auth import authenticate
+from django.contrib.auth.models import update_last_login
 from .models import User
 
 class UserSerializer(serializers.ModelSerializer):
@@ -66,9 +68,17 @@ class LoginSerializer(TokenObtainPairSerializer):
         else:
             raise serializers.ValidationError('Must include "email" and "password".')
         
-        data = super().validate(attrs)
-        data['user'] = UserSerializer(self.user).data
-        return data
+        # Issue the tokens for the user authenticated above; the parent's
+        # validate() would authenticate (and hash the password) again
+        self.user = user
+        refresh = self.get_token(user)
+        if jwt_settings.UPDATE_LAST_LOGIN:
+            update_last_login(None, user)
+        return {
+            'refresh': str(refresh),
+            'access': str(refresh.access_token),
+            'user': UserSerializer(user).data,
+        }
     
     @classmethod
     def get_token(cls, user):
@@ -0,0 +1,11 @@
+from django.conf import settings
+from django.db.models.signals import post_delete, post_save
+from django.dispatch import receiver
+
+
+@receiver([post_save, post_delete], sender=settings.AUTH_USER_MODEL)
+def drop_cached_user(sender, instance, **kwargs):
+    # Imported here: simplejwt (and pkg_resources under it) would otherwise
+    # load in every process at startup, not only those serving API requests
+    from .authentication import invalidate_user
+    invalidate_user(instance.pk)
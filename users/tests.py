@@ -1,3 +1,94 @@
-from django.test import TestCase
+from pathlib import Path
+
+from django.conf import settings
+from django.core.cache import cache
+from django.test import override_settings
+
+from ecommerce import cache as tiered_cache
+from ecommerce import throttling
+from ecommerce.testing import QueryPlanTestCase
+
+from .models import User
+
+TEST_SETTINGS = {
+    'CACHES': {'default': {'BACKEND': 'django.core.cache.backends.locmem.LocMemCache'}},
+    'PASSWORD_HASHERS': ['django.contrib.auth.hashers.MD5PasswordHasher'],
+}
+
+
+@override_settings(**TEST_SETTINGS)
+class AuthEndpointQueryTests(QueryPlanTestCase):
+    """Query budgets and plans of the auth endpoints, JWT authentication included"""
+    snapshot_path = Path(__file__).parent / 'snapshots' / 'query_plans.txt'
+    scan_guarded = ('users_user',)
+
+    @classmethod
+    def setUpTestData(cls):
+        User.objects.bulk_create([
+            User(email=f'user{i}@example.com', first_name='Test', last_name=str(i))
+            for i in range(50)
+        ])
+        cls.user = User.objects.create_user(
+            email='john.doe@example.com', password='securepass123', first_name='John', last_name='Doe')
+        cls.admin = User.objects.create_superuser(
+            email='admin@example.com', password='adminpass123', first_name='Ad', last_name='Min')
+
+    def setUp(self):
+        cache.clear()
+        tiered_cache._local.clear()
+        throttling._buckets.clear()
+
+    def login(self, email, password):
+        response = self.client.post('/api/auth/login/', {'email': email, 'password': password})
+        self.client.credentials(HTTP_AUTHORIZATION=f"Bearer {response.data['access']}")
+        return response
+
+    def test_register(self):
+        self.assertQueries('register', 2, 'post', '/api/auth/register/', {
+            'email': 'new@example.com', 'password': 'securepass123',
+            'first_name': 'New', 'last_name': 'User',
+        }, status=201)
+
+    def test_login(self):
+        self.assertQueries('login', 1, 'post', '/api/auth/login/',
+                           {'email': 'john.doe@example.com', 'password': 'securepass123'})
+
+    def test_refresh(self):
+        refresh = self.login('john.doe@example.com', 'securepass123').data['refresh']
+        self.assertQueries('refresh', 0, 'post', '/api/auth/refresh/', {'refresh': refresh})
+
+    def test_profile_cold_then_warm(self):
+        self.login('john.doe@example.com', 'securepass123')
+        cache.clear()
+        tiered_cache._local.clear()
+        self.assertQueries('profile cold', 1, 'get', '/api/auth/profile/')
+        # The authenticated user comes from the JWT user cache
+        self.assertQueries('profile warm', 0, 'get', '/api/auth/profile/')
+
+    def test_profile_update(self):
+        self.login('john.doe@example.com', 'securepass123')
+        self.assertQueries('profile update', 2, 'patch', '/api/auth/profile/', {'first_name': 'Johnny'})
+
+    def test_admin_register(self):
+        self.login('admin@example.com', 'adminpass123')
+        self.assertQueries('admin register', 3, 'post', '/api/auth/admin/register/', {
+            'email': 'staff@example.com', 'password': 'staffpass123',
+            'first_name': 'Staff', 'last_name': 'Member', 'is_staff': True,
+        }, status=201)
+
+    def test_profile_anonymous(self):
+        self.assertQueries('profile anonymous', 0, 'get', '/api/auth/profile/', status=401)
+
+    @override_settings(REST_FRAMEWORK={**settings.REST_FRAMEWORK,
+                                       'DEFAULT_THROTTLE_RATES': {'auth': '3/min'}})
+    def test_login_throttled(self):
+        statuses = [
+            self.client.post('/api/auth/login/', {'email': 'john.doe@example.com',
+                                                  'password': 'wrong'}).status_code
+            for _ in range(4)
+        ]
+        self.assertEqual(statuses, [400, 400, 400, 429])
+        # Refused before authenticating: no password check, no queries
+        self.assertQueries('login throttled', 0, 'post', '/api/auth/login/',
+                           {'email': 'john.doe@example.com', 'password': 'securepass123'}, status=429)
 
-# Create your tests here.
@@ -1,12 +1,11 @@
 from django.urls import path
-from rest_framework_simplejwt.views import TokenRefreshView
-from .views import RegisterView, AdminRegisterView, LoginView, UserProfileView
+from .views import RegisterView, AdminRegisterView, LoginView, RefreshView, UserProfileView
 
 urlpatterns = [
     # Public endpoints
     path('register/', RegisterView.as_view(), name='register'),
     path('login/', LoginView.as_view(), name='login'),
-    path('refresh/', TokenRefreshView.as_view(), name='token_refresh'),
+    path('refresh/', RefreshView.as_view(), name='token_refresh'),
     
     # Protected endpoints
     path('profile/', UserProfileView.as_view(), name='profile'),
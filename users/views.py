@@ -1,7 +1,7 @@
 from django.shortcuts import render
 from rest_framework import generics, permissions, status
 from rest_framework.response import Response
-from rest_framework_simplejwt.views import TokenObtainPairView
+from rest_framework_simplejwt.views import TokenObtainPairView, TokenRefreshView
 from .serializers import RegisterSerializer, LoginSerializer, UserSerializer, AdminRegisterSerializer
 
 class RegisterView(generics.CreateAPIView):
@@ -10,6 +10,7 @@ class RegisterView(generics.CreateAPIView):
     """
     serializer_class = RegisterSerializer
     permission_classes = [permissions.AllowAny]
+    throttle_scope = 'auth'
 
     def create(self, request, *args, **kwargs):
         serializer = self.get_serializer(data=request.data)
@@ -35,6 +36,10 @@ class AdminRegisterView(generics.CreateAPIView):
 
 class LoginView(TokenObtainPairView):
     serializer_class = LoginSerializer
+    throttle_scope = 'auth'
+
+class RefreshView(TokenRefreshView):
+    throttle_scope = 'auth'
 
 class UserProfileView(generics.RetrieveUpdateAPIView):
     """
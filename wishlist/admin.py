@@ -0,0 +1,20 @@
+from django.contrib import admin
+from .models import Wishlist
+
+
+@admin.register(Wishlist)
+class WishlistAdmin(admin.ModelAdmin):
+    list_display = ['user', 'size', 'updated_at']
+    search_fields = ['user__email']
+    readonly_fields = ['user', 'product_ids', 'updated_at']
+    exclude = ['items']
+    
+    def size(self, obj):
+        return len(obj.items) // 8
+    
+    # Written by wishlist.store; admin edits would be overwritten by the next flush
+    def has_add_permission(self, request):
+        return False
+    
+    def has_change_permission(self, request, obj=None):
+        return False
@@ -0,0 +1,33 @@
+from collections import Counter
+
+from django.core.management.base import BaseCommand
+from django.db import transaction
+from products.models import Product
+from wishlist import store
+from wishlist.models import Wishlist
+
+
+class Command(BaseCommand):
+    help = "Recount Product.wishlist_count from the stored wishlists"
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=2000,
+                            help='Wishlists read per query')
+
+    def handle(self, *args, **options):
+        # This process's buffered changes first, so the rows are current
+        store.flush()
+        counts = Counter()
+        for items in Wishlist.objects.values_list('items', flat=True).iterator(
+                chunk_size=options['batch_size']):
+            counts.update(Wishlist.unpack(items))
+
+        with transaction.atomic():
+            current = dict(Product.objects.filter(wishlist_count__gt=0)
+                           .values_list('id', 'wishlist_count'))
+            deltas = {pk: counts.get(pk, 0) - current.get(pk, 0) for pk in counts.keys() | current.keys()}
+            store.apply_deltas(deltas)
+        changed = sum(1 for delta in deltas.values() if delta)
+        self.stdout.write(self.style.SUCCESS(
+            f"{len(counts)} wishlisted products, {changed} counts corrected"
+        ))
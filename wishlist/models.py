@@ -0,0 +1,40 @@
+import sys
+from array import array
+
+from django.db import models
+from django.utils import timezone
+from users.models import User
+
+
+class Wishlist(models.Model):
+    """
+    A user's wishlisted product ids, oldest first, packed as little-endian
+    int64 (8 bytes per product). Written behind the cache by
+    wishlist.store, so a row can be a flush interval behind.
+    """
+    user = models.OneToOneField(User, on_delete=models.CASCADE,
+                                primary_key=True, related_name='wishlist')
+    items = models.BinaryField(default=b'')
+    updated_at = models.DateTimeField(default=timezone.now)
+    
+    def __str__(self):
+        return f"{self.user_id}: {len(self.items) // 8} products"
+    
+    @staticmethod
+    def pack(ids):
+        packed = array('q', ids)
+        if sys.byteorder == 'big':
+            packed.byteswap()
+        return packed.tobytes()
+    
+    @staticmethod
+    def unpack(blob):
+        ids = array('q')
+        ids.frombytes(bytes(blob))
+        if sys.byteorder == 'big':
+            ids.byteswap()
+        return ids.tolist()
+    
+    @property
+    def product_ids(self):
+        return self.unpack(self.items)
@@ -0,0 +1,19 @@
+from rest_framework import serializers
+from products.models import Product
+
+
+class WishlistProductSerializer(serializers.ModelSerializer):
+    """A wishlisted product: what a wishlist page shows, from the product row alone"""
+    is_in_stock = serializers.BooleanField(read_only=True)
+    
+    class Meta:
+        model = Product
+        fields = ['id', 'name', 'slug', 'price', 'compare_price', 'status', 'is_in_stock',
+                  'wishlist_count']
+
+
+class WishlistAddSerializer(serializers.Serializer):
+    product = serializers.PrimaryKeyRelatedField(
+        queryset=Product.objects.published().only('id'),
+        help_text='Id of a published product',
+    )
@@ -0,0 +1,187 @@
+"""
+Wishlists, cache-resident with write-behind persistence.
+
+A wishlist is the user's product ids packed into a bytes value (8 bytes
+per product), kept in the shared cache. Adding or removing a product
+rewrites that value and records the change in this process; the database
+is not touched. The first change buffered after a flush starts a timer,
+and WISHLIST_FLUSH_INTERVAL seconds after that flush a background thread
+flushes, whether or not more requests come. For the changes buffered
+since the last flush it
+
+* upserts the Wishlist rows of the users who changed, in one statement,
+* adds the per-product +1/-1 deltas to Product.wishlist_count with one
+  batched `UPDATE ... SET wishlist_count = CASE id WHEN ...` per chunk.
+
+A cache miss loads the user's row. Flushes write the cached value, which
+is the latest from any worker, and fall back to this process's copy if
+the cache dropped it meanwhile. Two workers changing one user's list in
+the same instant can lose one of the changes, as with any read-modify-
+write on the cache.
+"""
+import atexit
+import logging
+import threading
+import time
+from collections import Counter
+
+from django.conf import settings
+from django.db import DatabaseError, connections, transaction
+from django.db.models import Case, F, Value, When
+from django.db.models.functions import Greatest
+from django.utils import timezone
+
+from ecommerce.cache import TieredCache
+
+logger = logging.getLogger('ecommerce')
+
+FLUSH_INTERVAL = getattr(settings, 'WISHLIST_FLUSH_INTERVAL', 10)
+MAX_ITEMS = getattr(settings, 'WISHLIST_MAX_ITEMS', 500)
+FLUSH_CHUNK = 500
+
+# Read-modify-write from several workers, so skip the in-process tier.
+# Entries outlive the flush interval by far; a miss costs one row read
+wishlist_cache = TieredCache('wishlist', timeout=7 * 24 * 60 * 60, local_ttl=0)
+
+_lock = threading.Lock()
+_pending = {}        # user id -> packed ids written since the last flush
+_deltas = Counter()  # product id -> change in wishlist_count since the last flush
+_state = {'flushed_at': time.monotonic(), 'scheduled': False}
+
+
+def _key(user_id):
+    return f'user:{user_id}'
+
+
+def product_ids(user_id):
+    """The user's wishlisted product ids, oldest first"""
+    from .models import Wishlist
+
+    packed = wishlist_cache.get(_key(user_id))
+    if packed is None:
+        with _lock:
+            packed = _pending.get(user_id)
+        if packed is None:
+            packed = Wishlist.objects.filter(user_id=user_id).values_list('items', flat=True).first()
+            packed = bytes(packed) if packed is not None else b''
+        wishlist_cache.set(_key(user_id), packed)
+    return Wishlist.unpack(packed)
+
+
+def add(user_id, product_id):
+    """True if added, False if already there; ValueError when the list is full"""
+    ids = product_ids(user_id)
+    if product_id in ids:
+        return False
+    if len(ids) >= MAX_ITEMS:
+        raise ValueError(f'A wishlist holds at most {MAX_ITEMS} products.')
+    ids.append(product_id)
+    _write(user_id, ids, product_id, 1)
+    return True
+
+
+def remove(user_id, product_id):
+    """True if removed, False if it was not there"""
+    ids = product_ids(user_id)
+    if product_id not in ids:
+        return False
+    ids.remove(product_id)
+    _write(user_id, ids, product_id, -1)
+    return True
+
+
+def _write(user_id, ids, product_id, delta):
+    from .models import Wishlist
+
+    packed = Wishlist.pack(ids)
+    wishlist_cache.set(_key(user_id), packed)
+    with _lock:
+        _pending[user_id] = packed
+        _deltas[product_id] += delta
+    _schedule_flush()
+
+
+def _schedule_flush():
+    """Start the timer of the next flush, unless one is running or nothing is buffered"""
+    with _lock:
+        if _state['scheduled'] or not (_pending or _deltas):
+            return
+        _state['scheduled'] = True
+        delay = max(0.0, FLUSH_INTERVAL - (time.monotonic() - _state['flushed_at']))
+    timer = threading.Timer(delay, _flush_in_background)
+    timer.daemon = True
+    timer.start()
+
+
+def _flush_in_background():
+    try:
+        flush()
+    finally:
+        # This thread's DB connections would otherwise never be closed
+        connections.close_all()
+
+
+def flush():
+    """Persist the changes buffered in this process; returns the number of wishlists written"""
+    with _lock:
+        pending, deltas = dict(_pending), dict(_deltas)
+        _pending.clear()
+        _deltas.clear()
+        # Changes from here on wait for a timer of their own
+        _state['scheduled'] = False
+    failed = False
+    try:
+        with transaction.atomic(savepoint=False):
+            written = save_wishlists(pending)
+            apply_deltas(deltas)
+        return written
+    except DatabaseError:
+        # Keep the changes for the next attempt rather than losing them
+        logger.exception('Flushing wishlists failed')
+        failed = True
+        with _lock:
+            for user_id, packed in pending.items():
+                _pending.setdefault(user_id, packed)
+            _deltas.update(deltas)
+        return 0
+    finally:
+        with _lock:
+            _state['flushed_at'] = time.monotonic()
+        if failed:
+            # Retry after an interval even if no change comes to start a timer
+            _schedule_flush()
+
+
+# Don't drop the last interval's changes on a clean shutdown
+atexit.register(flush)
+
+
+def save_wishlists(pending):
+    """Upsert {user_id: packed ids}, preferring what the cache holds now"""
+    from .models import Wishlist
+
+    if not pending:
+        return 0
+    now = timezone.now()
+    cached = wishlist_cache.get_many([_key(user_id) for user_id in pending])
+    rows = [
+        Wishlist(user_id=user_id, items=cached.get(_key(user_id), packed), updated_at=now)
+        for user_id, packed in pending.items()
+    ]
+    Wishlist.objects.bulk_create(rows, batch_size=FLUSH_CHUNK, update_conflicts=True,
+                                 unique_fields=['user'], update_fields=['items', 'updated_at'])
+    return len(rows)
+
+
+def apply_deltas(deltas):
+    """Add {product_id: delta} to Product.wishlist_count in batched UPDATEs"""
+    from products.models import Product
+
+    ids = [pk for pk, delta in deltas.items() if delta]
+    for start in range(0, len(ids), FLUSH_CHUNK):
+        chunk = ids[start:start + FLUSH_CHUNK]
+        # wishlist_count is a tracking field: no change log entry, no cache invalidation
+        Product.objects.filter(id__in=chunk).update(wishlist_count=Case(*[
+            When(id=pk, then=Greatest(F('wishlist_count') + Value(deltas[pk]), Value(0)))
+            for pk in chunk
+        ]))
@@ -0,0 +1,149 @@
+from pathlib import Path
+from unittest import mock
+
+from django.core.cache import cache
+from django.db import DatabaseError, transaction
+from django.test import override_settings
+
+from ecommerce import cache as tiered_cache
+from ecommerce import throttling
+from ecommerce.testing import QueryPlanTestCase
+from products.models import Category, Product
+from users.models import User
+
+from . import store
+from .models import Wishlist
+
+TEST_SETTINGS = {
+    'CACHES': {'default': {'BACKEND': 'django.core.cache.backends.locmem.LocMemCache'}},
+    'PASSWORD_HASHERS': ['django.contrib.auth.hashers.MD5PasswordHasher'],
+}
+
+
+@override_settings(**TEST_SETTINGS)
+class WishlistTests(QueryPlanTestCase):
+    """Query budgets of the wishlist endpoints and write-behind persistence"""
+    snapshot_path = Path(__file__).parent / 'snapshots' / 'query_plans.txt'
+    scan_guarded = ('products_product', 'wishlist_wishlist')
+
+    @classmethod
+    def setUpTestData(cls):
+        category = Category.objects.create(name='Gifts')
+        cls.products = Product.objects.bulk_create([
+            Product(name=f'Gift {i}', slug=f'gift-{i}', description='x', price=10 + i,
+                    sku=f'GIFT-{i}', quantity=i % 3, category=category, status='published')
+            for i in range(30)
+        ])
+        cls.draft = Product.objects.create(name='Draft gift', description='x', price=5,
+                                           sku='GIFT-DRAFT', category=category)
+        cls.user = User.objects.create_user(email='user@example.com', password='x',
+                                            first_name='U', last_name='Ser')
+        cls.other = User.objects.create_user(email='other@example.com', password='x',
+                                             first_name='O', last_name='Ther')
+
+    def setUp(self):
+        cache.clear()
+        tiered_cache._local.clear()
+        throttling._buckets.clear()
+        # Flushes run when a test asks for them, not from a timer thread
+        patcher = mock.patch('wishlist.store.threading.Timer')
+        self.timer = patcher.start()
+        self.addCleanup(patcher.stop)
+        self.addCleanup(store._state.update, scheduled=False)
+        self.addCleanup(store._pending.clear)
+        self.addCleanup(store._deltas.clear)
+        self.client.force_authenticate(self.user)
+
+    def test_add(self):
+        product = self.products[0]
+        # The product check, and the stored wishlist on a cache miss
+        response = self.assertQueries('add', 2, 'post', '/api/wishlist/', {'product': product.id},
+                                      status=201)
+        self.assertTrue(response.data['added'])
+        response = self.assertQueries('add again', 1, 'post', '/api/wishlist/',
+                                      {'product': product.id})
+        self.assertFalse(response.data['added'])
+        self.assertEqual(store.product_ids(self.user.pk), [product.id])
+
+    def test_add_unpublished(self):
+        self.assertQueries('add draft', 1, 'post', '/api/wishlist/', {'product': self.draft.id},
+                           status=400)
+
+    def test_list(self):
+        for product in self.products[:25]:
+            store.add(self.user.pk, product.id)
+        response = self.assertQueries('list', 1, 'get', '/api/wishlist/')
+        self.assertEqual(response.data['count'], 25)
+        # Newest first
+        self.assertEqual([item['id'] for item in response.data['results']],
+                         [product.id for product in reversed(self.products[5:25])])
+        self.assertQueries('list page=2', 1, 'get', '/api/wishlist/?page=2')
+
+    def test_list_hides_unpublished(self):
+        store.add(self.user.pk, self.products[0].id)
+        Product.objects.filter(pk=self.products[0].pk).update(status='archived')
+        response = self.client.get('/api/wishlist/')
+        self.assertEqual(response.data['results'], [])
+
+    def test_ids(self):
+        store.add(self.user.pk, self.products[1].id)
+        store.add(self.user.pk, self.products[2].id)
+        response = self.assertQueries('ids', 0, 'get', '/api/wishlist/ids/')
+        self.assertEqual(response.data['ids'], [self.products[2].id, self.products[1].id])
+
+    def test_remove(self):
+        product = self.products[3]
+        store.add(self.user.pk, product.id)
+        self.assertQueries('remove', 0, 'delete', f'/api/wishlist/{product.id}/', status=204)
+        self.assertQueries('remove missing', 0, 'delete', f'/api/wishlist/{product.id}/', status=404)
+
+    def test_anonymous(self):
+        self.client.force_authenticate(None)
+        self.assertQueries('list anonymous', 0, 'get', '/api/wishlist/', status=401)
+
+    def test_flush(self):
+        first, second = self.products[0], self.products[1]
+        for user in (self.user, self.other):
+            store.add(user.pk, first.id)
+        store.add(self.user.pk, second.id)
+        with self.assertNumQueries(2):
+            # One upsert of both wishlists, one batched count update
+            self.assertEqual(store.flush(), 2)
+        self.assertEqual(Wishlist.objects.get(pk=self.user.pk).product_ids, [first.id, second.id])
+        self.assertEqual(Product.objects.get(pk=first.pk).wishlist_count, 2)
+
+        store.remove(self.other.pk, first.id)
+        store.flush()
+        self.assertEqual(Wishlist.objects.get(pk=self.other.pk).product_ids, [])
+        self.assertEqual(Product.objects.get(pk=first.pk).wishlist_count, 1)
+
+        # A cache miss reads the flushed row
+        cache.clear()
+        self.assertEqual(store.product_ids(self.user.pk), [first.id, second.id])
+
+    def test_flush_timer(self):
+        store.add(self.user.pk, self.products[0].id)
+        store.add(self.other.pk, self.products[0].id)
+        # One timer for everything buffered until the flush it starts
+        self.timer.assert_called_once()
+        delay, target = self.timer.call_args.args
+        self.assertLessEqual(delay, store.FLUSH_INTERVAL)
+        self.assertIs(target, store._flush_in_background)
+
+        store.flush()
+        self.timer.reset_mock()
+        store.remove(self.user.pk, self.products[0].id)
+        self.timer.assert_called_once()
+        self.assertAlmostEqual(self.timer.call_args.args[0], store.FLUSH_INTERVAL, delta=1)
+
+    def test_failed_flush_is_retried(self):
+        store.add(self.user.pk, self.products[0].id)
+        self.timer.reset_mock()
+        # In a savepoint of its own, as a failed flush rolls back its transaction
+        with mock.patch.object(store, 'save_wishlists', side_effect=DatabaseError('locked')), \
+                self.assertLogs('ecommerce', 'ERROR'), transaction.atomic():
+            self.assertEqual(store.flush(), 0)
+        # Kept, and a retry is scheduled without waiting for another change
+        self.timer.assert_called_once()
+        self.assertEqual(store.flush(), 1)
+        self.assertEqual(Wishlist.objects.get(pk=self.user.pk).product_ids, [self.products[0].id])
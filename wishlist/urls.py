@@ -0,0 +1,8 @@
+from django.urls import path
+from .views import WishlistIdsView, WishlistItemView, WishlistView
+
+urlpatterns = [
+    path('', WishlistView.as_view(), name='wishlist'),
+    path('ids/', WishlistIdsView.as_view(), name='wishlist-ids'),
+    path('<int:product_id>/', WishlistItemView.as_view(), name='wishlist-item'),
+]
@@ -0,0 +1,70 @@
+from rest_framework import status
+from rest_framework.exceptions import NotFound, ValidationError
+from rest_framework.permissions import IsAuthenticated
+from rest_framework.response import Response
+from rest_framework.views import APIView
+from products import currency
+from products.models import Product
+from products.pagination import StandardResultsSetPagination
+from . import store
+from .serializers import WishlistAddSerializer, WishlistProductSerializer
+
+# What WishlistProductSerializer reads, is_in_stock included
+PRODUCT_COLUMNS = ['name', 'slug', 'price', 'compare_price', 'status', 'quantity', 'wishlist_count']
+
+
+class WishlistScopeMixin:
+    permission_classes = [IsAuthenticated]
+    
+    def get_throttle_scope(self, request):
+        return 'list' if request.method == 'GET' else 'detail'
+
+
+class WishlistView(WishlistScopeMixin, APIView):
+    """
+    The current user's wishlist, newest first (GET, paginated; ?currency=
+    as on the product endpoints), and adding a product to it (POST).
+    """
+    
+    def get(self, request):
+        rate = currency.requested(request)
+        ids = store.product_ids(request.user.pk)[::-1]
+        paginator = StandardResultsSetPagination()
+        page = paginator.paginate_queryset(ids, request, view=self)
+        # One primary key lookup for the whole page; filtering on status in
+        # SQL would make SQLite walk the status index instead
+        products = Product.objects.order_by().only(*PRODUCT_COLUMNS).in_bulk(page)
+        data = WishlistProductSerializer([
+            products[pk] for pk in page
+            if pk in products and (request.user.is_staff or products[pk].status == 'published')
+        ], many=True).data
+        if rate is not None:
+            data = currency.convert_payloads(data, rate)
+        return paginator.get_paginated_response(data)
+    
+    def post(self, request):
+        serializer = WishlistAddSerializer(data=request.data)
+        serializer.is_valid(raise_exception=True)
+        product_id = serializer.validated_data['product'].pk
+        try:
+            added = store.add(request.user.pk, product_id)
+        except ValueError as error:
+            raise ValidationError({'product': [str(error)]})
+        return Response({'product': product_id, 'added': added},
+                        status=status.HTTP_201_CREATED if added else status.HTTP_200_OK)
+
+
+class WishlistIdsView(WishlistScopeMixin, APIView):
+    """Ids of the wishlisted products, newest first, e.g. to mark them in listings"""
+    
+    def get(self, request):
+        return Response({'ids': store.product_ids(request.user.pk)[::-1]})
+
+
+class WishlistItemView(WishlistScopeMixin, APIView):
+    """Removing a product from the current user's wishlist"""
+    
+    def delete(self, request, product_id):
+        if not store.remove(request.user.pk, product_id):
+            raise NotFound()
+        return Response(status=status.HTTP_204_NO_CONTENT)